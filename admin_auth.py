@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+حماية مسارات الإدارة والمراقبة (/admin/query-profile و /metrics) برمز مشترك
+
+    ADMIN_TOKEN   الرمز المطلوب في الترويسة Authorization: Bearer <الرمز>
+
+الرمز لا يُقبل في الرابط (يظهر في سجل الوصول وسجل المتصفح و Referer). صفحات المتصفح
+تُفتح بعد إدخال الرمز مرة واحدة في /admin/login (في جسم طلب POST) فتُعلَّم الجلسة.
+
+بدون ADMIN_TOKEN لا تُسجل صفحات الإدارة أصلاً، ويبقى /metrics مفتوحاً فيجب أن
+يكون الخادم خلف شبكة خاصة لا يصلها إلا Prometheus.
+"""
+
+import hashlib
+import hmac
+import os
+from functools import wraps
+
+from flask import Response, redirect, request, session, url_for
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# مفتاح علامة الجلسة - قيمتها مشتقة من الرمز فلا تكفي معرفة SECRET_KEY لتزويرها
+SESSION_KEY = 'admin_auth'
+
+_LOGIN_PAGE = '''<!DOCTYPE html>
+<html dir="rtl" lang="ar">
+<head><meta charset="UTF-8"><title>دخول الإدارة</title></head>
+<body>
+    <h1>دخول الإدارة</h1>
+    {error}
+    <form method="post">
+        <input type="password" name="token" placeholder="ADMIN_TOKEN" autocomplete="off" required>
+        <button type="submit">دخول</button>
+    </form>
+</body>
+</html>
+'''
+
+
+def is_configured():
+    return bool(ADMIN_TOKEN)
+
+
+def request_token():
+    """الرمز المرسل في الترويسة Authorization: Bearer"""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):].strip()
+    return ''
+
+
+def _matches(token):
+    return is_configured() and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def _session_marker():
+    return hmac.new(ADMIN_TOKEN.encode(), b'admin-session', hashlib.sha256).hexdigest()
+
+
+def is_authorized():
+    if _matches(request_token()):
+        return True
+    marker = session.get(SESSION_KEY)
+    return bool(marker) and is_configured() and hmac.compare_digest(marker, _session_marker())
+
+
+def token_required(view):
+    """رفض الطلب بـ 401 ما لم يحمل ADMIN_TOKEN أو جلسة إدارة (ومع عدم ضبطه يُرفض كل طلب)"""
+    @wraps(view)
+    def guarded(*args, **kwargs):
+        if not is_authorized():
+            return Response('غير مصرح: مطلوب ADMIN_TOKEN (الترويسة Authorization أو /admin/login)\n',
+                            status=401, mimetype='text/plain; charset=utf-8',
+                            headers={'WWW-Authenticate': 'Bearer'})
+        return view(*args, **kwargs)
+    return guarded
+
+
+def _safe_next(target):
+    """مسار داخلي فقط بعد الدخول (لا روابط لمواقع أخرى)"""
+    if target and target.startswith('/') and not target.startswith('//'):
+        return target
+    return url_for('query_profile')
+
+
+def _login():
+    if request.method == 'POST':
+        if _matches(request.form.get('token', '')):
+            session[SESSION_KEY] = _session_marker()
+            return redirect(_safe_next(request.args.get('next')))
+        return Response(_LOGIN_PAGE.format(error='<p>الرمز غير صحيح</p>'), status=401,
+                        mimetype='text/html; charset=utf-8')
+    return Response(_LOGIN_PAGE.format(error=''), mimetype='text/html; charset=utf-8')
+
+
+def _logout():
+    session.pop(SESSION_KEY, None)
+    return redirect(url_for('admin_login'))
+
+
+def init_app(app):
+    """صفحة الدخول /admin/login والخروج /admin/logout (مع ADMIN_TOKEN فقط)"""
+    if is_configured():
+        app.add_url_rule('/admin/login', 'admin_login', _login, methods=['GET', 'POST'])
+        app.add_url_rule('/admin/logout', 'admin_logout', _logout, methods=['POST'])
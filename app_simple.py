@@ -1,55 +1,70 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, send_file
 from datetime import datetime, date, timedelta
 import os
 import json
-import csv
-import io
-from database_helper import get_db_connection, init_database
+from database_helper import (get_db_connection, get_read_connection, init_database, check_schema_version,
+                             report_database_settings, statement_cache_stats, init_app as init_db_pool)
+from stats_service import get_breakdown, get_headline_stats, invalidate_stats
+from pagination import paginate_request, page_as_json
+from repositories import (StudentRepository, HalaqaRepository, TeacherRepository,
+                          DonationRepository, CampaignRepository, AttendanceRepository)
+import attendance_analytics
+import report_builder
+import bulk_import
+import jobs
+import pdf_renderer
+import metrics
+import admin_auth
+import query_profiler
 
 # إعداد Flask
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'halaqat_secret_key_2024')
 
+# اتصال واحد من المجمع لكل طلب يُعاد تلقائياً عند نهاية الطلب
+init_db_pool(app)
+
+# زمن كل مسار وعدد عبارات SQL والصفوف لكل طلب - تُعرض على /metrics
+metrics.init_app(app)
+
+# دخول صفحات الإدارة بـ ADMIN_TOKEN مرة واحدة لكل جلسة (/admin/login)
+admin_auth.init_app(app)
+
+# محلل الاستعلامات الاختياري على /admin/query-profile (QUERY_PROFILING=1 للتفعيل عند التشغيل)
+query_profiler.init_app(app)
+
 def init_db():
     """تهيئة قاعدة البيانات حسب البيئة"""
     init_database()
 
+def prepare_app():
+    """فحوص بدء التشغيل وإعادة التطبيق المشترك app للتشغيل عبر خادم WSGI (wsgi.py) أو خادم التطوير
+    
+    ليست مصنعاً: كل استدعاء يعيد نفس كائن app المعرف في هذه الوحدة.
+    """
+    # فحص سريع لإصدار المخطط فقط - الترحيلات تُشغّل مرة واحدة عبر: python database_helper.py migrate
+    check_schema_version()
+    report_database_settings()
+    return app
+
 @app.route('/')
 def dashboard():
     """الصفحة الرئيسية - لوحة التحكم"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # إحصائيات أساسية آمنة
-        stats = {}
-        
-        # عدد الطلاب
-        cursor.execute('SELECT COUNT(*) FROM students')
-        result = cursor.fetchone()
-        stats['total_students'] = result[0] if result else 0
+        conn = get_read_connection()
         
-        # عدد الحلقات
-        cursor.execute('SELECT COUNT(*) FROM halaqat')
-        result = cursor.fetchone()
-        stats['total_halaqat'] = result[0] if result else 0
+        # إحصائيات أساسية (استعلام واحد مع ذاكرة مؤقتة)
+        stats = get_headline_stats(conn)
         
-        # عدد المعلمين
-        cursor.execute('SELECT COUNT(*) FROM teachers')
-        result = cursor.fetchone()
-        stats['total_teachers'] = result[0] if result else 0
-        
-        # إجمالي التبرعات
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM donations')
-        result = cursor.fetchone()
-        stats['total_donations'] = result[0] if result else 0
+        # حضور اليوم الفعلي (الحاضر والمتأخر)
+        today = date.today()
+        stats['today_attendance'] = attendance_analytics.period_summary(conn, today, today)['count']
         
         # آخر الطلاب
-        cursor.execute('SELECT * FROM students ORDER BY id DESC LIMIT 5')
-        recent_students = cursor.fetchall()
+        recent_students = StudentRepository(conn).recent(5)
         
         conn.close()
         
@@ -79,45 +94,28 @@ def dashboard():
 def students_list():
     """قائمة الطلاب"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT s.*, h.name as halaqa_name 
-            FROM students s 
-            LEFT JOIN halaqat h ON s.halaqa_id = h.id 
-            ORDER BY s.name
-        ''')
-        students = cursor.fetchall()
+        conn = get_read_connection()
         
-        cursor.execute('SELECT id, name FROM halaqat ORDER BY name')
-        halaqat = cursor.fetchall()
+        page = paginate_request(conn, StudentRepository.PAGE)
+        halaqat = HalaqaRepository(conn).options()
         
         conn.close()
         
         return render_template('students.html', 
-                             students=students, 
-                             halaqat=halaqat)
+                             students=page['items'], 
+                             halaqat=halaqat,
+                             pagination=page)
         
     except Exception as e:
         flash(f'خطأ في تحميل قائمة الطلاب: {e}', 'error')
-        return render_template('students.html', students=[], halaqat=[])
+        return render_template('students.html', students=[], halaqat=[], pagination=None)
 
 @app.route('/halaqat')
 def halaqat_list():
     """قائمة الحلقات"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT h.*, COUNT(s.id) as student_count
-            FROM halaqat h
-            LEFT JOIN students s ON h.id = s.halaqa_id
-            GROUP BY h.id
-            ORDER BY h.name
-        ''')
-        halaqat = cursor.fetchall()
+        conn = get_read_connection()
+        halaqat = HalaqaRepository(conn).with_student_counts()
         
         conn.close()
         
@@ -131,41 +129,22 @@ def halaqat_list():
 def attendance():
     """صفحة الحضور"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_read_connection()
         
         today = date.today().isoformat()
         selected_date = request.args.get('date', today)
         
-        # جلب الحلقات
-        cursor.execute('SELECT id, name FROM halaqat ORDER BY name')
-        halaqat = cursor.fetchall()
-        
-        # جلب الطلاب
-        cursor.execute('''
-            SELECT s.id, s.name, s.halaqa_id, h.name as halaqa_name
-            FROM students s
-            LEFT JOIN halaqat h ON s.halaqa_id = h.id
-            ORDER BY h.name, s.name
-        ''')
-        students = cursor.fetchall()
+        # جلب الحلقات والطلاب
+        halaqat = HalaqaRepository(conn).options()
+        students = StudentRepository(conn).roster()
         
         # حساب إحصائيات الحضور
-        cursor.execute('SELECT COUNT(*) FROM students')
-        total_students = cursor.fetchone()[0] or 0
-        
-        # حساب الحضور لليوم المحدد
-        cursor.execute('''
-            SELECT COUNT(*) FROM attendance 
-            WHERE date = ? AND status = 'حاضر'
-        ''', (selected_date,))
-        present_today = cursor.fetchone()[0] or 0
-        
-        cursor.execute('''
-            SELECT COUNT(*) FROM attendance 
-            WHERE date = ? AND status IN ('غائب', 'متأخر')
-        ''', (selected_date,))
-        absent_today = cursor.fetchone()[0] or 0
+        total_students = get_headline_stats(conn)['total_students']
+        
+        # حساب الحضور لليوم المحدد من ملخص الحضور اليومي
+        day_summary = attendance_analytics.period_summary(conn, selected_date, selected_date)
+        present_today = day_summary['present']
+        absent_today = day_summary['absent'] + day_summary['late']
         
         # إذا لم يكن هناك حضور مسجل لهذا اليوم، اعتبر جميع الطلاب غائبين
         if present_today + absent_today == 0:
@@ -197,41 +176,21 @@ def attendance():
 def teachers_list():
     """قائمة المعلمين"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT t.*, 
-                   COUNT(DISTINCT h.id) as halaqat_count,
-                   COUNT(DISTINCT s.id) as total_students
-            FROM teachers t
-            LEFT JOIN halaqat h ON t.id = h.teacher_id OR t.name = h.teacher_name
-            LEFT JOIN students s ON h.id = s.halaqa_id
-            GROUP BY t.id
-            ORDER BY t.name
-        ''')
-        teachers = cursor.fetchall()
-        
-        # حساب الإحصائيات
-        cursor.execute('SELECT COUNT(*) FROM teachers')
-        total_teachers = cursor.fetchone()[0] or 0
+        conn = get_read_connection()
         
-        cursor.execute("SELECT COUNT(*) FROM teachers WHERE status = 'نشط'")
-        active_teachers = cursor.fetchone()[0] or 0
+        page = paginate_request(conn, TeacherRepository.PAGE)
         
-        cursor.execute("SELECT COUNT(*) FROM teachers WHERE gender = 'ذكر'")
-        male_teachers = cursor.fetchone()[0] or 0
-        
-        cursor.execute("SELECT COUNT(*) FROM teachers WHERE gender = 'أنثى'")
-        female_teachers = cursor.fetchone()[0] or 0
+        # الإجمالي والنشطين والذكور والإناث من مسح واحد (مخزن مؤقتاً)
+        counts = get_breakdown('teachers', conn)
         
         conn.close()
         return render_template('teachers.html', 
-                             teachers=teachers,
-                             total_teachers=total_teachers,
-                             active_teachers=active_teachers,
-                             male_teachers=male_teachers,
-                             female_teachers=female_teachers)
+                             teachers=page['items'],
+                             total_teachers=counts['total'],
+                             active_teachers=counts['active'],
+                             male_teachers=counts['male'],
+                             female_teachers=counts['female'],
+                             pagination=page)
         
     except Exception as e:
         flash(f'خطأ في تحميل قائمة المعلمين: {e}', 'error')
@@ -240,22 +199,22 @@ def teachers_list():
                              total_teachers=0,
                              active_teachers=0,
                              male_teachers=0,
-                             female_teachers=0)
+                             female_teachers=0,
+                             pagination=None)
 
 @app.route('/donations')
 def donations_list():
     """قائمة التبرعات"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_read_connection()
         
-        # جلب التبرعات
-        cursor.execute('SELECT * FROM donations ORDER BY id DESC LIMIT 100')
-        donations = cursor.fetchall()
+        # جلب التبرعات (صفحة واحدة)
+        page = paginate_request(conn, DonationRepository.PAGE)
         
-        # حساب إجمالي التبرعات
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM donations')
-        total_donations = cursor.fetchone()[0] or 0
+        # حساب إجمالي التبرعات وعددها
+        totals = get_breakdown('donations', conn)
+        total_donations = totals['total']
+        donations_count = totals['count']
         
         # حساب التبرعات المخصصة (قيمة تقديرية 70% من الإجمالي)
         allocated_donations = total_donations * 0.7
@@ -263,18 +222,15 @@ def donations_list():
         # حساب المتبقي للتوزيع
         remaining = total_donations - allocated_donations
         
-        # إحصائيات إضافية
-        cursor.execute('SELECT COUNT(*) FROM donations')
-        donations_count = cursor.fetchone()[0] or 0
-        
         conn.close()
         
         return render_template('donations.html', 
-                             donations=donations,
+                             donations=page['items'],
                              total_donations=total_donations,
                              allocated_donations=allocated_donations,
                              remaining=remaining,
-                             donations_count=donations_count)
+                             donations_count=donations_count,
+                             pagination=page)
         
     except Exception as e:
         flash(f'خطأ في تحميل قائمة التبرعات: {e}', 'error')
@@ -283,39 +239,29 @@ def donations_list():
                              total_donations=0,
                              allocated_donations=0,
                              remaining=0,
-                             donations_count=0)
+                             donations_count=0,
+                             pagination=None)
 
 @app.route('/fundraising')
 def fundraising_campaigns():
     """صفحة حملات جمع التبرعات"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_read_connection()
         
-        # الحصول على جميع حملات جمع التبرعات
-        cursor.execute('''
-            SELECT * FROM fundraising_campaigns 
-            ORDER BY created_date DESC
-        ''')
-        campaigns = cursor.fetchall()
+        # الحصول على صفحة من حملات جمع التبرعات
+        page = paginate_request(conn, CampaignRepository.PAGE)
         
         # إحصائيات سريعة
-        cursor.execute('SELECT COUNT(*) FROM fundraising_campaigns WHERE status = "نشط"')
-        active_campaigns = cursor.fetchone()[0] or 0
-        
-        cursor.execute('SELECT SUM(target_amount) FROM fundraising_campaigns WHERE status != "مكتمل"')
-        total_target = cursor.fetchone()[0] or 0
-        
-        cursor.execute('SELECT SUM(current_amount) FROM fundraising_campaigns')
-        total_collected = cursor.fetchone()[0] or 0
+        totals = CampaignRepository(conn).totals()
         
         conn.close()
         
         return render_template('fundraising_campaigns.html',
-                             campaigns=campaigns,
-                             active_campaigns=active_campaigns,
-                             total_target=total_target,
-                             total_collected=total_collected)
+                             campaigns=page['items'],
+                             active_campaigns=totals['active'],
+                             total_target=totals['target'],
+                             total_collected=totals['collected'],
+                             pagination=page)
         
     except Exception as e:
         flash(f'خطأ في تحميل حملات جمع التبرعات: {e}', 'error')
@@ -323,7 +269,47 @@ def fundraising_campaigns():
                              campaigns=[],
                              active_campaigns=0,
                              total_target=0,
-                             total_collected=0)
+                             total_collected=0,
+                             pagination=None)
+
+# واجهات JSON للقوائم المرقمة: ?after=<مؤشر>&per_page=<عدد>
+def _json_page(keyset_query):
+    try:
+        conn = get_read_connection()
+        page = paginate_request(conn, keyset_query)
+        conn.close()
+        return jsonify(dict(page_as_json(page), success=True))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'خطأ في جلب البيانات: {str(e)}'})
+
+@app.route('/api/students')
+def api_students():
+    """قائمة الطلاب (JSON)"""
+    return _json_page(StudentRepository.PAGE)
+
+@app.route('/api/teachers')
+def api_teachers():
+    """قائمة المعلمين (JSON)"""
+    return _json_page(TeacherRepository.PAGE)
+
+@app.route('/api/donations')
+def api_donations():
+    """قائمة التبرعات (JSON)"""
+    return _json_page(DonationRepository.PAGE)
+
+@app.route('/api/campaigns')
+def api_campaigns():
+    """قائمة حملات جمع التبرعات (JSON)"""
+    return _json_page(CampaignRepository.PAGE)
+
+@app.route('/api/cache_stats')
+def api_cache_stats():
+    """عدادات الإصابة لذاكرة التقارير والعبارات المجهزة في هذه العملية (JSON)"""
+    return jsonify({
+        'success': True,
+        'reports': report_builder.report_cache_stats(),
+        'statements': statement_cache_stats(),
+    })
 
 @app.route('/fundraising/add', methods=['GET', 'POST'])
 def add_fundraising_campaign():
@@ -350,19 +336,9 @@ def add_fundraising_campaign():
             hashtags = generate_campaign_hashtags(campaign_name, campaign_description)
             
             conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO fundraising_campaigns 
-                (campaign_name, platform, target_amount, target_audience, 
-                 campaign_description, campaign_hashtags, start_date, end_date,
-                 ai_suggestions, best_posting_times)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (campaign_name, platform, target_amount, target_audience,
-                  campaign_description, hashtags, start_date, end_date,
-                  ai_suggestions, best_times))
-            
-            conn.commit()
+            CampaignRepository(conn).add(campaign_name, platform, target_amount, target_audience,
+                                         campaign_description, hashtags, start_date, end_date,
+                                         ai_suggestions, best_times)
             conn.close()
             
             flash('✅ تم إنشاء حملة جمع التبرعات بنجاح!', 'success')
@@ -504,40 +480,21 @@ def test_page():
 def reports():
     """صفحة التقارير"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_read_connection()
         
         # جمع الإحصائيات المطلوبة
-        stats = {}
-        
-        # عدد الطلاب الإجمالي
-        cursor.execute('SELECT COUNT(*) FROM students')
-        stats['total_students'] = cursor.fetchone()[0] or 0
+        stats = get_headline_stats(conn)
         
         # عدد الطلاب الذكور والإناث
-        cursor.execute("SELECT COUNT(*) FROM students WHERE gender = 'ذكر'")
-        stats['male_count'] = cursor.fetchone()[0] or 0
-        
-        cursor.execute("SELECT COUNT(*) FROM students WHERE gender = 'أنثى'")
-        stats['female_count'] = cursor.fetchone()[0] or 0
-        
-        # عدد الحلقات
-        cursor.execute('SELECT COUNT(*) FROM halaqat')
-        stats['total_halaqat'] = cursor.fetchone()[0] or 0
-        
-        # حضور اليوم (قيمة تقديرية)
-        stats['today_attendance'] = int(stats['total_students'] * 0.85)  # 85% معدل حضور افتراضي
+        genders = get_breakdown('students', conn)
+        stats['male_count'] = genders['male']
+        stats['female_count'] = genders['female']
         
-        # إجمالي التبرعات
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM donations')
-        stats['total_donations'] = cursor.fetchone()[0] or 0
-        
-        # إحصائيات إضافية
-        cursor.execute('SELECT COUNT(*) FROM teachers')
-        stats['total_teachers'] = cursor.fetchone()[0] or 0
-        
-        # معدلات الحضور الأسبوعية (قيم افتراضية للعرض)
-        stats['weekly_attendance'] = [85, 78, 82, 90, 88, 75, 80]  # آخر 7 أيام
+        # الحضور الفعلي لآخر 7 أيام (آخرها اليوم)
+        today = date.today()
+        stats['weekly_attendance'] = attendance_analytics.daily_attendance(
+            conn, today - timedelta(days=6), today)
+        stats['today_attendance'] = stats['weekly_attendance'][-1]['count']
         
         conn.close()
         
@@ -554,7 +511,7 @@ def reports():
             'today_attendance': 0,
             'total_donations': 0,
             'total_teachers': 0,
-            'weekly_attendance': [0, 0, 0, 0, 0, 0, 0]
+            'weekly_attendance': []
         }
         return render_template('reports.html', stats=stats)
 
@@ -562,26 +519,25 @@ def reports():
 def ai_reports():
     """صفحة التقارير الذكية"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_read_connection()
         
         # جلب قائمة الحلقات للفلتر
-        cursor.execute('SELECT id, name FROM halaqat ORDER BY name')
-        halaqat = cursor.fetchall()
+        halaqat = HalaqaRepository(conn).options()
         
         # بعض الإحصائيات الأساسية
-        cursor.execute('SELECT COUNT(*) FROM students')
-        total_students = cursor.fetchone()[0] or 0
+        headline = get_headline_stats(conn)
+        total_students = headline['total_students']
+        total_donations = headline['total_donations']
         
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM donations')
-        total_donations = cursor.fetchone()[0] or 0
+        # معدل الحضور الفعلي لآخر 30 يوماً
+        attendance_rate = attendance_analytics.period_summary(conn)['attendance_rate']
         
         conn.close()
         
         return render_template('ai_reports.html',
                              halaqat=halaqat,
                              total_students=total_students,
-                             attendance_rate=85,  # قيمة افتراضية
+                             attendance_rate=attendance_rate,
                              total_memorized=450,  # قيمة افتراضية
                              total_donations=total_donations)
         
@@ -598,22 +554,18 @@ def ai_reports():
 def ai_reports_enhanced():
     """صفحة التقارير الذكية المحسنة"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_read_connection()
         
         # جلب قائمة الحلقات للفلتر
-        cursor.execute('SELECT id, name FROM halaqat ORDER BY name')
-        halaqat = cursor.fetchall()
+        halaqat = HalaqaRepository(conn).options()
         
         # بعض الإحصائيات الأساسية
-        cursor.execute('SELECT COUNT(*) FROM students')
-        total_students = cursor.fetchone()[0] or 0
+        headline = get_headline_stats(conn)
+        total_students = headline['total_students']
+        total_donations = headline['total_donations']
         
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM donations')
-        total_donations = cursor.fetchone()[0] or 0
-        
-        # حساب معدل الحضور التقريبي
-        attendance_rate = 85  # قيمة افتراضية
+        # معدل الحضور الفعلي لآخر 30 يوماً
+        attendance_rate = attendance_analytics.period_summary(conn)['attendance_rate']
         total_memorized = total_students * 25  # تقدير: 25 صفحة لكل طالب
         
         conn.close()
@@ -639,6 +591,18 @@ def certificates():
     """صفحة الشهادات"""
     return render_template('certificates.html')
 
+@app.route('/certificates/generate', methods=['POST'])
+def generate_certificates():
+    """إصدار شهادات دفعة واحدة كمهمة خلفية (ملف ZIP)
+    
+    {"halaqa_id": <رقم>, "student_ids": [..], "certificate_type": "تقدير",
+     "issue_date": "YYYY-MM-DD", "merged": true}
+    بدون فلاتر تُصدر شهادة لكل الطلاب، ومع merged تُدمج الشهادات في ملفات متعددة
+    الصفحات بدلاً من ملف لكل طالب. التقدم والتنزيل عبر /jobs/<id>.
+    """
+    data = request.json or request.form.to_dict()
+    return submit_job_response('certificates', data)
+
 @app.route('/ai-insights')
 def ai_insights():
     """صفحة التحليلات الذكية"""
@@ -656,28 +620,25 @@ def add_student():
             gender = request.form.get('gender')
             phone = request.form.get('phone')
             email = request.form.get('email')
-            guardian_name = request.form.get('guardian_name')
-            guardian_phone = request.form.get('guardian_phone')
+            guardian_name = request.form.get('guardian_name', '')
+            # النماذج القديمة ترسل parent_phone و performance_level
+            guardian_phone = request.form.get('guardian_phone') or request.form.get('parent_phone', '')
             halaqa_id = request.form.get('halaqa_id')
-            memorization_level = request.form.get('memorization_level', 'مبتدئ')
+            memorization_level = (request.form.get('memorization_level')
+                                  or request.form.get('performance_level', 'مبتدئ'))
             
             conn = get_db_connection()
-            cursor = conn.cursor()
             
             # معالجة halaqa_id
             if halaqa_id and halaqa_id.strip():
                 halaqa_id = int(halaqa_id)
             else:
                 halaqa_id = None
-                
-            cursor.execute('''
-                INSERT INTO students (name, age, gender, phone, parent_phone, halaqa_id, 
-                                    performance_level, join_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, DATE('now'))
-            ''', (name, age, gender, phone, guardian_phone, halaqa_id, memorization_level))
             
-            conn.commit()
+            StudentRepository(conn).add(name, age, gender, phone, email, guardian_name,
+                                        guardian_phone, halaqa_id, memorization_level)
             conn.close()
+            invalidate_stats()
             
             flash('تم إضافة الطالب بنجاح!', 'success')
             return redirect(url_for('students_list'))
@@ -688,9 +649,7 @@ def add_student():
     # جلب قائمة الحلقات للاختيار منها
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name FROM halaqat ORDER BY name')
-        halaqat = cursor.fetchall()
+        halaqat = HalaqaRepository(conn).options()
         conn.close()
     except:
         halaqat = []
@@ -713,23 +672,17 @@ def add_halaqa():
             end_time = request.form.get('end_time')
             
             conn = get_db_connection()
-            cursor = conn.cursor()
             
             # معالجة max_capacity
             if max_capacity:
                 max_capacity = int(max_capacity)
             else:
                 max_capacity = 30
-                
-            cursor.execute('''
-                INSERT INTO halaqat (name, type, teacher_name, location, max_capacity,
-                                   schedule_days, start_time, end_time, created_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, DATETIME('now'))
-            ''', (name, type_val, teacher_name, location, max_capacity,
-                  schedule_days, start_time, end_time))
             
-            conn.commit()
+            HalaqaRepository(conn).add(name, type_val, teacher_name, location, max_capacity,
+                                       schedule_days, start_time, end_time)
             conn.close()
+            invalidate_stats()
             
             flash('تم إضافة الحلقة بنجاح!', 'success')
             return redirect(url_for('halaqat_list'))
@@ -740,9 +693,7 @@ def add_halaqa():
     # جلب قائمة المعلمين للاختيار منها
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, name FROM teachers ORDER BY name')
-        teachers = cursor.fetchall()
+        teachers = TeacherRepository(conn).options()
         conn.close()
     except:
         teachers = []
@@ -766,7 +717,6 @@ def add_teacher():
             notes = request.form.get('notes')
             
             conn = get_db_connection()
-            cursor = conn.cursor()
             
             # معالجة experience_years و salary
             if experience_years:
@@ -779,16 +729,10 @@ def add_teacher():
             else:
                 salary = None
                 
-            cursor.execute('''
-                INSERT INTO teachers (name, gender, phone, email, qualification,
-                                    specialization, experience_years, salary, notes,
-                                    status, hire_date, created_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'نشط', DATE('now'), DATETIME('now'))
-            ''', (name, gender, phone, email, qualification, specialization,
-                  experience_years, salary, notes))
-            
-            conn.commit()
+            TeacherRepository(conn).add(name, gender, phone, email, qualification, specialization,
+                                        experience_years, salary, notes)
             conn.close()
+            invalidate_stats()
             
             flash('تم إضافة المعلم بنجاح!', 'success')
             return redirect(url_for('teachers_list'))
@@ -806,25 +750,21 @@ def add_donation():
             # جمع البيانات من النموذج
             donor_name = request.form.get('donor_name')
             amount = request.form.get('amount')
-            purpose = request.form.get('purpose', 'تبرع عام')
+            # نموذج التبرع يرسل الغرض باسمه القديم purpose
+            allocation = request.form.get('allocation') or request.form.get('purpose', 'تبرع عام')
             notes = request.form.get('notes')
             
             conn = get_db_connection()
-            cursor = conn.cursor()
             
             # معالجة amount
             if amount:
                 amount = float(amount)
             else:
                 amount = 0.0
-                
-            cursor.execute('''
-                INSERT INTO donations (donor_name, amount, purpose, date, allocated)
-                VALUES (?, ?, ?, DATETIME('now'), 0)
-            ''', (donor_name, amount, purpose))
             
-            conn.commit()
+            DonationRepository(conn).add(donor_name, amount, allocation, notes)
             conn.close()
+            invalidate_stats()
             
             flash('تم إضافة التبرع بنجاح!', 'success')
             return redirect(url_for('donations_list'))
@@ -836,42 +776,37 @@ def add_donation():
 
 @app.route('/mark_attendance', methods=['POST'])
 def mark_attendance():
-    """تسجيل حضور الطلاب"""
+    """تسجيل حضور الطلاب (دفعة واحدة لكل الحلقة أو طالب واحد)"""
     try:
-        data = request.json
+        data = request.json or {}
         attendance_date = data.get('date', date.today().isoformat())
         attendance_records = data.get('attendance', [])
+        halaqa_id = data.get('halaqa_id') or None
+        
+        # دعم إرسال سجل طالب واحد مباشرة من بطاقة الحضور
+        if not attendance_records and data.get('student_id'):
+            attendance_records = [data]
         
         if not attendance_records:
             return jsonify({'success': False, 'message': 'لا توجد بيانات حضور لتسجيلها'})
         
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # حذف السجلات الموجودة لنفس التاريخ (للتحديث)
-        cursor.execute('DELETE FROM attendance WHERE date = ?', (attendance_date,))
-        
-        # إدراج سجلات الحضور الجديدة
-        success_count = 0
-        for record in attendance_records:
-            student_id = record.get('student_id')
-            status = record.get('status', 'غائب')
-            notes = record.get('notes', '')
-            
-            if student_id:
-                cursor.execute('''
-                    INSERT INTO attendance (student_id, date, status, notes, created_at)
-                    VALUES (?, ?, ?, ?, DATETIME('now'))
-                ''', (student_id, attendance_date, status, notes))
-                success_count += 1
-        
-        conn.commit()
+        results = AttendanceRepository(conn).mark(
+            attendance_date, attendance_records,
+            halaqa_id=int(halaqa_id) if halaqa_id is not None else None
+        )
         conn.close()
         
+        success_count = sum(1 for r in results if r['result'] != 'rejected')
+        rejected_count = len(results) - success_count
+        
         return jsonify({
-            'success': True,
-            'message': f'تم تسجيل حضور {success_count} طالب بنجاح',
-            'count': success_count
+            'success': success_count > 0,
+            'message': f'تم تسجيل حضور {success_count} طالب بنجاح'
+                       + (f' ورُفض {rejected_count} سجل' if rejected_count else ''),
+            'count': success_count,
+            'rejected': rejected_count,
+            'results': results
         })
         
     except Exception as e:
@@ -886,22 +821,8 @@ def get_attendance():
     try:
         attendance_date = request.args.get('date', date.today().isoformat())
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT a.student_id, a.status, a.notes
-            FROM attendance a
-            WHERE a.date = ?
-        ''', (attendance_date,))
-        
-        attendance_data = {}
-        for row in cursor.fetchall():
-            attendance_data[row[0]] = {
-                'status': row[1],
-                'notes': row[2]
-            }
-        
+        conn = get_read_connection()
+        attendance_data = AttendanceRepository(conn).for_date(attendance_date)
         conn.close()
         
         return jsonify({
@@ -919,27 +840,35 @@ def get_attendance():
 def halaqa_details(halaqa_id):
     """عرض تفاصيل الحلقة"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_read_connection()
         
         # جلب بيانات الحلقة
-        cursor.execute('SELECT * FROM halaqat WHERE id = ?', (halaqa_id,))
-        halaqa = cursor.fetchone()
+        halaqa = HalaqaRepository(conn).get(halaqa_id)
         
         if not halaqa:
             flash('الحلقة غير موجودة', 'error')
             return redirect(url_for('halaqat_list'))
         
         # جلب طلاب الحلقة
-        cursor.execute('''
-            SELECT * FROM students WHERE halaqa_id = ? ORDER BY name
-        ''', (halaqa_id,))
-        students = cursor.fetchall()
+        rows = StudentRepository(conn).in_halaqa(halaqa_id)
+        
+        # إحصائيات الحضور الفعلية لآخر 30 يوماً للحلقة ولكل طالب
+        summary = attendance_analytics.period_summary(conn, halaqa_id=halaqa_id)
+        per_student = attendance_analytics.student_attendance(conn, halaqa_id=halaqa_id)
+        
+        students = []
+        for row in rows:
+            student = dict(row)
+            student_stats = per_student.get(student['id'], {})
+            student['attendance_rate'] = student_stats.get('attendance_rate', 0)
+            student['attendance_streak'] = student_stats.get('current_streak', 0)
+            students.append(student)
         
-        # جلب إحصائيات الحضور (تقديرية)
         attendance_stats = {
-            'total_sessions': 20,  # افتراضي
-            'average_attendance': int(len(students) * 0.85) if students else 0
+            'total_sessions': summary['total_days'],
+            'total_days': summary['total_days'],
+            'attendance_rate': summary['attendance_rate'],
+            'average_attendance': round(summary['count'] / summary['total_days']) if summary['total_days'] else 0
         }
         
         conn.close()
@@ -969,18 +898,10 @@ def edit_halaqa(halaqa_id):
             end_time = request.form.get('end_time')
             
             conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE halaqat 
-                SET name = ?, type = ?, teacher_name = ?, location = ?, 
-                    max_capacity = ?, schedule_days = ?, start_time = ?, end_time = ?
-                WHERE id = ?
-            ''', (name, type_val, teacher_name, location, max_capacity,
-                  schedule_days, start_time, end_time, halaqa_id))
-            
-            conn.commit()
+            HalaqaRepository(conn).update(halaqa_id, name, type_val, teacher_name, location,
+                                          max_capacity, schedule_days, start_time, end_time)
             conn.close()
+            invalidate_stats()
             
             flash('تم تحديث بيانات الحلقة بنجاح!', 'success')
             return redirect(url_for('halaqa_details', halaqa_id=halaqa_id))
@@ -991,18 +912,15 @@ def edit_halaqa(halaqa_id):
     # جلب بيانات الحلقة للعرض
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM halaqat WHERE id = ?', (halaqa_id,))
-        halaqa = cursor.fetchone()
+        halaqa = HalaqaRepository(conn).get(halaqa_id)
         
         if not halaqa:
             flash('الحلقة غير موجودة', 'error')
             return redirect(url_for('halaqat_list'))
         
         # جلب قائمة المعلمين
-        cursor.execute('SELECT id, name FROM teachers ORDER BY name')
-        teachers = cursor.fetchall()
+        teachers = TeacherRepository(conn).options()
         
         conn.close()
         
@@ -1023,25 +941,17 @@ def edit_student(student_id):
             gender = request.form.get('gender')
             phone = request.form.get('phone')
             email = request.form.get('email')
-            guardian_name = request.form.get('guardian_name')
-            guardian_phone = request.form.get('guardian_phone')
-            halaqa_id = request.form.get('halaqa_id')
-            memorization_level = request.form.get('memorization_level')
+            guardian_name = request.form.get('guardian_name', '')
+            guardian_phone = request.form.get('guardian_phone') or request.form.get('parent_phone', '')
+            halaqa_id = request.form.get('halaqa_id') or None
+            memorization_level = (request.form.get('memorization_level')
+                                  or request.form.get('performance_level'))
             
             conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE students 
-                SET name = ?, age = ?, gender = ?, phone = ?, email = ?,
-                    guardian_name = ?, guardian_phone = ?, halaqa_id = ?, 
-                    memorization_level = ?
-                WHERE id = ?
-            ''', (name, age, gender, phone, email, guardian_name,
-                  guardian_phone, halaqa_id, memorization_level, student_id))
-            
-            conn.commit()
+            StudentRepository(conn).update(student_id, name, age, gender, phone, email, guardian_name,
+                                           guardian_phone, halaqa_id, memorization_level)
             conn.close()
+            invalidate_stats()
             
             flash('تم تحديث بيانات الطالب بنجاح!', 'success')
             return redirect(url_for('students_list'))
@@ -1052,18 +962,15 @@ def edit_student(student_id):
     # جلب بيانات الطالب للعرض
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM students WHERE id = ?', (student_id,))
-        student = cursor.fetchone()
+        student = StudentRepository(conn).get(student_id)
         
         if not student:
             flash('الطالب غير موجود', 'error')
             return redirect(url_for('students_list'))
         
         # جلب قائمة الحلقات
-        cursor.execute('SELECT id, name FROM halaqat ORDER BY name')
-        halaqat = cursor.fetchall()
+        halaqat = HalaqaRepository(conn).options()
         
         conn.close()
         
@@ -1077,36 +984,19 @@ def edit_student(student_id):
 def teacher_details(teacher_id):
     """عرض تفاصيل المعلم"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_read_connection()
         
         # جلب بيانات المعلم
-        cursor.execute('SELECT * FROM teachers WHERE id = ?', (teacher_id,))
-        teacher = cursor.fetchone()
+        teacher = TeacherRepository(conn).get(teacher_id)
         
         if not teacher:
             flash('المعلم غير موجود', 'error')
             return redirect(url_for('teachers_list'))
         
-        # جلب حلقات المعلم
-        cursor.execute('''
-            SELECT h.*, COUNT(s.id) as student_count
-            FROM halaqat h
-            LEFT JOIN students s ON h.id = s.halaqa_id
-            WHERE h.teacher_name = ?
-            GROUP BY h.id
-            ORDER BY h.name
-        ''', (teacher.name,))
-        teacher_halaqat = cursor.fetchall()
-        
-        # جلب إجمالي الطلاب لهذا المعلم
-        cursor.execute('''
-            SELECT COUNT(s.id) as total_students
-            FROM students s
-            JOIN halaqat h ON s.halaqa_id = h.id
-            WHERE h.teacher_name = ?
-        ''', (teacher.name,))
-        total_students = cursor.fetchone()[0] if cursor.fetchone() else 0
+        # جلب حلقات المعلم وإجمالي طلابه
+        halaqat_repo = HalaqaRepository(conn)
+        teacher_halaqat = halaqat_repo.for_teacher(teacher_id)
+        total_students = halaqat_repo.teacher_student_total(teacher_id)
         
         conn.close()
         
@@ -1137,19 +1027,11 @@ def edit_teacher(teacher_id):
             status = request.form.get('status', 'نشط')
             
             conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE teachers 
-                SET name = ?, gender = ?, phone = ?, email = ?, qualification = ?,
-                    specialization = ?, experience_years = ?, salary = ?, 
-                    notes = ?, status = ?
-                WHERE id = ?
-            ''', (name, gender, phone, email, qualification, specialization,
-                  experience_years, salary, notes, status, teacher_id))
-            
-            conn.commit()
+            TeacherRepository(conn).update(teacher_id, name, gender, phone, email, qualification,
+                                           specialization, experience_years or 0, salary or None,
+                                           notes, status)
             conn.close()
+            invalidate_stats()
             
             flash('تم تحديث بيانات المعلم بنجاح!', 'success')
             return redirect(url_for('teacher_details', teacher_id=teacher_id))
@@ -1160,10 +1042,8 @@ def edit_teacher(teacher_id):
     # جلب بيانات المعلم للعرض
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
         
-        cursor.execute('SELECT * FROM teachers WHERE id = ?', (teacher_id,))
-        teacher = cursor.fetchone()
+        teacher = TeacherRepository(conn).get(teacher_id)
         
         if not teacher:
             flash('المعلم غير موجود', 'error')
@@ -1186,158 +1066,13 @@ def generate_ai_report():
         time_period = data.get('time_period', 'current_week')
         halaqa_id = data.get('halaqa_id') or 'all'  # معالجة القيم null
         
-        # تهيئة التقرير الافتراضي
-        report = {
-            'type': report_type,
-            'time_period': time_period,
-            'halaqa_id': halaqa_id,
-            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'status': 'completed'
-        }
+        if data.get('async'):
+            # التقارير الثقيلة تُنفذ في الخلفية ويُتابع تقدمها عبر /jobs/<id>
+            return submit_job_response('ai_report', {
+                'report_type': report_type, 'time_period': time_period, 'halaqa_id': halaqa_id})
         
         conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        if report_type == 'weekly' or report_type == 'monthly':
-            # تقرير زمني (أسبوعي أو شهري)
-            period_name = "الأسبوعي" if report_type == 'weekly' else "الشهري"
-            
-            # فلترة بناء على الحلقة المختارة
-            if halaqa_id != 'all':
-                cursor.execute('SELECT COUNT(*) FROM students WHERE halaqa_id = ?', (halaqa_id,))
-                total_students = cursor.fetchone()[0] or 0
-                
-                cursor.execute('SELECT name FROM halaqat WHERE id = ?', (halaqa_id,))
-                halaqa_name = cursor.fetchone()
-                halaqa_name = halaqa_name[0] if halaqa_name else f"حلقة رقم {halaqa_id}"
-            else:
-                cursor.execute('SELECT COUNT(*) FROM students')
-                total_students = cursor.fetchone()[0] or 0
-                halaqa_name = "جميع الحلقات"
-            
-            cursor.execute('SELECT COUNT(*) FROM halaqat')
-            total_halaqat = cursor.fetchone()[0] or 0
-            
-            cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM donations')
-            total_donations = cursor.fetchone()[0] or 0
-            
-            # تحديد نص الفترة
-            period_text = {
-                'current_week': 'الأسبوع الحالي',
-                'last_week': 'الأسبوع الماضي', 
-                'current_month': 'الشهر الحالي',
-                'last_month': 'الشهر الماضي'
-            }.get(time_period, time_period)
-            
-            report.update({
-                'title': f'التقرير {period_name} - {halaqa_name}',
-                'period': period_text,
-                'halaqa_name': halaqa_name,
-                'summary': {
-                    'total_students': total_students,
-                    'total_halaqat': total_halaqat if halaqa_id == 'all' else 1,
-                    'total_donations': float(total_donations),
-                    'attendance_rate': 85,  # قيمة افتراضية
-                },
-                'ai_analysis': f'تحليل شامل للأداء في {period_text} لـ{halaqa_name}. تظهر البيانات مستوى جيد من الانتظام والتقدم.',
-                'strengths': [
-                    'ارتفاع في معدلات الحضور',
-                    'تحسن في مستوى الحفظ',
-                    'زيادة في التبرعات'
-                ],
-                'recommendations': [
-                    'الاستمرار في البرامج الحالية',
-                    'تطوير برامج تحفيزية جديدة',
-                    'تعزيز التواصل مع أولياء الأمور'
-                ]
-            })
-            
-        elif report_type == 'performance':
-            # تحليل أداء الحلقات
-            if halaqa_id != 'all':
-                # أداء حلقة محددة
-                cursor.execute('''
-                    SELECT h.name, COUNT(s.id) as student_count
-                    FROM halaqat h
-                    LEFT JOIN students s ON h.id = s.halaqa_id
-                    WHERE h.id = ?
-                    GROUP BY h.id, h.name
-                ''', (halaqa_id,))
-                halaqat_performance = cursor.fetchall()
-                title_suffix = f" - {halaqat_performance[0][0] if halaqat_performance else 'حلقة محددة'}"
-            else:
-                # جميع الحلقات
-                cursor.execute('''
-                    SELECT h.name, COUNT(s.id) as student_count
-                    FROM halaqat h
-                    LEFT JOIN students s ON h.id = s.halaqa_id
-                    GROUP BY h.id, h.name
-                    ORDER BY student_count DESC
-                ''')
-                halaqat_performance = cursor.fetchall()
-                title_suffix = " - جميع الحلقات"
-            
-            report.update({
-                'title': f'تقرير أداء الحلقات{title_suffix}',
-                'halaqat_analysis': [
-                    {
-                        'halaqa_name': halaqa[0] if halaqa[0] else f'حلقة رقم {i+1}',
-                        'student_count': halaqa[1] if halaqa[1] else 0,
-                        'performance_rating': 'ممتاز' if (halaqa[1] or 0) >= 10 else 'جيد',
-                        'recommendations': ['زيادة الأنشطة التفاعلية', 'تحسين بيئة التعلم']
-                    }
-                    for i, halaqa in enumerate(halaqat_performance[:5])
-                ],
-                'ai_analysis': 'تحليل شامل لأداء جميع الحلقات مع التركيز على نقاط القوة',
-                'overall_rating': 'ممتاز'
-            })
-            
-        elif report_type == 'allocation':
-            # توزيع التبرعات
-            cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM donations')
-            total_amount = cursor.fetchone()[0] or 5000
-            
-            cursor.execute('SELECT COUNT(*) FROM halaqat')
-            halaqat_count = cursor.fetchone()[0] or 1
-            
-            per_halaqa = float(total_amount) / halaqat_count if halaqat_count > 0 else 0
-            
-            report.update({
-                'title': 'خطة توزيع التبرعات الذكية',
-                'total_amount': float(total_amount),
-                'allocation_strategy': 'توزيع عادل بناء على الاحتياجات والأداء',
-                'allocations': [
-                    {
-                        'category': 'مكافآت الطلاب',
-                        'amount': per_halaqa * 0.4,
-                        'percentage': 40
-                    },
-                    {
-                        'category': 'مستلزمات تعليمية', 
-                        'amount': per_halaqa * 0.3,
-                        'percentage': 30
-                    },
-                    {
-                        'category': 'أنشطة ترفيهية',
-                        'amount': per_halaqa * 0.2,
-                        'percentage': 20
-                    },
-                    {
-                        'category': 'طوارئ',
-                        'amount': per_halaqa * 0.1,
-                        'percentage': 10
-                    }
-                ],
-                'ai_analysis': 'توزيع محسّن يركز على تحفيز الطلاب وتحسين جودة التعليم'
-            })
-        else:
-            # نوع تقرير غير معروف
-            report = {
-                'type': report_type,
-                'status': 'error',
-                'message': f'نوع التقرير "{report_type}" غير مدعوم',
-                'available_types': ['weekly', 'performance', 'allocation']
-            }
+        report = report_builder.get_ai_report(conn, report_type, time_period, halaqa_id)
         
         conn.close()
         
@@ -1366,105 +1101,24 @@ def export_report_pdf():
                 'message': 'لا توجد بيانات تقرير للتصدير'
             })
         
-        # إنشاء محتوى HTML للتقرير
-        html_content = generate_pdf_html(report_data)
-        
-        # إنشاء استجابة PDF بسيطة (نسخة مؤقتة)
-        from datetime import datetime
+        stamp = datetime.now().strftime("%Y%m%d_%H%M")
+        if not pdf_renderer.pdf_available():
+            # بدون مكتبات PDF: صفحة HTML جاهزة للطباعة من المتصفح
+            return Response(
+                pdf_renderer.render_html(report_data),
+                mimetype='text/html',
+                headers={'Content-Disposition': f'attachment; filename="report_{stamp}.html"'}
+            )
         
-        pdf_content = f"""
-📋 {report_data.get('title', 'تقرير')}
-{'='*50}
-
-📅 تاريخ التوليد: {datetime.now().strftime('%Y-%m-%d %H:%M')}
-📊 نوع التقرير: {report_data.get('type', 'غير محدد')}
-🏫 الحلقة: {report_data.get('halaqa_name', 'غير محدد')}
-📆 الفترة: {report_data.get('period', 'غير محدد')}
-
-{'='*50}
-📈 الملخص:
-{'='*50}
-"""
-        
-        if 'summary' in report_data:
-            summary = report_data['summary']
-            pdf_content += f"""
-👥 عدد الطلاب: {summary.get('total_students', 0)}
-🏫 عدد الحلقات: {summary.get('total_halaqat', 0)} 
-💰 إجمالي التبرعات: {summary.get('total_donations', 0):.2f} ريال
-📊 معدل الحضور: {summary.get('attendance_rate', 0)}%
-"""
-
-        if 'ai_analysis' in report_data:
-            pdf_content += f"""
-{'='*50}
-🤖 التحليل الذكي:
-{'='*50}
-{report_data['ai_analysis']}
-"""
-
-        if 'strengths' in report_data:
-            pdf_content += f"""
-{'='*50}
-💪 نقاط القوة:
-{'='*50}
-"""
-            for i, strength in enumerate(report_data['strengths'], 1):
-                pdf_content += f"{i}. {strength}\n"
-
-        if 'recommendations' in report_data:
-            pdf_content += f"""
-{'='*50}
-📋 التوصيات:
-{'='*50}
-"""
-            for i, rec in enumerate(report_data['recommendations'], 1):
-                pdf_content += f"{i}. {rec}\n"
-
-        if 'halaqat_analysis' in report_data:
-            pdf_content += f"""
-{'='*50}
-📊 تحليل الحلقات:
-{'='*50}
-"""
-            for analysis in report_data['halaqat_analysis']:
-                pdf_content += f"""
-🏫 {analysis.get('halaqa_name', 'حلقة')}:
-   👥 عدد الطلاب: {analysis.get('student_count', 0)}
-   ⭐ التقييم: {analysis.get('performance_rating', 'جيد')}
-   📋 التوصيات: {', '.join(analysis.get('recommendations', []))}
-
-"""
-
-        if 'allocations' in report_data:
-            pdf_content += f"""
-{'='*50}
-💰 خطة توزيع التبرعات:
-{'='*50}
-💵 المبلغ الإجمالي: {report_data.get('total_amount', 0):.2f} ريال
-
-"""
-            for allocation in report_data['allocations']:
-                pdf_content += f"• {allocation.get('category')}: {allocation.get('amount', 0):.2f} ريال ({allocation.get('percentage', 0)}%)\n"
-
-        pdf_content += f"""
-
-{'='*50}
-📝 ملاحظة: هذا تقرير تم توليده تلقائياً بواسطة نظام إدارة الحلقات القرآنية
-🕌 جزاكم الله خيراً
-{'='*50}
-"""
-
-        # إرجاع النص كملف للتحميل (حل مؤقت حتى نضيف مكتبة PDF حقيقية)
-        response = app.response_class(
-            pdf_content,
-            mimetype='text/plain; charset=utf-8',
+        pdf_bytes = pdf_renderer.render_pdf_in_pool(report_data)
+        return Response(
+            pdf_renderer.iter_bytes(pdf_bytes),
+            mimetype='application/pdf',
             headers={
-                'Content-Disposition': f'attachment; filename="report_{datetime.now().strftime("%Y%m%d_%H%M")}.txt"',
-                'Content-Type': 'text/plain; charset=utf-8'
+                'Content-Disposition': f'attachment; filename="report_{stamp}.pdf"',
+                'Content-Length': str(len(pdf_bytes))
             }
         )
-        return response
         
     except Exception as e:
         return jsonify({
@@ -1474,150 +1128,118 @@ def export_report_pdf():
 
 @app.route('/export_data/<report_type>')
 def export_data(report_type):
-    """تصدير البيانات بصيغة CSV"""
+    """تصدير البيانات بصيغة CSV (بث تدريجي بدون حد لعدد الصفوف)
+    
+    فلاتر اختيارية: ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD&halaqa_id=<رقم>
+    ومع ?async=1 يُنشأ التصدير كمهمة خلفية بدلاً من البث المباشر.
+    """
+    if report_type not in report_builder.EXPORTS:
+        flash('نوع التقرير غير صحيح', 'error')
+        return redirect(url_for('reports'))
+    
+    if request.args.get('async'):
+        return submit_job_response('export', dict(request.args.to_dict(), report_type=report_type))
+    
     try:
-        from flask import make_response, send_file
-        import csv
-        import io
-        import tempfile
-        from datetime import datetime
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # إعداد اسم الملف
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'{report_type}_{timestamp}.csv'
-        
-        # إنشاء مؤقت لملف CSV
-        output = io.StringIO()
-        
-        if report_type == 'students':
-            cursor.execute('''
-                SELECT s.name, s.age, s.gender, s.phone, s.email, 
-                       s.guardian_name, s.guardian_phone, h.name as halaqa_name,
-                       s.join_date, s.memorization_level
-                FROM students s 
-                LEFT JOIN halaqat h ON s.halaqa_id = h.id 
-                ORDER BY s.name
-            ''')
-            
-            data = cursor.fetchall()
-            writer = csv.writer(output)
-            
-            # كتابة العناوين
-            writer.writerow(['الاسم', 'العمر', 'الجنس', 'الهاتف', 'البريد الإلكتروني', 
-                           'اسم الولي', 'هاتف الولي', 'الحلقة', 'تاريخ الانضمام', 'مستوى الحفظ'])
-            
-            # كتابة البيانات
-            for row in data:
-                writer.writerow(row)
-                
-        elif report_type == 'halaqat':
-            cursor.execute('''
-                SELECT h.name, h.type, h.teacher_name, h.location, h.max_capacity,
-                       h.schedule_days, h.start_time, h.end_time, COUNT(s.id) as student_count
-                FROM halaqat h
-                LEFT JOIN students s ON h.id = s.halaqa_id
-                GROUP BY h.id
-                ORDER BY h.name
-            ''')
-            
-            data = cursor.fetchall()
-            writer = csv.writer(output)
-            
-            writer.writerow(['اسم الحلقة', 'النوع', 'المعلم', 'المكان', 'السعة القصوى',
-                           'أيام الدراسة', 'وقت البداية', 'وقت النهاية', 'عدد الطلاب'])
-            
-            for row in data:
-                writer.writerow(row)
-                
-        elif report_type == 'attendance':
-            cursor.execute('''
-                SELECT a.date, s.name, h.name as halaqa_name, a.status, a.notes
-                FROM attendance a
-                JOIN students s ON a.student_id = s.id
-                LEFT JOIN halaqat h ON s.halaqa_id = h.id
-                ORDER BY a.date DESC, s.name
-                LIMIT 1000
-            ''')
-            
-            data = cursor.fetchall()
-            writer = csv.writer(output)
-            
-            writer.writerow(['التاريخ', 'اسم الطالب', 'الحلقة', 'حالة الحضور', 'ملاحظات'])
-            
-            for row in data:
-                writer.writerow(row)
-                
-        elif report_type == 'donations':
-            cursor.execute('''
-                SELECT donor_name, amount, donation_date, purpose, notes
-                FROM donations 
-                ORDER BY donation_date DESC
-                LIMIT 1000
-            ''')
-            
-            data = cursor.fetchall()
-            writer = csv.writer(output)
-            
-            writer.writerow(['اسم المتبرع', 'المبلغ', 'تاريخ التبرع', 'الغرض', 'ملاحظات'])
-            
-            for row in data:
-                writer.writerow(row)
-                
-        else:
-            flash('نوع التقرير غير صحيح', 'error')
-            return redirect(url_for('reports'))
-        
-        conn.close()
-        
-        # إعداد الاستجابة
-        output.seek(0)
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        return response
-        
-    except Exception as e:
-        flash(f'خطأ في تصدير البيانات: {e}', 'error')
+        headers, query, params = report_builder.export_query(
+            report_type,
+            date_from=request.args.get('date_from'),
+            date_to=request.args.get('date_to'),
+            halaqa_id=request.args.get('halaqa_id'))
+    except ValueError as e:
+        flash(f'فلتر تصدير غير صالح: {e}', 'error')
         return redirect(url_for('reports'))
+    
+    def generate():
+        conn = None
+        try:
+            conn = get_read_connection()
+            yield from report_builder.csv_chunks(conn, headers, query, params)
+        except Exception:
+            # لا يمكن تغيير الحالة بعد بدء الإرسال: سطر خطأ ظاهر في نهاية الملف بدلاً من قطعه بصمت
+            app.logger.exception('Export error (%s)', report_type)
+            yield report_builder.csv_error_row()
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    filename = f'{report_type}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={
+            'Content-Type': 'text/csv; charset=utf-8',
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        }
+    )
 
-def generate_pdf_html(report_data):
-    """توليد HTML لتحويله لـ PDF"""
-    html = f"""
-    <!DOCTYPE html>
-    <html dir="rtl" lang="ar">
-    <head>
-        <meta charset="UTF-8">
-        <title>{report_data.get('title', 'تقرير')}</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; direction: rtl; text-align: right; }}
-            .header {{ text-align: center; color: #2c5530; margin-bottom: 30px; }}
-            .section {{ margin: 20px 0; padding: 15px; border: 1px solid #ddd; }}
-            .summary-grid {{ display: grid; grid-template-columns: repeat(2, 1fr); gap: 15px; }}
-            .stat-box {{ text-align: center; padding: 10px; background: #f8f9fa; border-radius: 5px; }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>🕌 {report_data.get('title', 'تقرير')}</h1>
-            <p>تاريخ التوليد: {report_data.get('generated_at', '')}</p>
-        </div>
-        <!-- باقي المحتوى -->
-    </body>
-    </html>
+@app.route('/import/<entity>', methods=['POST'])
+def import_data(entity):
+    """استيراد جماعي من ملف CSV أو Excel (حقل file) - entity: students | teachers | attendance
+    
+    الصفوف الصالحة تُدخل على دفعات، والتقرير يعيد عدد المدخل والمرفوض مع سبب كل رفض.
     """
-    return html
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'success': False, 'message': 'يرجى اختيار ملف للاستيراد'}), 400
+    try:
+        report = bulk_import.import_file(entity, upload.stream, filename=upload.filename)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'خطأ في الاستيراد: {str(e)}'}), 500
+    finally:
+        invalidate_stats()
+    return jsonify(dict(report, success=True))
 
-# Initialize database on startup
-try:
-    init_db()
-    print("✅ تم تهيئة قاعدة البيانات")
-except Exception as e:
-    print(f"⚠️  تحذير: {e}")
+def _job_response(job, status=200, **extra):
+    return jsonify(dict(extra, success=True, job=jobs.job_as_dict(job),
+                        poll_url=url_for('job_status', job_id=job['id']),
+                        download_url=url_for('job_download', job_id=job['id']))), status
+
+def submit_job_response(kind, params):
+    """إنشاء مهمة خلفية (أو الانضمام لمهمة متطابقة جارية) وإعادة روابط المتابعة"""
+    try:
+        job, created = jobs.submit(kind, params)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'خطأ في إنشاء المهمة: {str(e)}'}), 500
+    return _job_response(job, 202 if created else 200, deduplicated=not created)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """إنشاء مهمة خلفية: {"kind": "ai_report" | "export", "params": {...}}"""
+    data = request.json or {}
+    return submit_job_response(data.get('kind'), data.get('params'))
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """حالة المهمة ونسبة التقدم"""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'المهمة غير موجودة'}), 404
+    return _job_response(job)
+
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    """تنزيل نتيجة المهمة بعد اكتمالها"""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'المهمة غير موجودة'}), 404
+    if job['status'] == 'expired':
+        return jsonify({'success': False, 'message': 'انتهت مدة الاحتفاظ بنتيجة المهمة - أعد طلبها',
+                        'job': jobs.job_as_dict(job)}), 410
+    if job['status'] != 'done':
+        return jsonify({'success': False, 'message': 'المهمة لم تكتمل بعد',
+                        'job': jobs.job_as_dict(job)}), 409
+    if not job['result_path'] or not os.path.exists(job['result_path']):
+        return jsonify({'success': False, 'message': 'ملف النتيجة غير موجود'}), 410
+    return send_file(job['result_path'], mimetype=job['content_type'],
+                     as_attachment=True, download_name=job['filename'])
 
 if __name__ == '__main__':
+    # خادم التطوير فقط - في الإنتاج: python database_helper.py migrate ثم gunicorn -c gunicorn.conf.py wsgi:app
+    init_db()
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    prepare_app().run(host='0.0.0.0', port=port, debug=False, threaded=True)
\ No newline at end of file
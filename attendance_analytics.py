@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تحليلات الحضور - معدلات يومية وأسبوعية ولكل حلقة ولكل طالب مع سلاسل الحضور
+"""
+
+from datetime import date, timedelta
+
+from database_helper import execute_named, register_query
+
+PRESENT = 'حاضر'
+ABSENT = 'غائب'
+LATE = 'متأخر'
+
+# المدة الافتراضية لحساب المعدلات عند عدم تحديد فترة
+DEFAULT_WINDOW_DAYS = 30
+
+_DAILY_ROWS_SQL = '''
+    SELECT attendance_date AS day, halaqa_id, present, absent, late, total
+    FROM attendance_daily_summary
+    WHERE attendance_date BETWEEN ? AND ?
+'''
+register_query('attendance.daily', _DAILY_ROWS_SQL, ('2024-01-01', '2024-01-31'))
+register_query('attendance.daily_halaqa', _DAILY_ROWS_SQL + ' AND halaqa_id = ?',
+               ('2024-01-01', '2024-01-31', 1))
+
+_STUDENT_ROWS_SQL = '''
+    SELECT student_id, attendance_date, status
+    FROM attendance
+    WHERE attendance_date BETWEEN ? AND ?
+'''
+register_query('attendance.by_student', _STUDENT_ROWS_SQL + ' ORDER BY student_id, attendance_date',
+               ('2024-01-01', '2024-01-31'))
+register_query('attendance.by_student_halaqa',
+               _STUDENT_ROWS_SQL + ' AND halaqa_id = ? ORDER BY student_id, attendance_date',
+               ('2024-01-01', '2024-01-31', 1))
+
+
+def _iso(value):
+    """توحيد التاريخ كنص YYYY-MM-DD (SQLite يعيد نصاً و PostgreSQL يعيد date)"""
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)[:10]
+
+
+def _rate(attended, total):
+    """نسبة الحضور المئوية (الحاضر والمتأخر يُحسبان حضوراً)"""
+    return round(attended * 100.0 / total, 1) if total else 0
+
+
+def period_bounds(time_period, today=None):
+    """بداية ونهاية فترة التقرير (current_week, last_week, current_month, last_month)"""
+    today = today or date.today()
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+
+    if time_period == 'last_week':
+        return week_start - timedelta(days=7), week_start - timedelta(days=1)
+    if time_period == 'current_month':
+        return month_start, today
+    if time_period == 'last_month':
+        last_month_end = month_start - timedelta(days=1)
+        return last_month_end.replace(day=1), last_month_end
+    if time_period == 'current_week':
+        return week_start, today
+    return today - timedelta(days=DEFAULT_WINDOW_DAYS - 1), today
+
+
+def _window(start, end):
+    end = end or date.today()
+    start = start or end - timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+    return _iso(start), _iso(end)
+
+
+def _daily_rows(conn, start, end, halaqa_id=None):
+    """عدادات الحضور لكل (يوم، حلقة) في الفترة من جدول الملخص اليومي
+
+    جدول attendance_daily_summary يُحدَّث مع كل تسجيل حضور، فحجم القراءة
+    (أيام × حلقات) لا يكبر مع عدد الطلاب أو طول السجل.
+    """
+    if halaqa_id is None:
+        cursor = execute_named(conn, 'attendance.daily', (start, end))
+    else:
+        cursor = execute_named(conn, 'attendance.daily_halaqa', (start, end, halaqa_id))
+    return [
+        {
+            'date': _iso(row['day']),
+            'halaqa_id': row['halaqa_id'],
+            'present': row['present'] or 0,
+            'absent': row['absent'] or 0,
+            'late': row['late'] or 0,
+            'total': row['total'] or 0,
+        }
+        for row in cursor.fetchall()
+    ]
+
+
+def _summarize(rows):
+    present = sum(r['present'] for r in rows)
+    absent = sum(r['absent'] for r in rows)
+    late = sum(r['late'] for r in rows)
+    total = sum(r['total'] for r in rows)
+    return {
+        'present': present,
+        'absent': absent,
+        'late': late,
+        'total': total,
+        'count': present + late,
+        'attendance_rate': _rate(present + late, total),
+    }
+
+
+def daily_attendance(conn, start=None, end=None, halaqa_id=None, fill_missing=True):
+    """الحضور لكل يوم في الفترة: [{'date', 'present', 'absent', 'late', 'total', 'count', 'attendance_rate'}]"""
+    start, end = _window(start, end)
+    by_day = {}
+    for row in _daily_rows(conn, start, end, halaqa_id):
+        by_day.setdefault(row['date'], []).append(row)
+
+    days = []
+    if fill_missing:
+        current, last = date.fromisoformat(start), date.fromisoformat(end)
+        while current <= last:
+            day = current.isoformat()
+            days.append(dict(_summarize(by_day.get(day, [])), date=day))
+            current += timedelta(days=1)
+    else:
+        for day in sorted(by_day):
+            days.append(dict(_summarize(by_day[day]), date=day))
+    return days
+
+
+def weekly_attendance(conn, start=None, end=None, halaqa_id=None):
+    """الحضور لكل أسبوع (يبدأ الأسبوع يوم الاثنين)"""
+    start, end = _window(start, end)
+    by_week = {}
+    for row in _daily_rows(conn, start, end, halaqa_id):
+        day = date.fromisoformat(row['date'])
+        week_start = (day - timedelta(days=day.weekday())).isoformat()
+        by_week.setdefault(week_start, []).append(row)
+
+    return [
+        dict(_summarize(by_week[week]), week_start=week, days=len({r['date'] for r in by_week[week]}))
+        for week in sorted(by_week)
+    ]
+
+
+def halaqa_attendance(conn, start=None, end=None):
+    """معدل الحضور لكل حلقة: {halaqa_id: {..., 'total_days', 'attendance_rate'}}"""
+    start, end = _window(start, end)
+    by_halaqa = {}
+    for row in _daily_rows(conn, start, end):
+        by_halaqa.setdefault(row['halaqa_id'], []).append(row)
+
+    return {
+        halaqa_id: dict(_summarize(rows), total_days=len({r['date'] for r in rows}))
+        for halaqa_id, rows in by_halaqa.items()
+    }
+
+
+def period_summary(conn, start=None, end=None, halaqa_id=None):
+    """ملخص الحضور لفترة كاملة (مع عدد الأيام الدراسية المسجلة)"""
+    start, end = _window(start, end)
+    rows = _daily_rows(conn, start, end, halaqa_id)
+    return dict(_summarize(rows), total_days=len({r['date'] for r in rows}),
+                start=start, end=end)
+
+
+def student_attendance(conn, start=None, end=None, halaqa_id=None):
+    """معدل الحضور وسلاسل الحضور لكل طالب في الفترة
+
+    يعيد {student_id: {'present', 'absent', 'late', 'total', 'attendance_rate',
+    'current_streak', 'best_streak'}} - السلسلة عدد أيام الحضور المتتالية المسجلة.
+    """
+    start, end = _window(start, end)
+    if halaqa_id is None:
+        cursor = execute_named(conn, 'attendance.by_student', (start, end))
+    else:
+        cursor = execute_named(conn, 'attendance.by_student_halaqa', (start, end, halaqa_id))
+
+    # مرور واحد على الصفوف المرتبة لحساب العدادات والسلاسل معاً
+    stats = {}
+    for row in cursor.fetchall():
+        entry = stats.get(row['student_id'])
+        if entry is None:
+            entry = stats[row['student_id']] = {
+                'present': 0, 'absent': 0, 'late': 0, 'total': 0,
+                'current_streak': 0, 'best_streak': 0,
+            }
+        status = row['status']
+        entry['total'] += 1
+        if status == PRESENT:
+            entry['present'] += 1
+        elif status == LATE:
+            entry['late'] += 1
+        else:
+            entry['absent'] += 1
+
+        if status in (PRESENT, LATE):
+            entry['current_streak'] += 1
+            entry['best_streak'] = max(entry['best_streak'], entry['current_streak'])
+        else:
+            entry['current_streak'] = 0
+
+    for entry in stats.values():
+        entry['attendance_rate'] = _rate(entry['present'] + entry['late'], entry['total'])
+    return stats
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+أدوات قياس الأداء: مولد بيانات تجريبية بأحجام واقعية ومشغل قياس للمسارات الرئيسية
+
+    # قاعدة SQLite منفصلة بحجم الإنتاج المتوقع (أو PostgreSQL عبر DATABASE_URL)
+    python -m benchmarks.seed_data --sqlite bench.db
+    python -m benchmarks.seed_data --sqlite bench_small.db --scale 0.01
+
+    # قياس المسارات وحفظ النتيجة JSON في benchmarks/results ومقارنتها بتشغيل سابق
+    python -m benchmarks.runner --sqlite bench.db --requests 200
+    python -m benchmarks.runner --sqlite bench.db --compare benchmarks/results/<سابق>.json
+
+تُشغَّل من جذر المشروع حتى تُستورد وحدات التطبيق.
+"""
+
+import database_helper
+
+
+def use_database(sqlite_path=None):
+    """توجيه اتصالات المجمع لقاعدة SQLite محددة (بدونها: DATABASE_URL أو القاعدة الافتراضية)"""
+    if sqlite_path:
+        database_helper.close_pool()
+        database_helper.SQLITE_PATH = sqlite_path
+
+
+def table_counts(conn, tables=('halaqat', 'teachers', 'students', 'attendance', 'donations')):
+    """عدد صفوف كل جدول (لتوثيق حجم البيانات مع كل تشغيل)"""
+    cursor = conn.cursor()
+    counts = {}
+    for table in tables:
+        cursor.execute(f'SELECT COUNT(*) AS total FROM {table}')
+        counts[table] = cursor.fetchone()['total']
+    return counts
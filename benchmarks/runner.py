@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+مشغل قياس الأداء للمسارات الرئيسية عبر Flask test client
+
+لكل سيناريو: p50/p95/p99 والمتوسط والأقصى لزمن الاستجابة، والإنتاجية (طلب/ثانية)
+وعدد الأخطاء (حالة HTTP >= 400، أو success=false في استجابات JSON، أو رسالة خطأ flash).
+النتيجة تُحفظ JSON مع بيانات التشغيل (الإصدار، حجم البيانات، الإعدادات) للمقارنة بين تشغيلين.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from flask import message_flashed
+
+import database_helper
+from database_helper import ATTENDANCE_STATUSES, get_db_connection, is_postgres
+
+from benchmarks import table_counts, use_database
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+REPORT_TYPES = ('weekly', 'monthly', 'performance', 'allocation')
+TIME_PERIODS = ('current_week', 'last_week', 'current_month', 'last_month')
+EXPORT_TYPES = ('students', 'halaqat', 'attendance', 'donations')
+
+# أول رسالة خطأ (flash) في الطلب الجاري لكل خيط - المسارات تلتقط أخطاءها وتعيد 200
+_flashed = threading.local()
+
+
+def _record_flashed_error(sender, message, category, **extra):
+    if category == 'error' and not getattr(_flashed, 'error', None):
+        _flashed.error = message
+
+
+class Workload:
+    """بيانات عشوائية (بذرة ثابتة) لبناء الطلبات: الحلقات وطلابها وأيام الحضور"""
+
+    def __init__(self, conn, seed):
+        self.rng = random.Random(seed)
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, halaqa_id FROM students WHERE halaqa_id IS NOT NULL ORDER BY id')
+        self.rosters = {}
+        for row in cursor.fetchall():
+            self.rosters.setdefault(row['halaqa_id'], []).append(row['id'])
+        if not self.rosters:
+            raise ValueError('لا يوجد طلاب في الحلقات - شغّل benchmarks.seed_data أولاً')
+        self.halaqa_ids = sorted(self.rosters)
+        self.days = [(date.today() - timedelta(days=offset)).isoformat() for offset in range(30)]
+        self._lock = threading.Lock()
+
+    def pick(self, choices):
+        with self._lock:
+            return self.rng.choice(choices)
+
+    def attendance_batch(self):
+        with self._lock:
+            halaqa_id = self.rng.choice(self.halaqa_ids)
+            statuses = [self.rng.choice(ATTENDANCE_STATUSES) for _ in self.rosters[halaqa_id]]
+        return {
+            'date': self.pick(self.days),
+            'halaqa_id': halaqa_id,
+            'attendance': [{'student_id': student_id, 'status': status}
+                           for student_id, status in zip(self.rosters[halaqa_id], statuses)],
+        }
+
+
+def _export(client, workload, i):
+    report_type = EXPORT_TYPES[i % len(EXPORT_TYPES)]
+    query = {}
+    if report_type == 'attendance':
+        query = {'halaqa_id': workload.pick(workload.halaqa_ids),
+                 'date_from': workload.days[-1], 'date_to': workload.days[0]}
+    return client.get(f'/export_data/{report_type}', query_string=query)
+
+
+# اسم السيناريو -> دالة تنفذ الطلب رقم i وتعيد الاستجابة
+SCENARIOS = {
+    'dashboard': lambda client, workload, i: client.get('/'),
+    'students_list': lambda client, workload, i: client.get('/students'),
+    'attendance': lambda client, workload, i: client.get(
+        '/attendance', query_string={'date': workload.pick(workload.days)}),
+    'mark_attendance': lambda client, workload, i: client.post(
+        '/mark_attendance', json=workload.attendance_batch()),
+    'generate_ai_report': lambda client, workload, i: client.post('/generate_ai_report', json={
+        'report_type': REPORT_TYPES[i % len(REPORT_TYPES)],
+        'time_period': TIME_PERIODS[i % len(TIME_PERIODS)],
+        'halaqa_id': workload.pick(workload.halaqa_ids + ['all'])}),
+    'export_data': _export,
+}
+
+
+def _failure(response):
+    """سبب فشل الطلب (حالة خطأ، أو success=false، أو رسالة خطأ flash) أو None عند نجاحه"""
+    if response.status_code >= 400:
+        return f'HTTP {response.status_code}'
+    if getattr(_flashed, 'error', None):
+        return _flashed.error
+    if response.is_json:
+        payload = response.get_json(silent=True)
+        if isinstance(payload, dict) and payload.get('success') is False:
+            return payload.get('message') or 'success=false'
+    return None
+
+
+def _percentile(ordered, fraction):
+    """النسبة المئوية بالاستيفاء الخطي بين أقرب قيمتين"""
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _summary(latencies, failures, elapsed):
+    ordered = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'requests': len(ordered),
+        'errors': len(failures),
+        'first_error': failures[0] if failures else None,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': ms(_percentile(ordered, 0.50)),
+            'p95': ms(_percentile(ordered, 0.95)),
+            'p99': ms(_percentile(ordered, 0.99)),
+            'mean': ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+            'max': ms(ordered[-1]) if ordered else 0.0,
+        },
+    }
+
+
+def run_scenario(app, workload, name, requests, warmup=5, concurrency=1):
+    """تشغيل سيناريو واحد: طلبات إحماء لا تُحتسب ثم requests طلباً موزعة على concurrency خيطاً"""
+    scenario = SCENARIOS[name]
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+    latencies = []
+    failures = []
+
+    def worker():
+        client = app.test_client()
+        local_latencies, local_failures = [], []
+        while True:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            _flashed.error = None
+            started = time.perf_counter()
+            response = scenario(client, workload, i)
+            response.get_data()  # استهلاك الاستجابات المبثوثة (التصدير) حتى نهايتها
+            local_latencies.append(time.perf_counter() - started)
+            failure = _failure(response)
+            if failure:
+                local_failures.append(failure)
+            response.close()
+        with counter_lock:
+            latencies.extend(local_latencies)
+            failures.extend(local_failures)
+
+    client = app.test_client()
+    for i in range(warmup):
+        scenario(client, workload, i).close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summary(latencies, failures, time.perf_counter() - started)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scenarios, requests=200, warmup=5, concurrency=1, seed=42, templates=None):
+    """تشغيل السيناريوهات بالترتيب وإعادة النتيجة مع بيانات التشغيل"""
+    from app_simple import app
+
+    if templates:
+        app.jinja_loader.searchpath = [os.path.abspath(templates)]
+    message_flashed.connect(_record_flashed_error, app)
+
+    conn = get_db_connection()
+    try:
+        workload = Workload(conn, seed)
+        database = {'engine': 'postgresql' if is_postgres(conn) else 'sqlite',
+                    'rows': table_counts(conn)}
+        if not is_postgres(conn):
+            database['path'] = database_helper.SQLITE_PATH
+    finally:
+        conn.close()
+
+    results = {}
+    for name in scenarios:
+        print(f"⏱️  {name}: {requests} طلب ({concurrency} خيط)...")
+        results[name] = run_scenario(app, workload, name, requests, warmup, concurrency)
+        latency = results[name]['latency_ms']
+        print(f"   p50 {latency['p50']} ms | p95 {latency['p95']} ms | p99 {latency['p99']} ms"
+              f" | {results[name]['throughput_rps']} طلب/ث | أخطاء {results[name]['errors']}")
+        if results[name]['errors']:
+            print(f"   ❌ أول خطأ: {results[name]['first_error']}")
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'database': database,
+            'settings': {'requests': requests, 'warmup': warmup, 'concurrency': concurrency,
+                         'seed': seed},
+        },
+        'scenarios': results,
+    }
+
+
+def compare(baseline, current):
+    """طباعة نسبة التغير في p50/p95/p99 والإنتاجية لكل سيناريو مشترك بين تشغيلين"""
+    change = lambda old, new: f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+    print(f"📊 المقارنة مع {baseline['meta'].get('git_commit')} ({baseline['meta'].get('timestamp')})")
+    # mark_attendance يضيف سجلات حضور في كل تشغيل، فالحجم يُقارن بالمحرك والطلاب والحلقات فقط
+    volume = lambda meta: (meta['database']['engine'],
+                           {table: meta['database']['rows'][table] for table in ('students', 'halaqat')})
+    for label, key in (('الإعدادات', lambda meta: meta['settings']), ('حجم البيانات', volume)):
+        if key(baseline['meta']) != key(current['meta']):
+            print(f"⚠️  اختلاف {label} بين التشغيلين - المقارنة تقريبية")
+    for name, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        latency = ' | '.join(
+            f"{key} {before['latency_ms'][key]} → {result['latency_ms'][key]} ms "
+            f"({change(before['latency_ms'][key], result['latency_ms'][key])})"
+            for key in ('p50', 'p95', 'p99'))
+        print(f"   {name}: {latency} | الإنتاجية "
+              f"{change(before['throughput_rps'], result['throughput_rps'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='قياس أداء المسارات الرئيسية')
+    parser.add_argument('--sqlite', help='مسار قاعدة SQLite (بدونه: DATABASE_URL أو القاعدة الافتراضية)')
+    parser.add_argument('--templates', help='مجلد القوالب إن لم يكن templates/ بجانب التطبيق')
+    parser.add_argument('--requests', type=int, default=200, help='عدد الطلبات المقاسة لكل سيناريو')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1, help='عدد الخيوط المتزامنة')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='سيناريوهات مفصولة بفاصلة: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--output', help='ملف النتيجة (الافتراضي: benchmarks/results/<الوقت>.json)')
+    parser.add_argument('--compare', help='ملف نتيجة سابق للمقارنة')
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        print(f"❌ سيناريو غير معروف: {', '.join(unknown)}")
+        return 2
+
+    use_database(args.sqlite)
+    try:
+        result = run(scenarios, args.requests, args.warmup, args.concurrency, args.seed, args.templates)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"✅ حُفظت النتيجة في {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), result)
+
+    # زمن صفحة خطأ لا يقيس المسار الحقيقي - تشغيل فيه أخطاء لا يصلح للمقارنة
+    failed = {name: scenario['errors'] for name, scenario in result['scenarios'].items() if scenario['errors']}
+    if failed:
+        print("❌ سيناريوهات فيها أخطاء (النتيجة غير صالحة للمقارنة): "
+              + '، '.join(f'{name} {errors}/{args.requests}' for name, errors in failed.items()))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+مولد بيانات تجريبية قابل للتكرار (نفس البذرة = نفس البيانات) لقياس الأداء
+
+الأحجام الافتراضية: 500 حلقة، 250 معلماً، 50 ألف طالب، 10 ملايين سجل حضور
+(سجل لكل طالب في كل يوم دراسي بالرجوع من اليوم)، ومليون تبرع. --scale يصغّرها كلها بنسبة واحدة.
+يعمل على SQLite (--sqlite) أو PostgreSQL (DATABASE_URL) ويرفض قاعدة فيها طلاب مسبقاً.
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import database_helper
+from database_helper import (ATTENDANCE_STATUSES, VERSIONED_TABLES, adapt_query, bump_data_version,
+                             get_db_connection, is_postgres, rebuild_daily_summary,
+                             recount_halaqa_students)
+
+from benchmarks import table_counts, use_database
+
+DEFAULT_VOLUMES = {
+    'halaqat': 500,
+    'teachers': 250,
+    'students': 50_000,
+    'attendance': 10_000_000,
+    'donations': 1_000_000,
+}
+
+# عدد الصفوف في كل أمر إدخال ومعاملة
+INSERT_CHUNK_SIZE = 5000
+
+FIRST_NAMES = {
+    'ذكر': ['محمد', 'أحمد', 'عبدالله', 'عمر', 'يوسف', 'إبراهيم', 'خالد', 'علي', 'حمزة', 'سعد',
+            'عبدالرحمن', 'مصطفى', 'بلال', 'زيد', 'أنس', 'معاذ', 'سلمان', 'طارق', 'ياسر', 'فهد'],
+    'أنثى': ['فاطمة', 'عائشة', 'مريم', 'خديجة', 'سارة', 'زينب', 'أسماء', 'حفصة', 'نور', 'هدى',
+             'رقية', 'آمنة', 'سمية', 'ليلى', 'جنى', 'رغد', 'لين', 'ريم', 'منى', 'هاجر'],
+}
+FAMILY_NAMES = ['العتيبي', 'القحطاني', 'الشمري', 'الحربي', 'الزهراني', 'الغامدي', 'المالكي', 'الدوسري',
+                'السبيعي', 'العنزي', 'الشهري', 'المطيري', 'الرشيدي', 'البقمي', 'الجهني', 'الأنصاري']
+SURAHS = ['الفاتحة', 'البقرة', 'آل عمران', 'النساء', 'المائدة', 'الأنعام', 'الأعراف', 'يس',
+          'الكهف', 'مريم', 'طه', 'الملك', 'الرحمن', 'الواقعة', 'النبأ', 'الفجر']
+HALAQA_TYPES = ['حفظ', 'مراجعة', 'تلاوة', 'تجويد']
+LOCATIONS = ['المسجد الجامع', 'مسجد الحي', 'قاعة 1', 'قاعة 2', 'المبنى الرئيسي', 'عن بعد']
+SCHEDULES = ['السبت، الاثنين، الأربعاء', 'الأحد، الثلاثاء، الخميس', 'يومياً', 'الخميس، الجمعة']
+LEVELS = ['مبتدئ', 'متوسط', 'جيد', 'جيد جداً', 'ممتاز']
+ALLOCATIONS = ['عام', 'رواتب المعلمين', 'المصاحف', 'الجوائز', 'صيانة المسجد', 'الأنشطة']
+# نسب حالات الحضور بنفس ترتيب ATTENDANCE_STATUSES (حاضر، غائب، متأخر)
+STATUS_WEIGHTS = [80, 12, 8]
+
+
+def _name(rng, gender):
+    return f'{rng.choice(FIRST_NAMES[gender])} {rng.choice(FIRST_NAMES["ذكر"])} {rng.choice(FAMILY_NAMES)}'
+
+
+def _phone(rng):
+    return f'05{rng.randrange(10**8):08d}'
+
+
+def _day(rng, days_back):
+    return (date.today() - timedelta(days=rng.randrange(days_back))).isoformat()
+
+
+def _insert(conn, table, columns, rows, total):
+    """إدخال صفوف مولدة على دفعات (execute_values في PostgreSQL و executemany في SQLite)"""
+    cursor = conn.cursor()
+    sql = f'INSERT INTO {table} ({", ".join(columns)})'
+    if is_postgres(conn):
+        from psycopg2.extras import execute_values
+        insert = lambda chunk: execute_values(cursor, sql + ' VALUES %s', chunk, page_size=len(chunk))
+    else:
+        marks = ', '.join('?' * len(columns))
+        insert = lambda chunk: cursor.executemany(adapt_query(conn, f'{sql} VALUES ({marks})'), chunk)
+
+    started = time.monotonic()
+    inserted = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == INSERT_CHUNK_SIZE:
+            insert(chunk)
+            conn.commit()
+            inserted += len(chunk)
+            chunk = []
+            if inserted % (INSERT_CHUNK_SIZE * 100) == 0:
+                print(f"   {table}: {inserted:,} / {total:,}")
+    if chunk:
+        insert(chunk)
+        conn.commit()
+        inserted += len(chunk)
+    print(f"✅ {table}: {inserted:,} صف ({time.monotonic() - started:.1f} ثانية)")
+    return inserted
+
+
+def _ids(conn, query):
+    cursor = conn.cursor()
+    cursor.execute(query)
+    return cursor.fetchall()
+
+
+def _teachers(rng, count):
+    for _ in range(count):
+        gender = rng.choice(('ذكر', 'أنثى'))
+        yield (_name(rng, gender), gender, _phone(rng), None, rng.choice(['بكالوريوس', 'ماجستير', 'إجازة']),
+               rng.choice(['القرآن الكريم', 'التجويد', 'القراءات']), rng.randrange(1, 30),
+               rng.randrange(3000, 12000), 'نشط' if rng.random() < 0.9 else 'غير نشط', _day(rng, 3650))
+
+
+def _halaqat(rng, count, teachers):
+    for i in range(count):
+        teacher = teachers[i % len(teachers)]
+        yield (f'حلقة {rng.choice(SURAHS)} {i + 1}', rng.choice(HALAQA_TYPES), teacher['id'], teacher['name'],
+               rng.choice(LOCATIONS), rng.randrange(20, 151), rng.choice(SCHEDULES), '16:00', '18:00')
+
+
+def _students(rng, count, halaqa_ids):
+    for _ in range(count):
+        gender = rng.choice(('ذكر', 'أنثى'))
+        name = _name(rng, gender)
+        memorized = rng.randrange(605)
+        yield (name, rng.randrange(6, 21), gender, _phone(rng) if rng.random() < 0.5 else None, None,
+               ' '.join(name.split()[1:]), _phone(rng), rng.choice(halaqa_ids), rng.choice(LEVELS),
+               memorized, rng.randrange(min(memorized, 20) + 1), _day(rng, 3 * 365))
+
+
+def _attendance(rng, count, students):
+    """سجل لكل طالب في كل يوم (عدا الجمعة) بالرجوع من اليوم حتى اكتمال العدد"""
+    day = date.today()
+    produced = 0
+    while produced < count:
+        if day.weekday() != 4:
+            attendance_date = day.isoformat()
+            statuses = rng.choices(ATTENDANCE_STATUSES, weights=STATUS_WEIGHTS, k=len(students))
+            for student, status in zip(students, statuses):
+                if produced == count:
+                    return
+                yield (student['id'], student['halaqa_id'], attendance_date, status, '')
+                produced += 1
+        day -= timedelta(days=1)
+
+
+def _donations(rng, count, halaqa_ids):
+    donors = [_name(rng, rng.choice(('ذكر', 'أنثى'))) for _ in range(20_000)]
+    for _ in range(count):
+        donation_date = _day(rng, 2 * 365)
+        # توزيع مائل: أغلب التبرعات صغيرة وقليل منها كبير
+        amount = round(min(rng.lognormvariate(5, 1), 100_000), 2)
+        yield (rng.choice(donors), amount, donation_date, rng.choice(ALLOCATIONS),
+               rng.choice(halaqa_ids) if rng.random() < 0.3 else None, donation_date)
+
+
+def seed(volumes, seed_value=42):
+    """توليد البيانات في قاعدة فارغة - يعيد عدد صفوف كل جدول"""
+    database_helper.migrate()
+    conn = get_db_connection()
+    try:
+        if table_counts(conn, ('students',))['students']:
+            raise ValueError('قاعدة البيانات تحتوي على طلاب - استخدم قاعدة جديدة للقياس')
+
+        # مولد مستقل لكل جدول حتى لا يغيّر حجم جدول بيانات جدول آخر
+        rng = lambda table: random.Random(f'{seed_value}:{table}')
+
+        _insert(conn, 'teachers', ['name', 'gender', 'phone', 'email', 'qualification', 'specialization',
+                                   'experience_years', 'salary', 'status', 'hire_date'],
+                _teachers(rng('teachers'), volumes['teachers']), volumes['teachers'])
+        teachers = _ids(conn, 'SELECT id, name FROM teachers ORDER BY id')
+
+        _insert(conn, 'halaqat', ['name', 'type', 'teacher_id', 'teacher_name', 'location', 'max_capacity',
+                                  'schedule_days', 'start_time', 'end_time'],
+                _halaqat(rng('halaqat'), volumes['halaqat'], teachers), volumes['halaqat'])
+        halaqa_ids = [row['id'] for row in _ids(conn, 'SELECT id FROM halaqat ORDER BY id')]
+
+        _insert(conn, 'students', ['name', 'age', 'gender', 'phone', 'email', 'guardian_name',
+                                   'guardian_phone', 'halaqa_id', 'memorization_level', 'memorization_pages',
+                                   'revision_pages', 'enrollment_date'],
+                _students(rng('students'), volumes['students'], halaqa_ids), volumes['students'])
+        students = _ids(conn, 'SELECT id, halaqa_id FROM students ORDER BY id')
+
+        _insert(conn, 'attendance', ['student_id', 'halaqa_id', 'attendance_date', 'status', 'notes'],
+                _attendance(rng('attendance'), volumes['attendance'], students), volumes['attendance'])
+
+        _insert(conn, 'donations', ['donor_name', 'amount', 'donation_date', 'allocation', 'halaqa_id',
+                                    'created_date'],
+                _donations(rng('donations'), volumes['donations'], halaqa_ids), volumes['donations'])
+
+        # الجداول المشتقة والعدادات كما لو أُدخلت البيانات من التطبيق
+        recount_halaqa_students(conn)
+        rebuild_daily_summary(conn)
+        bump_data_version(conn, *VERSIONED_TABLES)
+        conn.commit()
+        # إحصائيات المخطط للجداول الجديدة
+        conn.cursor().execute('ANALYZE')
+        conn.commit()
+        return table_counts(conn)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='توليد بيانات تجريبية لقياس الأداء')
+    parser.add_argument('--sqlite', help='مسار قاعدة SQLite (بدونه: DATABASE_URL أو القاعدة الافتراضية)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scale', type=float, default=1.0, help='نسبة الأحجام الافتراضية (مثل 0.01)')
+    for table, count in DEFAULT_VOLUMES.items():
+        parser.add_argument(f'--{table}', type=int, help=f'عدد صفوف {table} (الافتراضي: {count:,})')
+    args = parser.parse_args(argv)
+
+    volumes = {table: getattr(args, table) or max(1, int(count * args.scale))
+               for table, count in DEFAULT_VOLUMES.items()}
+    use_database(args.sqlite)
+    started = time.monotonic()
+    try:
+        counts = seed(volumes, args.seed)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ اكتمل التوليد في {time.monotonic() - started:.1f} ثانية: "
+          + '، '.join(f'{table} {count:,}' for table, count in counts.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+استيراد جماعي للطلاب والمعلمين والحضور من ملفات CSV أو Excel
+
+    IMPORT_CHUNK_SIZE    عدد الصفوف في كل دفعة تحقق وإدخال ومعاملة (الافتراضي: 1000)
+    IMPORT_MAX_ERRORS    أقصى عدد أخطاء تُعاد تفاصيلها في التقرير (الافتراضي: 500)
+
+الملف يُقرأ صفاً بصف دون تحميله كاملاً في الذاكرة، والحلقات والطلاب تُحوَّل
+أسماؤها لأرقام من جدول في الذاكرة يُحمَّل مرة واحدة. كل دفعة صالحة تُدخل بأمر
+واحد في معاملة مستقلة، فالصفوف المرفوضة لا تُلغي باقي الملف.
+عناوين الأعمدة تُقبل بالإنجليزية أو بنفس العناوين العربية لملفات التصدير.
+
+    python bulk_import.py students students.csv
+    python bulk_import.py attendance attendance.xlsx
+"""
+
+import codecs
+import csv
+import io
+import os
+import time
+from collections import Counter
+from datetime import date, datetime
+from itertools import islice
+
+from database_helper import (ATTENDANCE_STATUSES, adapt_query, adjust_halaqa_student_counts,
+                             bulk_upsert_attendance, bump_data_version, get_db_connection, is_postgres)
+
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 500))
+
+GENDERS = ('ذكر', 'أنثى')
+
+# الحقل -> عناوين الأعمدة المقبولة (الاسم الموحد، الأسماء القديمة، عناوين ملفات التصدير)
+FIELD_HEADERS = {
+    'students': {
+        'name': ('name', 'الاسم'),
+        'age': ('age', 'العمر'),
+        'gender': ('gender', 'الجنس'),
+        'phone': ('phone', 'الهاتف'),
+        'email': ('email', 'البريد الإلكتروني'),
+        'guardian_name': ('guardian_name', 'اسم الولي'),
+        'guardian_phone': ('guardian_phone', 'parent_phone', 'هاتف الولي'),
+        'halaqa': ('halaqa', 'halaqa_id', 'halaqa_name', 'الحلقة'),
+        'memorization_level': ('memorization_level', 'performance_level', 'مستوى الحفظ'),
+        'enrollment_date': ('enrollment_date', 'join_date', 'تاريخ الانضمام'),
+    },
+    'teachers': {
+        'name': ('name', 'الاسم'),
+        'gender': ('gender', 'الجنس'),
+        'phone': ('phone', 'الهاتف'),
+        'email': ('email', 'البريد الإلكتروني'),
+        'qualification': ('qualification', 'المؤهل'),
+        'specialization': ('specialization', 'التخصص'),
+        'experience_years': ('experience_years', 'سنوات الخبرة'),
+        'salary': ('salary', 'الراتب'),
+        'status': ('status', 'الحالة'),
+        'hire_date': ('hire_date', 'تاريخ التعيين'),
+        'notes': ('notes', 'ملاحظات'),
+    },
+    'attendance': {
+        'attendance_date': ('attendance_date', 'date', 'التاريخ'),
+        'student_id': ('student_id',),
+        'student_name': ('student_name', 'اسم الطالب'),
+        'halaqa': ('halaqa', 'halaqa_name', 'الحلقة'),
+        'status': ('status', 'حالة الحضور'),
+        'notes': ('notes', 'ملاحظات'),
+    },
+}
+
+REQUIRED_FIELDS = {
+    'students': ('name', 'age', 'gender'),
+    'teachers': ('name', 'gender'),
+    'attendance': ('attendance_date', 'status'),
+}
+
+_INSERT_SQL = {
+    'students': '''INSERT INTO students (name, age, gender, phone, email, guardian_name, guardian_phone,
+                                         halaqa_id, memorization_level, enrollment_date, created_date)''',
+    'teachers': '''INSERT INTO teachers (name, gender, phone, email, qualification, specialization,
+                                         experience_years, salary, status, hire_date, notes)''',
+}
+
+# أعمدة تملؤها قاعدة البيانات في آخر كل صف (created_date بلا قيمة افتراضية في قواعد SQLite القديمة)
+_SERVER_VALUES = {
+    'students': ', CURRENT_TIMESTAMP',
+}
+
+# موضع halaqa_id في صف إدخال الطالب (لتحديث عدادات الحلقات)
+_STUDENT_HALAQA = 7
+
+
+class RowError(ValueError):
+    """صف مرفوض مع سبب الرفض"""
+
+
+# ===== قراءة الملف =====
+
+def _csv_rows(stream):
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.BytesIO(stream)
+    if not isinstance(stream, io.TextIOBase):
+        # فك الترميز سطراً بسطر (يعمل مع ملفات الرفع المؤقتة في كل إصدارات بايثون)،
+        # و utf-8-sig يتجاوز BOM الذي تضيفه ملفات التصدير و Excel
+        stream = codecs.iterdecode(stream, 'utf-8-sig')
+    return csv.reader(stream)
+
+
+def _excel_rows(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('استيراد ملفات Excel يتطلب مكتبة openpyxl - احفظ الملف بصيغة CSV')
+    # read_only يقرأ الورقة صفاً بصف بدلاً من تحميلها كاملة
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    return workbook.active.iter_rows(values_only=True)
+
+
+def iter_records(entity, stream, filename=''):
+    """(رقم السطر، {الحقل: القيمة}) لكل صف بعد مطابقة العناوين - يرفع ValueError لملف غير صالح"""
+    rows = _excel_rows(stream) if filename.lower().endswith(('.xlsx', '.xlsm')) else _csv_rows(stream)
+    header = next(rows, None)
+    if not header:
+        raise ValueError('الملف فارغ')
+
+    aliases = {alias.lower(): field for field, names in FIELD_HEADERS[entity].items() for alias in names}
+    columns = [(i, aliases[str(title).strip().lower()]) for i, title in enumerate(header)
+               if title is not None and str(title).strip().lower() in aliases]
+    found = {field for _, field in columns}
+    missing = [field for field in REQUIRED_FIELDS[entity] if field not in found]
+    if entity == 'attendance' and not found & {'student_id', 'student_name'}:
+        missing.append('student_id / student_name')
+    if missing:
+        raise ValueError(f"أعمدة مطلوبة غير موجودة: {', '.join(missing)}")
+
+    for line, row in enumerate(rows, 2):
+        if not row or all(value is None or str(value).strip() == '' for value in row):
+            continue
+        yield line, {field: row[i] if i < len(row) else None for i, field in columns}
+
+
+# ===== التحقق من القيم =====
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def _required(record, field, label):
+    value = _text(record.get(field))
+    if not value:
+        raise RowError(f'{label} مطلوب')
+    return value
+
+
+def _int(value, label, default=None):
+    value = _text(value)
+    if not value:
+        return default
+    try:
+        # Excel يعيد الأرقام الصحيحة كـ 12.0
+        return int(float(value))
+    except ValueError:
+        raise RowError(f'{label} "{value}" ليس رقماً')
+
+
+def _date(value, label, default=None):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    value = _text(value)
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise RowError(f'{label} "{value}" ليس تاريخاً بصيغة YYYY-MM-DD')
+
+
+def _gender(record):
+    gender = _required(record, 'gender', 'الجنس')
+    if gender not in GENDERS:
+        raise RowError(f'الجنس "{gender}" غير معروف (المتاح: {"، ".join(GENDERS)})')
+    return gender
+
+
+class _Lookups:
+    """أرقام الحلقات والطلاب حسب الاسم - تُحمَّل مرة واحدة لكل عملية استيراد"""
+
+    def __init__(self, conn, entity):
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name FROM halaqat')
+        self.halaqa_ids = {}
+        for row in cursor.fetchall():
+            self.halaqa_ids[row['id']] = row['id']
+            self.halaqa_ids.setdefault(_text(row['name']), row['id'])
+
+        self.students = {}
+        self.student_ids = set()
+        if entity == 'attendance':
+            cursor.execute('SELECT id, name, halaqa_id FROM students')
+            for row in cursor.fetchall():
+                self.student_ids.add(row['id'])
+                name = _text(row['name'])
+                # الاسم وحده، والاسم مع الحلقة لتمييز الأسماء المتكررة
+                self.students.setdefault((name, None), []).append(row['id'])
+                self.students.setdefault((name, row['halaqa_id']), []).append(row['id'])
+
+    def halaqa(self, value):
+        value = _text(value)
+        if not value:
+            return None
+        key = int(float(value)) if value.replace('.', '', 1).isdigit() else value
+        if key not in self.halaqa_ids:
+            raise RowError(f'الحلقة "{value}" غير موجودة')
+        return self.halaqa_ids[key]
+
+    def student(self, record):
+        student_id = _int(record.get('student_id'), 'رقم الطالب')
+        if student_id is not None:
+            if student_id not in self.student_ids:
+                raise RowError(f'الطالب رقم {student_id} غير موجود')
+            return student_id
+        name = _required(record, 'student_name', 'اسم الطالب')
+        matches = self.students.get((name, self.halaqa(record.get('halaqa'))), [])
+        if not matches:
+            raise RowError(f'الطالب "{name}" غير موجود')
+        if len(matches) > 1:
+            raise RowError(f'يوجد أكثر من طالب باسم "{name}" - استخدم student_id أو عمود الحلقة')
+        return matches[0]
+
+
+def _student_values(record, lookups):
+    age = _int(record.get('age'), 'العمر')
+    if age is None:
+        raise RowError('العمر مطلوب')
+    return (
+        _required(record, 'name', 'الاسم'),
+        age,
+        _gender(record),
+        _text(record.get('phone')) or None,
+        _text(record.get('email')) or None,
+        _text(record.get('guardian_name')),
+        _text(record.get('guardian_phone')),
+        lookups.halaqa(record.get('halaqa')),
+        _text(record.get('memorization_level')) or 'مبتدئ',
+        _date(record.get('enrollment_date'), 'تاريخ الانضمام', date.today().isoformat()),
+    )
+
+
+def _teacher_values(record, lookups):
+    salary = _text(record.get('salary'))
+    try:
+        salary = float(salary) if salary else None
+    except ValueError:
+        raise RowError(f'الراتب "{salary}" ليس رقماً')
+    return (
+        _required(record, 'name', 'الاسم'),
+        _gender(record),
+        _text(record.get('phone')) or None,
+        _text(record.get('email')) or None,
+        _text(record.get('qualification')) or None,
+        _text(record.get('specialization')) or None,
+        _int(record.get('experience_years'), 'سنوات الخبرة', 0),
+        salary,
+        _text(record.get('status')) or 'نشط',
+        _date(record.get('hire_date'), 'تاريخ التعيين', date.today().isoformat()),
+        _text(record.get('notes')) or None,
+    )
+
+
+def _attendance_values(record, lookups):
+    status = _required(record, 'status', 'حالة الحضور')
+    if status not in ATTENDANCE_STATUSES:
+        raise RowError(f'حالة الحضور "{status}" غير معروفة')
+    attendance_date = _date(record.get('attendance_date'), 'التاريخ')
+    if attendance_date is None:
+        raise RowError('التاريخ مطلوب')
+    return attendance_date, {'student_id': lookups.student(record), 'status': status,
+                             'notes': _text(record.get('notes'))}
+
+
+_VALIDATORS = {
+    'students': _student_values,
+    'teachers': _teacher_values,
+    'attendance': _attendance_values,
+}
+
+
+# ===== الإدخال =====
+
+def _insert_many(conn, entity, rows):
+    """إدخال دفعة صفوف بأمر واحد في معاملة واحدة"""
+    cursor = conn.cursor()
+    server_values = _SERVER_VALUES.get(entity, '')
+    try:
+        if is_postgres(conn):
+            from psycopg2.extras import execute_values
+            template = '(' + ', '.join(['%s'] * len(rows[0])) + server_values + ')'
+            execute_values(cursor, _INSERT_SQL[entity] + ' VALUES %s', rows,
+                           template=template, page_size=len(rows))
+        else:
+            marks = ', '.join('?' * len(rows[0]))
+            cursor.executemany(adapt_query(conn, _INSERT_SQL[entity] + f' VALUES ({marks}{server_values})'),
+                               rows)
+        if entity == 'students':
+            adjust_halaqa_student_counts(conn, Counter(row[_STUDENT_HALAQA] for row in rows))
+        bump_data_version(conn, entity)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _import_attendance_chunk(conn, valid, report):
+    """الحضور يُسجل عبر bulk_upsert_attendance لكل تاريخ (تحديث السجل الموجود لنفس اليوم)"""
+    by_date = {}
+    for line, (attendance_date, record) in valid:
+        by_date.setdefault(attendance_date, []).append((line, record))
+    for attendance_date, items in by_date.items():
+        results = bulk_upsert_attendance(conn, attendance_date, [record for _, record in items])
+        for (line, _), result in zip(items, results):
+            if result.get('result') == 'rejected':
+                report.reject(line, result.get('message'))
+            else:
+                report.counts[result['result']] += 1
+
+
+class ImportReport:
+    """نتيجة الاستيراد: عدد الصفوف المدخلة والمرفوضة مع أول IMPORT_MAX_ERRORS خطأ"""
+
+    def __init__(self, entity):
+        self.entity = entity
+        self.total = 0
+        self.counts = {'inserted': 0, 'updated': 0}
+        self.rejected = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {
+            'entity': self.entity,
+            'total': self.total,
+            'inserted': self.counts['inserted'],
+            'updated': self.counts['updated'],
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'errors_truncated': self.rejected > len(self.errors),
+            'seconds': round(time.monotonic() - self.started, 2),
+        }
+
+
+def import_file(entity, stream, filename='', conn=None, chunk_size=None):
+    """استيراد ملف CSV أو Excel وإعادة تقرير الاستيراد - يرفع ValueError لنوع أو ملف غير صالح"""
+    if entity not in _VALIDATORS:
+        raise ValueError(f'نوع الاستيراد غير معروف: {entity} (المتاح: {", ".join(_VALIDATORS)})')
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    records = iter_records(entity, stream, filename)
+    validate = _VALIDATORS[entity]
+    report = ImportReport(entity)
+
+    owns_connection = conn is None
+    if owns_connection:
+        conn = get_db_connection()
+    try:
+        lookups = _Lookups(conn, entity)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            report.total += len(chunk)
+
+            valid = []
+            for line, record in chunk:
+                try:
+                    valid.append((line, validate(record, lookups)))
+                except RowError as e:
+                    report.reject(line, str(e))
+            if not valid:
+                continue
+
+            if entity == 'attendance':
+                _import_attendance_chunk(conn, valid, report)
+            else:
+                try:
+                    _insert_many(conn, entity, [values for _, values in valid])
+                    report.counts['inserted'] += len(valid)
+                except Exception as e:
+                    # رفض الدفعة كاملة مع سبب الخطأ من قاعدة البيانات
+                    for line, _ in valid:
+                        report.reject(line, f'خطأ في قاعدة البيانات: {e}')
+    finally:
+        if owns_connection:
+            conn.close()
+    return report.as_dict()
+
+
+def main(argv):
+    if len(argv) != 3:
+        print(f"الاستخدام: python bulk_import.py <{'|'.join(_VALIDATORS)}> <ملف.csv|ملف.xlsx>")
+        return 1
+    entity, path = argv[1], argv[2]
+    try:
+        with open(path, 'rb') as stream:
+            report = import_file(entity, stream, filename=path)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"✅ تم استيراد {report['inserted']} صف وتحديث {report['updated']} ورفض {report['rejected']} "
+          f"من {report['total']} ({report['seconds']} ثانية)")
+    for error in report['errors'][:20]:
+        print(f"   السطر {error['line']}: {error['error']}")
+    if report['rejected'] > 20:
+        print(f"   ... و{report['rejected'] - 20} خطأ آخر")
+    return 0 if not report['rejected'] else 2
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main(sys.argv))
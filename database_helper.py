@@ -5,10 +5,117 @@
 """
 
 import os
+import re
 import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import date, timedelta
 
-def get_db_connection():
-    """إنشاء اتصال قاعدة البيانات حسب البيئة"""
+from flask import g, has_app_context, has_request_context, request, session
+
+SQLITE_PATH = 'islamic_education.db'
+
+# حجم ذاكرة العبارات المترجمة لكل اتصال SQLite (الافتراضي في sqlite3 هو 128)
+SQLITE_STATEMENT_CACHE = int(os.environ.get('SQLITE_STATEMENT_CACHE', 256))
+
+# ملف أداء SQLite يُطبق عند فتح كل اتصال (قيمة فارغة في المتغير تلغي الإعداد)
+# - journal_mode=WAL: القراء لا ينتظرون الكاتب أثناء تسجيل الحضور
+# - busy_timeout: انتظار القفل بدلاً من الفشل الفوري بـ "database is locked"
+# - synchronous=NORMAL: آمن مع WAL وأسرع من FULL
+SQLITE_PRAGMAS = [
+    ('journal_mode', os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')),
+    ('busy_timeout', os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    ('synchronous', os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+    ('mmap_size', os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    # القيمة السالبة بالكيلوبايت: -65536 = 64 ميجابايت لكل اتصال
+    ('cache_size', os.environ.get('SQLITE_CACHE_SIZE', '-65536')),
+    ('temp_store', os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')),
+    ('foreign_keys', os.environ.get('SQLITE_FOREIGN_KEYS', 'ON')),
+]
+
+
+# نسخة القراءة (اختيارية): رابط PostgreSQL أو sqlite:///مسار.db للتجربة المحلية
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+
+# بعد أي طلب كتابة تُقرأ طلبات نفس المستخدم من الخادم الرئيسي لهذه المدة (تأخر النسخ)
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+# الطرق التي لا تعدّل البيانات ويمكن توجيهها لنسخة القراءة
+_READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PoolTimeout(Exception):
+    """انتهت مهلة انتظار اتصال متاح في مجمع الاتصالات"""
+
+
+def _connect_sqlite(path=None):
+    """فتح اتصال SQLite جديد"""
+    # check_same_thread=False لأن الاتصال قد يُعاد استخدامه من خيط آخر عبر المجمع
+    conn = sqlite3.connect(path or SQLITE_PATH, check_same_thread=False,
+                           cached_statements=SQLITE_STATEMENT_CACHE)
+    # تمكين الوصول للأعمدة بالاسم
+    conn.row_factory = sqlite3.Row
+    _apply_sqlite_pragmas(conn)
+    return conn
+
+
+def _apply_sqlite_pragmas(conn):
+    """تطبيق ملف أداء SQLite على الاتصال"""
+    for pragma, value in SQLITE_PRAGMAS:
+        if value:
+            # القيم من إعدادات الخادم وليست من المستخدم، و PRAGMA لا تقبل معاملات
+            conn.execute(f'PRAGMA {pragma} = {value}')
+
+
+# أسماء القيم الرقمية التي تعيدها بعض أوامر PRAGMA عند قراءتها
+_PRAGMA_VALUE_NAMES = {
+    'synchronous': {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'},
+    'temp_store': {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'},
+    'foreign_keys': {0: 'OFF', 1: 'ON'},
+}
+
+
+def sqlite_settings(conn):
+    """القيم الفعلية لإعدادات ملف الأداء على اتصال SQLite"""
+    raw = getattr(conn, 'raw', conn)
+    settings = {}
+    for pragma, _ in SQLITE_PRAGMAS:
+        row = raw.execute(f'PRAGMA {pragma}').fetchone()
+        value = row[0] if row else None
+        settings[pragma] = _PRAGMA_VALUE_NAMES.get(pragma, {}).get(value, value)
+    return settings
+
+
+def report_database_settings():
+    """فحص بدء التشغيل: طباعة إعدادات SQLite الفعلية والتنبيه لما لم يُطبق كما طُلب
+    
+    مثلاً WAL لا يعمل على بعض أنظمة الملفات الشبكية، و mmap_size محدود بقيمة
+    الترجمة SQLITE_MAX_MMAP_SIZE.
+    """
+    conn = get_db_connection()
+    try:
+        if is_postgres(conn):
+            return {}
+        settings = sqlite_settings(conn)
+    finally:
+        conn.close()
+    
+    mismatches = []
+    for pragma, requested in SQLITE_PRAGMAS:
+        effective = settings[pragma]
+        if requested and str(effective).upper() != str(requested).upper():
+            mismatches.append(f'{pragma}={effective} (المطلوب {requested})')
+    
+    print('🗄️  إعدادات SQLite: ' + ', '.join(f'{k}={v}' for k, v in settings.items()))
+    if mismatches:
+        print('⚠️  إعدادات لم تُطبق كما طُلب: ' + ', '.join(mismatches))
+    return settings
+
+
+def _connect():
+    """فتح اتصال خام جديد حسب البيئة (بدون المجمع)"""
     DATABASE_URL = os.environ.get('DATABASE_URL')
     
     if DATABASE_URL:
@@ -23,269 +130,1537 @@ def get_db_connection():
             return conn
         except ImportError:
             print("⚠️  psycopg2 not installed, falling back to SQLite")
-            conn = sqlite3.connect('islamic_education.db')
-            conn.row_factory = sqlite3.Row
-            return conn
+            return _connect_sqlite()
         except Exception as e:
             print(f"PostgreSQL connection failed: {e}, falling back to SQLite")
-            conn = sqlite3.connect('islamic_education.db')
-            conn.row_factory = sqlite3.Row
-            return conn
+            return _connect_sqlite()
     else:
-        conn = sqlite3.connect('islamic_education.db')
-        # تمكين الوصول للأعمدة بالاسم
-        conn.row_factory = sqlite3.Row
+        return _connect_sqlite()
+
+
+def _connect_replica():
+    """فتح اتصال خام بنسخة القراءة"""
+    url = DATABASE_REPLICA_URL
+    if url.startswith('sqlite:///'):
+        conn = _connect_sqlite(url[len('sqlite:///'):])
+        # حماية من الكتابة على النسخة بالخطأ
+        conn.execute('PRAGMA query_only = ON')
         return conn
+    
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    conn = psycopg2.connect(url, cursor_factory=RealDictCursor)
+    conn.set_session(readonly=True)
+    return conn
 
-def init_database():
-    """تهيئة قاعدة البيانات حسب البيئة"""
-    DATABASE_URL = os.environ.get('DATABASE_URL')
-    USE_POSTGRES = DATABASE_URL is not None
+
+def _close_quietly(raw):
+    """إغلاق اتصال خام مع تجاهل الأخطاء"""
+    _forget_statements(raw)
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+class PooledConnection:
+    """غلاف لاتصال من المجمع - close() يعيد الاتصال للمجمع بدلاً من إغلاقه"""
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    def __init__(self, pool, raw, request_scoped=False):
+        self._pool = pool
+        self._raw = raw
+        self._request_scoped = request_scoped
+        self._released = False
     
-    try:
-        if USE_POSTGRES:
-            # PostgreSQL Tables
-            
-            # جدول المعلمين
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS teachers (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    gender VARCHAR(20) NOT NULL,
-                    phone VARCHAR(20),
-                    email VARCHAR(255),
-                    qualification TEXT,
-                    specialization TEXT,
-                    experience_years INTEGER DEFAULT 0,
-                    salary DECIMAL(10,2),
-                    status VARCHAR(20) DEFAULT 'نشط',
-                    hire_date DATE,
-                    notes TEXT,
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # جدول الحلقات
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS halaqat (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    type VARCHAR(50) NOT NULL,
-                    teacher_id INTEGER,
-                    teacher_name VARCHAR(255) NOT NULL,
-                    location VARCHAR(255) NOT NULL,
-                    max_capacity INTEGER DEFAULT 30,
-                    schedule_days TEXT,
-                    start_time TIME,
-                    end_time TIME,
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE SET NULL
-                )
-            ''')
-            
-            # جدول الطلاب
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS students (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    age INTEGER NOT NULL,
-                    gender VARCHAR(20) NOT NULL,
-                    phone VARCHAR(20),
-                    guardian_name VARCHAR(255) NOT NULL,
-                    guardian_phone VARCHAR(20) NOT NULL,
-                    halaqa_id INTEGER,
-                    memorization_level VARCHAR(100),
-                    enrollment_date DATE DEFAULT CURRENT_DATE,
-                    status VARCHAR(20) DEFAULT 'نشط',
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (halaqa_id) REFERENCES halaqat(id) ON DELETE SET NULL
-                )
-            ''')
-            
-            # جدول الحضور
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS attendance (
-                    id SERIAL PRIMARY KEY,
-                    student_id INTEGER NOT NULL,
-                    halaqa_id INTEGER NOT NULL,
-                    attendance_date DATE NOT NULL,
-                    status VARCHAR(20) NOT NULL,
-                    memorization_progress TEXT,
-                    performance VARCHAR(20),
-                    notes TEXT,
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
-                    FOREIGN KEY (halaqa_id) REFERENCES halaqat(id) ON DELETE CASCADE,
-                    UNIQUE(student_id, attendance_date)
-                )
-            ''')
-            
-            # جدول التبرعات
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS donations (
-                    id SERIAL PRIMARY KEY,
-                    donor_name VARCHAR(255) NOT NULL,
-                    donor_phone VARCHAR(20),
-                    donor_email VARCHAR(255),
-                    amount DECIMAL(10,2) NOT NULL,
-                    donation_date DATE NOT NULL,
-                    allocation VARCHAR(100),
-                    halaqa_id INTEGER,
-                    notes TEXT,
-                    status VARCHAR(20) DEFAULT 'مكتمل',
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (halaqa_id) REFERENCES halaqat(id) ON DELETE SET NULL
-                )
-            ''')
-            
-            # جدول حملات جمع التبرعات
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS fundraising_campaigns (
-                    id SERIAL PRIMARY KEY,
-                    campaign_name VARCHAR(255) NOT NULL,
-                    platform VARCHAR(100) NOT NULL,
-                    target_amount DECIMAL(10,2) NOT NULL,
-                    current_amount DECIMAL(10,2) DEFAULT 0,
-                    target_audience TEXT,
-                    campaign_description TEXT,
-                    campaign_hashtags TEXT,
-                    start_date DATE,
-                    end_date DATE,
-                    status VARCHAR(20) DEFAULT 'مخطط',
-                    ai_suggestions TEXT,
-                    best_posting_times TEXT,
-                    created_by VARCHAR(100) DEFAULT 'النظام',
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._raw.commit()
         else:
-            # SQLite Tables (للتشغيل المحلي)
-            
-            # جدول المعلمين
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS teachers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    gender TEXT NOT NULL,
-                    phone TEXT,
-                    email TEXT,
-                    qualification TEXT,
-                    specialization TEXT,
-                    experience_years INTEGER DEFAULT 0,
-                    salary DECIMAL(10,2),
-                    status TEXT DEFAULT 'نشط',
-                    hire_date DATE,
-                    notes TEXT,
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # جدول الحلقات
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS halaqat (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    type TEXT NOT NULL,
-                    teacher_id INTEGER,
-                    teacher_name TEXT NOT NULL,
-                    location TEXT NOT NULL,
-                    max_capacity INTEGER DEFAULT 30,
-                    schedule_days TEXT,
-                    start_time TEXT,
-                    end_time TEXT,
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (teacher_id) REFERENCES teachers (id)
-                )
-            ''')
-            
-            # جدول الطلاب
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS students (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    age INTEGER NOT NULL,
-                    gender TEXT NOT NULL,
-                    phone TEXT,
-                    guardian_name TEXT NOT NULL,
-                    guardian_phone TEXT NOT NULL,
-                    halaqa_id INTEGER,
-                    memorization_level TEXT,
-                    enrollment_date DATE DEFAULT CURRENT_DATE,
-                    status TEXT DEFAULT 'نشط',
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (halaqa_id) REFERENCES halaqat (id)
-                )
-            ''')
-            
-            # جدول الحضور
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS attendance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    student_id INTEGER NOT NULL,
-                    halaqa_id INTEGER NOT NULL,
-                    attendance_date DATE NOT NULL,
-                    status TEXT NOT NULL,
-                    memorization_progress TEXT,
-                    performance TEXT,
-                    notes TEXT,
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (student_id) REFERENCES students (id),
-                    FOREIGN KEY (halaqa_id) REFERENCES halaqat (id),
-                    UNIQUE(student_id, attendance_date)
-                )
-            ''')
-            
-            # جدول التبرعات
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS donations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    donor_name TEXT NOT NULL,
-                    donor_phone TEXT,
-                    donor_email TEXT,
-                    amount DECIMAL(10,2) NOT NULL,
-                    donation_date DATE NOT NULL,
-                    allocation TEXT,
-                    halaqa_id INTEGER,
-                    notes TEXT,
-                    status TEXT DEFAULT 'مكتمل',
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (halaqa_id) REFERENCES halaqat (id)
-                )
-            ''')
-            
-            # جدول حملات جمع التبرعات
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS fundraising_campaigns (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    campaign_name TEXT NOT NULL,
-                    platform TEXT NOT NULL,
-                    target_amount DECIMAL(10,2) NOT NULL,
-                    current_amount DECIMAL(10,2) DEFAULT 0,
-                    target_audience TEXT,
-                    campaign_description TEXT,
-                    campaign_hashtags TEXT,
-                    start_date DATE,
-                    end_date DATE,
-                    status TEXT DEFAULT 'مخطط',
-                    ai_suggestions TEXT,
-                    best_posting_times TEXT,
-                    created_by TEXT DEFAULT 'النظام',
-                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            self._raw.rollback()
+        return False
+    
+    @property
+    def raw(self):
+        """الاتصال الأصلي (sqlite3 أو psycopg2)"""
+        return self._raw
+    
+    def cursor(self, *args, **kwargs):
+        """مؤشر جديد - داخل الطلبات أو مع محلل الاستعلامات يُغلَّف بـ InstrumentedCursor"""
+        cursor = self._raw.cursor(*args, **kwargs)
+        stats = _request_db_stats()
+        observer = _statement_observer
+        if stats is None and observer is None:
+            return cursor
+        return InstrumentedCursor(cursor, stats, observer)
+    
+    def close(self):
+        # اتصالات الطلب تُعاد للمجمع تلقائياً عند نهاية الطلب (teardown)
+        if not self._request_scoped:
+            self.release()
+    
+    def release(self):
+        """إعادة الاتصال للمجمع"""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw)
+
+
+def _request_db_stats():
+    """عدادات قاعدة البيانات للطلب الحالي (g.db_stats) أو None خارج الطلبات"""
+    if not has_request_context():
+        return None
+    stats = g.get('db_stats')
+    if stats is None:
+        stats = g.db_stats = {'statements': 0, 'rows': 0, 'seconds': 0.0}
+    return stats
+
+
+# مراقب العبارات (query_profiler عند تفعيله): observer(query, params, many) يعيد كائناً
+# له add(seconds, rows) و finish() لتسجيل زمن العبارة وصفوفها حتى العبارة التالية
+_statement_observer = None
+
+
+def set_statement_observer(observer):
+    """تفعيل مراقبة كل عبارة SQL على اتصالات المجمع (None للإيقاف)"""
+    global _statement_observer
+    _statement_observer = observer
+
+
+def _notify(callback, *args):
+    """استدعاء المراقب بأمان: خطأ فيه يُطبع ويُتجاهل ولا يُفشل العبارة التي يراقبها"""
+    try:
+        return callback(*args)
+    except Exception as e:
+        print(f"⚠️  خطأ في مراقب العبارات (تم تجاهله): {e}")
+        return None
+
+
+def _query_text(cursor, query):
+    """نص العبارة كـ str: execute_values في psycopg2 يمرر bytes، و psycopg2.sql يمرر Composed"""
+    if isinstance(query, str):
+        return query
+    if hasattr(query, 'as_string'):
+        return query.as_string(cursor)
+    if isinstance(query, (bytes, bytearray)):
+        try:
+            from psycopg2.extensions import encodings
+            encoding = encodings.get(cursor.connection.encoding, 'utf-8')
+        except (ImportError, AttributeError):
+            encoding = 'utf-8'
+        return bytes(query).decode(encoding, errors='replace')
+    return str(query)
+
+
+class InstrumentedCursor:
+    """غلاف مؤشر يحسب عبارات SQL والصفوف المقروءة والزمن المستغرق في قاعدة البيانات
+    
+    العدادات تُجمع في g.db_stats للطلب الحالي وتقرأها وحدة metrics بعد انتهاء الطلب،
+    ومع مراقب العبارات يُسجل زمن كل عبارة (التنفيذ والقراءة) في محلل الاستعلامات.
+    """
+    
+    def __init__(self, cursor, stats, observer=None):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_observer', observer)
+        object.__setattr__(self, '_profile', None)
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+    
+    def __setattr__(self, name, value):
+        # مثل cursor.itersize في iter_rows
+        setattr(self._cursor, name, value)
+    
+    def _timed(self, method, *args, rows=None):
+        start = time.perf_counter()
+        try:
+            result = getattr(self._cursor, method)(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if self._stats is not None:
+                self._stats['seconds'] += elapsed
+            if self._profile is not None:
+                _notify(self._profile.add, elapsed)
+        return result
+    
+    def _count_rows(self, count):
+        if self._stats is not None:
+            self._stats['rows'] += count
+        if self._profile is not None:
+            _notify(self._profile.add, 0.0, count)
+    
+    def _statement(self, args, many):
+        self._finish_profile()
+        if self._stats is not None:
+            self._stats['statements'] += 1
+        if self._observer is not None:
+            object.__setattr__(self, '_profile', _notify(
+                lambda: self._observer(_query_text(self._cursor, args[0]),
+                                       args[1] if len(args) > 1 else (), many)))
+    
+    def _finish_profile(self):
+        if self._profile is not None:
+            profile = self._profile
+            object.__setattr__(self, '_profile', None)
+            _notify(profile.finish)
+    
+    def execute(self, *args):
+        self._statement(args, many=False)
+        self._timed('execute', *args)
+        return self
+    
+    def executemany(self, *args):
+        self._statement(args, many=True)
+        self._timed('executemany', *args)
+        return self
+    
+    def fetchone(self):
+        row = self._timed('fetchone')
+        if row is not None:
+            self._count_rows(1)
+        return row
+    
+    def fetchmany(self, *args):
+        rows = self._timed('fetchmany', *args)
+        self._count_rows(len(rows))
+        return rows
+    
+    def fetchall(self):
+        rows = self._timed('fetchall')
+        self._count_rows(len(rows))
+        return rows
+    
+    def __iter__(self):
+        for row in self._cursor:
+            self._count_rows(1)
+            yield row
+    
+    def close(self):
+        self._finish_profile()
+        self._cursor.close()
+    
+    def __del__(self):
+        # العبارة الأخيرة تُسجل عند التخلص من المؤشر إذا لم يُغلق صراحة
+        try:
+            self._finish_profile()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """مجمع اتصالات آمن للخيوط مع فحص الصحة وإخلاء الاتصالات الخاملة
+    
+    - min_size: عدد الاتصالات التي تبقى مفتوحة مهما طال خمولها
+    - max_size: الحد الأقصى للاتصالات المفتوحة (المستخدمة + الخاملة)
+    - timeout: مدة انتظار اتصال متاح عند امتلاء المجمع قبل رفع PoolTimeout
+    - idle_timeout: إغلاق الاتصالات الخاملة لأكثر من هذه المدة (بالثواني)
+    - health_check_interval: فحص الاتصال بـ SELECT 1 إذا خمل أكثر من هذه المدة
+    """
+    
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0,
+                 idle_timeout=300.0, health_check_interval=30.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError('إعدادات غير صالحة لحجم مجمع الاتصالات')
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
         
-        conn.commit()
-        print(f"✅ تم إنشاء قاعدة البيانات بنجاح ({'PostgreSQL' if USE_POSTGRES else 'SQLite'})")
+        self._idle = deque()  # (raw, last_used) - الأحدث في اليمين
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+    
+    @property
+    def size(self):
+        """عدد الاتصالات المفتوحة حالياً"""
+        return self._size
+    
+    @property
+    def idle_count(self):
+        """عدد الاتصالات الخاملة في المجمع"""
+        return len(self._idle)
+    
+    def acquire(self, request_scoped=False):
+        """الحصول على اتصال من المجمع أو فتح اتصال جديد"""
+        deadline = time.monotonic() + self.timeout
+        
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout('مجمع الاتصالات مغلق')
+                
+                self._evict_idle_locked()
+                
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    create = False
+                    break
+                
+                if self._size < self.max_size:
+                    self._size += 1
+                    raw, last_used = None, None
+                    create = True
+                    break
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f'لا يوجد اتصال متاح خلال {self.timeout} ثانية '
+                        f'(الحد الأقصى {self.max_size})'
+                    )
+                self._cond.wait(remaining)
         
+        if not create and not self._is_healthy(raw, last_used):
+            # الاتصال معطوب: نغلقه ونفتح بديلاً عنه في نفس الخانة
+            _close_quietly(raw)
+            create = True
+        
+        if create:
+            try:
+                raw = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        
+        return PooledConnection(self, raw, request_scoped=request_scoped)
+    
+    def release(self, raw):
+        """إعادة اتصال خام للمجمع بعد إنهاء أي معاملة مفتوحة"""
+        healthy = True
+        try:
+            raw.rollback()
+        except Exception:
+            healthy = False
+        
+        with self._cond:
+            if healthy and not self._closed:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._size -= 1
+                _close_quietly(raw)
+            self._cond.notify()
+    
+    def close_all(self):
+        """إغلاق جميع الاتصالات الخاملة ومنع إصدار اتصالات جديدة"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                raw, _ = self._idle.popleft()
+                self._size -= 1
+                _close_quietly(raw)
+            self._cond.notify_all()
+    
+    def _evict_idle_locked(self):
+        """إغلاق الاتصالات الخاملة القديمة مع الإبقاء على min_size"""
+        now = time.monotonic()
+        while (self._idle and self._size > self.min_size
+               and now - self._idle[0][1] > self.idle_timeout):
+            raw, _ = self._idle.popleft()
+            self._size -= 1
+            _close_quietly(raw)
+    
+    def _is_healthy(self, raw, last_used):
+        """فحص صحة الاتصال إذا خمل أكثر من health_check_interval"""
+        if getattr(raw, 'closed', False):
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cursor = raw.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            raw.rollback()
+            return True
+        except Exception:
+            return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+_replica_pool = None
+
+
+def _new_pool(connect):
+    """مجمع جديد بإعدادات متغيرات البيئة"""
+    return ConnectionPool(
+        connect,
+        min_size=int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+        max_size=int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        idle_timeout=float(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300)),
+        health_check_interval=float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+    )
+
+
+def get_pool():
+    """مجمع الاتصالات المشترك - يُنشأ عند أول استخدام من متغيرات البيئة"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _new_pool(_connect)
+    return _pool
+
+
+def get_replica_pool():
+    """مجمع اتصالات نسخة القراءة، أو None إذا لم يُضبط DATABASE_REPLICA_URL"""
+    global _replica_pool
+    if not DATABASE_REPLICA_URL:
+        return None
+    if _replica_pool is None:
+        with _pool_lock:
+            if _replica_pool is None:
+                _replica_pool = _new_pool(_connect_replica)
+    return _replica_pool
+
+
+def close_pool():
+    """إغلاق المجمعات المشتركة (عند إيقاف التطبيق أو تغيير الإعدادات)"""
+    global _pool, _replica_pool
+    with _pool_lock:
+        for pool in (_pool, _replica_pool):
+            if pool is not None:
+                pool.close_all()
+        _pool = None
+        _replica_pool = None
+
+
+def _discard_pool_after_fork():
+    """التخلص من المجمع الموروث في العملية الابنة بعد fork
+    
+    الاتصالات الموروثة تشارك مقابس العملية الأم، لذلك لا تُغلق هنا (إغلاقها يقطع
+    اتصالات الأم) بل يُترك المجمع ليُنشأ من جديد عند أول استخدام في العملية الابنة.
+    """
+    global _pool, _replica_pool, _pool_lock, _statements_lock
+    _pool = None
+    _replica_pool = None
+    _pool_lock = threading.Lock()
+    _statements_lock = threading.Lock()
+    _statements_by_connection.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_discard_pool_after_fork)
+
+
+def get_db_connection():
+    """الحصول على اتصال قاعدة البيانات من المجمع
+    
+    داخل طلب Flask يُعاد نفس الاتصال لكل استدعاءات الطلب ويُعاد للمجمع عند نهايته،
+    وخارج الطلب يُعاد الاتصال للمجمع عند استدعاء close().
+    """
+    if has_app_context():
+        conn = g.get('_db_conn')
+        if conn is None:
+            conn = get_pool().acquire(request_scoped=True)
+            g._db_conn = conn
+        return conn
+    return get_pool().acquire()
+
+
+def _reads_from_primary():
+    """هل يجب أن يقرأ هذا الطلب من الخادم الرئيسي؟
+    
+    طلبات الكتابة دائماً، وكذلك طلبات القراءة خلال REPLICA_STICKY_SECONDS بعد
+    آخر كتابة من نفس الجلسة (مثل صفحة القائمة بعد إعادة التوجيه من نموذج الإضافة)
+    حتى يرى المستخدم ما كتبه قبل وصوله للنسخة.
+    """
+    if not has_request_context() or request.method not in _READ_ONLY_METHODS:
+        return True
+    return session.get('_read_primary_until', 0) > time.time()
+
+
+def get_read_connection():
+    """اتصال للاستعلامات فقط: من نسخة القراءة إن وُجدت، وإلا من الخادم الرئيسي"""
+    replica_pool = get_replica_pool()
+    if replica_pool is None or _reads_from_primary():
+        return get_db_connection()
+    if has_app_context():
+        conn = g.get('_db_read_conn')
+        if conn is None:
+            conn = replica_pool.acquire(request_scoped=True)
+            g._db_read_conn = conn
+        return conn
+    return replica_pool.acquire()
+
+
+def _mark_write_for_stickiness(response):
+    """تثبيت قراءات الجلسة على الخادم الرئيسي بعد طلب كتابة"""
+    if request.method not in _READ_ONLY_METHODS:
+        session['_read_primary_until'] = time.time() + REPLICA_STICKY_SECONDS
+    return response
+
+
+def _release_request_connection(exc=None):
+    """إعادة اتصالات الطلب للمجمع عند انتهاء سياق التطبيق"""
+    for key in ('_db_conn', '_db_read_conn'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn.release()
+
+
+def init_app(app):
+    """ربط مجمع الاتصالات بدورة حياة طلبات Flask"""
+    app.teardown_appcontext(_release_request_connection)
+    if DATABASE_REPLICA_URL:
+        app.after_request(_mark_write_for_stickiness)
+
+
+def is_postgres(conn):
+    """هل الاتصال (أو غلافه من المجمع) اتصال PostgreSQL؟"""
+    raw = getattr(conn, 'raw', conn)
+    return not isinstance(raw, sqlite3.Connection)
+
+
+def adapt_query(conn, query):
+    """تحويل علامات المعاملات '?' إلى '%s' عند استخدام PostgreSQL
+    
+    تُضاعف علامة '%' الحرفية (مثل LIKE '%x%') لأن psycopg2 يعاملها كعلامة معامل،
+    لذلك يجب تمرير params (ولو فارغة) مع الاستعلام المحوَّل.
+    """
+    if is_postgres(conn):
+        return query.replace('%', '%%').replace('?', '%s')
+    return query
+
+
+def iter_rows(conn, query, params=(), chunk_size=1000):
+    """قراءة نتائج استعلام على دفعات دون تحميلها كلها في الذاكرة
+    
+    يستخدم مؤشراً مسمى من جهة الخادم في PostgreSQL و fetchmany في SQLite،
+    ويعيد كل دفعة كقائمة صفوف.
+    """
+    if is_postgres(conn):
+        cursor = conn.cursor(name=f'stream_{uuid.uuid4().hex}')
+        cursor.itersize = chunk_size
+    else:
+        cursor = conn.cursor()
+    try:
+        cursor.execute(adapt_query(conn, query), params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def row_values(row):
+    """قيم الصف بالترتيب (sqlite3.Row أو RealDictRow)"""
+    return list(row.values()) if isinstance(row, dict) else list(row)
+
+
+# سجل الاستعلامات المسماة: الاسم -> (SQL بعلامات '?'، معاملات نموذجية لأمر explain)
+QUERIES = {}
+
+# العبارات المجهزة لكل اتصال خام: id(raw) -> أسماء الاستعلامات
+# (اتصالات sqlite3 لا تدعم weakref، وتُحذف المدخلات عند إغلاق الاتصال في _close_quietly)
+_statements_by_connection = {}
+_statement_stats = {}
+_statements_lock = threading.Lock()
+
+
+def register_query(name, query, sample_params=None):
+    """تسجيل استعلام باسم ثابت ليُجهَّز مرة واحدة لكل اتصال
+    
+    sample_params قيم تجريبية يستخدمها أمر explain (الافتراضي NULL لكل معامل).
+    """
+    existing = QUERIES.get(name)
+    if existing is not None and existing[0] != query:
+        raise ValueError(f'الاستعلام المسمى {name} مسجل مسبقاً بنص مختلف')
+    if sample_params is None:
+        sample_params = (None,) * query.count('?')
+    QUERIES[name] = (query, tuple(sample_params))
+    return name
+
+
+# الجداول التي تتتبع data_versions تعديلاتها (نفس قائمة الترحيل 7)
+VERSIONED_TABLES = ('students', 'teachers', 'halaqat', 'attendance', 'donations')
+
+register_query('data_versions.all', 'SELECT name, version FROM data_versions ORDER BY name')
+register_query('data_versions.bump', 'UPDATE data_versions SET version = version + 1 WHERE name = ?',
+               ('students',))
+
+
+def bump_data_version(conn, *tables):
+    """تقديم إصدار بيانات الجداول المعدلة (لا يُنفذ commit - يُستدعى داخل معاملة الكتابة)"""
+    for table in tables:
+        if table not in VERSIONED_TABLES:
+            raise ValueError(f'الجدول {table} غير متتبع في data_versions')
+        execute_named(conn, 'data_versions.bump', (table,))
+
+
+def data_version(conn):
+    """طابع إصدار البيانات: إصدارات الجداول المتتبعة بترتيب أسمائها
+
+    كل إصدار يزداد فقط، فالطابع الأحدث أكبر من الأقدم في مقارنة الصفوف (tuple).
+    """
+    return tuple(row['version'] for row in execute_named(conn, 'data_versions.all').fetchall())
+
+
+def _prepared_name(name):
+    """اسم صالح للعبارة المجهزة في PostgreSQL"""
+    return 'q_' + re.sub(r'\W', '_', name)
+
+
+def _to_numbered_params(query):
+    """تحويل '?' إلى $1, $2 ... لعبارة PREPARE"""
+    counter = iter(range(1, query.count('?') + 1))
+    return re.sub(r'\?', lambda _: f'${next(counter)}', query)
+
+
+def _forget_statements(raw):
+    with _statements_lock:
+        _statements_by_connection.pop(id(raw), None)
+
+
+def _forget_statement(raw, name):
+    """إلغاء تسجيل عبارة واحدة فشل تجهيزها - العبارات الأخرى تبقى على الخادم
+    (العبارات المجهزة في PostgreSQL للجلسة كلها ولا تُلغى بالتراجع عن المعاملة)"""
+    with _statements_lock:
+        _statements_by_connection.get(id(raw), set()).discard(name)
+
+
+def _mark_prepared(raw, name):
+    """تسجيل استخدام الاستعلام على الاتصال - يعيد True إذا كان مجهزاً من قبل (إصابة)"""
+    with _statements_lock:
+        prepared = _statements_by_connection.setdefault(id(raw), set())
+        hit = name in prepared
+        prepared.add(name)
+        stats = _statement_stats.setdefault(name, {'hits': 0, 'misses': 0})
+        stats['hits' if hit else 'misses'] += 1
+    return hit
+
+
+def execute_named(conn, name, params=()):
+    """تنفيذ استعلام مسجل بالاسم وإعادة المؤشر
+    
+    في PostgreSQL يُجهَّز الاستعلام بـ PREPARE عند أول استخدام على الاتصال ثم يُنفذ
+    بـ EXECUTE فلا يُعاد تحليله وتخطيطه. في SQLite يعاد استخدام العبارة المترجمة من
+    ذاكرة cached_statements لأن نص الاستعلام ثابت.
+    """
+    query = QUERIES[name][0]
+    raw = getattr(conn, 'raw', conn)
+    hit = _mark_prepared(raw, name)
+    cursor = conn.cursor()
+    
+    if not is_postgres(conn):
+        cursor.execute(query, params)
+        return cursor
+    
+    statement = _prepared_name(name)
+    if not hit:
+        try:
+            cursor.execute(f'PREPARE {statement} AS {_to_numbered_params(query)}')
+        except Exception:
+            _forget_statement(raw, name)
+            raise
+    if params:
+        cursor.execute(f'EXECUTE {statement} ({", ".join(["%s"] * len(params))})', params)
+    else:
+        cursor.execute(f'EXECUTE {statement}')
+    return cursor
+
+
+def statement_cache_stats():
+    """عدادات الإصابة والإخفاق لكل استعلام مسمى مع المجموع"""
+    with _statements_lock:
+        by_query = {name: dict(stats) for name, stats in _statement_stats.items()}
+    hits = sum(s['hits'] for s in by_query.values())
+    misses = sum(s['misses'] for s in by_query.values())
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits * 100.0 / (hits + misses), 1) if hits + misses else 0,
+        'queries': by_query,
+    }
+
+
+
+def _create_base_schema(conn, cursor):
+    """الإصدار 1: الجداول الأساسية حسب نوع قاعدة البيانات"""
+    USE_POSTGRES = is_postgres(conn)
+    
+    if USE_POSTGRES:
+        # PostgreSQL Tables
+
+        # جدول المعلمين
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS teachers (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                gender VARCHAR(20) NOT NULL,
+                phone VARCHAR(20),
+                email VARCHAR(255),
+                qualification TEXT,
+                specialization TEXT,
+                experience_years INTEGER DEFAULT 0,
+                salary DECIMAL(10,2),
+                status VARCHAR(20) DEFAULT 'نشط',
+                hire_date DATE,
+                notes TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # جدول الحلقات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS halaqat (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                type VARCHAR(50) NOT NULL,
+                teacher_id INTEGER,
+                teacher_name VARCHAR(255) NOT NULL,
+                location VARCHAR(255) NOT NULL,
+                max_capacity INTEGER DEFAULT 30,
+                schedule_days TEXT,
+                start_time TIME,
+                end_time TIME,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE SET NULL
+            )
+        ''')
+
+        # جدول الطلاب
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS students (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                age INTEGER NOT NULL,
+                gender VARCHAR(20) NOT NULL,
+                phone VARCHAR(20),
+                email VARCHAR(255),
+                guardian_name VARCHAR(255) NOT NULL,
+                guardian_phone VARCHAR(20) NOT NULL,
+                halaqa_id INTEGER,
+                memorization_level VARCHAR(100),
+                enrollment_date DATE DEFAULT CURRENT_DATE,
+                status VARCHAR(20) DEFAULT 'نشط',
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (halaqa_id) REFERENCES halaqat(id) ON DELETE SET NULL
+            )
+        ''')
+
+        # جدول الحضور
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance (
+                id SERIAL PRIMARY KEY,
+                student_id INTEGER NOT NULL,
+                halaqa_id INTEGER NOT NULL,
+                attendance_date DATE NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                memorization_progress TEXT,
+                performance VARCHAR(20),
+                notes TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
+                FOREIGN KEY (halaqa_id) REFERENCES halaqat(id) ON DELETE CASCADE,
+                UNIQUE(student_id, attendance_date)
+            )
+        ''')
+
+        # جدول التبرعات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS donations (
+                id SERIAL PRIMARY KEY,
+                donor_name VARCHAR(255) NOT NULL,
+                donor_phone VARCHAR(20),
+                donor_email VARCHAR(255),
+                amount DECIMAL(10,2) NOT NULL,
+                donation_date DATE NOT NULL,
+                allocation VARCHAR(100),
+                halaqa_id INTEGER,
+                notes TEXT,
+                status VARCHAR(20) DEFAULT 'مكتمل',
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (halaqa_id) REFERENCES halaqat(id) ON DELETE SET NULL
+            )
+        ''')
+
+        # جدول حملات جمع التبرعات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fundraising_campaigns (
+                id SERIAL PRIMARY KEY,
+                campaign_name VARCHAR(255) NOT NULL,
+                platform VARCHAR(100) NOT NULL,
+                target_amount DECIMAL(10,2) NOT NULL,
+                current_amount DECIMAL(10,2) DEFAULT 0,
+                target_audience TEXT,
+                campaign_description TEXT,
+                campaign_hashtags TEXT,
+                start_date DATE,
+                end_date DATE,
+                status VARCHAR(20) DEFAULT 'مخطط',
+                ai_suggestions TEXT,
+                best_posting_times TEXT,
+                created_by VARCHAR(100) DEFAULT 'النظام',
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    else:
+        # SQLite Tables (للتشغيل المحلي)
+
+        # جدول المعلمين
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS teachers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                gender TEXT NOT NULL,
+                phone TEXT,
+                email TEXT,
+                qualification TEXT,
+                specialization TEXT,
+                experience_years INTEGER DEFAULT 0,
+                salary DECIMAL(10,2),
+                status TEXT DEFAULT 'نشط',
+                hire_date DATE,
+                notes TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # جدول الحلقات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS halaqat (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL,
+                teacher_id INTEGER,
+                teacher_name TEXT NOT NULL,
+                location TEXT NOT NULL,
+                max_capacity INTEGER DEFAULT 30,
+                schedule_days TEXT,
+                start_time TEXT,
+                end_time TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (teacher_id) REFERENCES teachers (id)
+            )
+        ''')
+
+        # جدول الطلاب
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS students (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                age INTEGER NOT NULL,
+                gender TEXT NOT NULL,
+                phone TEXT,
+                email TEXT,
+                guardian_name TEXT NOT NULL,
+                guardian_phone TEXT NOT NULL,
+                halaqa_id INTEGER,
+                memorization_level TEXT,
+                enrollment_date DATE DEFAULT CURRENT_DATE,
+                status TEXT DEFAULT 'نشط',
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (halaqa_id) REFERENCES halaqat (id)
+            )
+        ''')
+
+        # جدول الحضور
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id INTEGER NOT NULL,
+                halaqa_id INTEGER NOT NULL,
+                attendance_date DATE NOT NULL,
+                status TEXT NOT NULL,
+                memorization_progress TEXT,
+                performance TEXT,
+                notes TEXT,
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (student_id) REFERENCES students (id),
+                FOREIGN KEY (halaqa_id) REFERENCES halaqat (id),
+                UNIQUE(student_id, attendance_date)
+            )
+        ''')
+
+        # جدول التبرعات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS donations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                donor_name TEXT NOT NULL,
+                donor_phone TEXT,
+                donor_email TEXT,
+                amount DECIMAL(10,2) NOT NULL,
+                donation_date DATE NOT NULL,
+                allocation TEXT,
+                halaqa_id INTEGER,
+                notes TEXT,
+                status TEXT DEFAULT 'مكتمل',
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (halaqa_id) REFERENCES halaqat (id)
+            )
+        ''')
+
+        # جدول حملات جمع التبرعات
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fundraising_campaigns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                campaign_name TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                target_amount DECIMAL(10,2) NOT NULL,
+                current_amount DECIMAL(10,2) DEFAULT 0,
+                target_audience TEXT,
+                campaign_description TEXT,
+                campaign_hashtags TEXT,
+                start_date DATE,
+                end_date DATE,
+                status TEXT DEFAULT 'مخطط',
+                ai_suggestions TEXT,
+                best_posting_times TEXT,
+                created_by TEXT DEFAULT 'النظام',
+                created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    
+    # قواعد البيانات القديمة (halaqat.db) أنشئت بأسماء أعمدة مختلفة
+    _reconcile_columns(conn, cursor)
+
+
+# أعمدة المخطط القديم وما يقابلها في المخطط الموحد: (الجدول، الاسم القديم، الاسم الموحد)
+LEGACY_COLUMN_RENAMES = [
+    ('students', 'parent_phone', 'guardian_phone'),
+    ('students', 'join_date', 'enrollment_date'),
+    ('students', 'performance_level', 'memorization_level'),
+    ('attendance', 'date', 'attendance_date'),
+    ('attendance', 'created_at', 'created_date'),
+    ('donations', 'date', 'donation_date'),
+    ('donations', 'purpose', 'allocation'),
+]
+
+# أعمدة المخطط الموحد التي قد تنقص الجداول القديمة: (الجدول، العمود، نوع SQLite، نوع PostgreSQL)
+CANONICAL_COLUMNS = [
+    ('students', 'email', 'TEXT', 'VARCHAR(255)'),
+    ('students', 'guardian_name', "TEXT DEFAULT ''", "VARCHAR(255) DEFAULT ''"),
+    ('students', 'status', "TEXT DEFAULT 'نشط'", "VARCHAR(20) DEFAULT 'نشط'"),
+    ('students', 'created_date', 'TIMESTAMP', 'TIMESTAMP'),
+    # صفحات الحفظ والمراجعة التي تعرضها قائمة الطلاب وصفحة تعديل الطالب
+    ('students', 'memorization_pages', 'INTEGER DEFAULT 0', 'INTEGER DEFAULT 0'),
+    ('students', 'revision_pages', 'INTEGER DEFAULT 0', 'INTEGER DEFAULT 0'),
+    ('halaqat', 'teacher_id', 'INTEGER', 'INTEGER'),
+    ('attendance', 'halaqa_id', 'INTEGER', 'INTEGER'),
+    ('attendance', 'memorization_progress', 'TEXT', 'TEXT'),
+    ('attendance', 'performance', 'TEXT', 'VARCHAR(20)'),
+    ('donations', 'donor_phone', 'TEXT', 'VARCHAR(20)'),
+    ('donations', 'donor_email', 'TEXT', 'VARCHAR(255)'),
+    ('donations', 'halaqa_id', 'INTEGER', 'INTEGER'),
+    ('donations', 'notes', 'TEXT', 'TEXT'),
+    ('donations', 'status', "TEXT DEFAULT 'مكتمل'", "VARCHAR(20) DEFAULT 'مكتمل'"),
+    ('donations', 'created_date', 'TIMESTAMP', 'TIMESTAMP'),
+]
+
+# تعبئة الأعمدة المضافة حديثاً من البيانات الموجودة
+_COLUMN_BACKFILLS = {
+    ('students', 'created_date'): 'UPDATE students SET created_date = enrollment_date',
+    ('attendance', 'halaqa_id'): '''
+        UPDATE attendance SET halaqa_id = (
+            SELECT s.halaqa_id FROM students s WHERE s.id = attendance.student_id
+        )
+    ''',
+    ('donations', 'created_date'): 'UPDATE donations SET created_date = donation_date',
+}
+
+
+def _table_columns(conn, cursor, table):
+    """أسماء أعمدة الجدول الحالية"""
+    if is_postgres(conn):
+        cursor.execute(
+            'SELECT column_name FROM information_schema.columns '
+            'WHERE table_schema = current_schema() AND table_name = %s', (table,))
+        return {row['column_name'] for row in cursor.fetchall()}
+    cursor.execute(f'PRAGMA table_info({table})')
+    return {row['name'] for row in cursor.fetchall()}
+
+
+def _reconcile_columns(conn, cursor):
+    """مواءمة الجداول الموجودة مع المخطط الموحد (إعادة تسمية الأعمدة القديمة وإضافة الناقصة)"""
+    postgres = is_postgres(conn)
+    columns = {}
+    for table, _, _, _ in CANONICAL_COLUMNS:
+        columns.setdefault(table, _table_columns(conn, cursor, table))
+    for table, _, _ in LEGACY_COLUMN_RENAMES:
+        columns.setdefault(table, _table_columns(conn, cursor, table))
+    
+    for table, old, new in LEGACY_COLUMN_RENAMES:
+        if old in columns[table] and new not in columns[table]:
+            cursor.execute(f'ALTER TABLE {table} RENAME COLUMN {old} TO {new}')
+            columns[table].discard(old)
+            columns[table].add(new)
+    
+    for table, column, sqlite_type, pg_type in CANONICAL_COLUMNS:
+        if column not in columns[table]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} '
+                           f'{pg_type if postgres else sqlite_type}')
+            columns[table].add(column)
+            if (table, column) in _COLUMN_BACKFILLS:
+                cursor.execute(_COLUMN_BACKFILLS[(table, column)])
+
+
+# ترحيلات المخطط المرقمة - كل إصدار يُطبق مرة واحدة ويُسجل في جدول schema_migrations
+# كل ترحيل إما قائمة عبارات SQL أو دالة (conn, cursor)
+MIGRATIONS = [
+    (1, 'base_schema', _create_base_schema),
+    (2, 'hot_query_indexes', [
+        # attendance(): عدّ الحاضرين/الغائبين ليوم محدد، get_attendance(): سجلات اليوم
+        'CREATE INDEX IF NOT EXISTS idx_attendance_date_status ON attendance (attendance_date, status)',
+        # تقارير الحلقة عبر فترة زمنية
+        'CREATE INDEX IF NOT EXISTS idx_attendance_halaqa_date ON attendance (halaqa_id, attendance_date)',
+        # halaqa_details() مرتبة بالاسم، وعدّ طلاب الحلقة في الربط مع halaqat
+        'CREATE INDEX IF NOT EXISTS idx_students_halaqa_name ON students (halaqa_id, name)',
+        # teacher_details()
+        'CREATE INDEX IF NOT EXISTS idx_halaqat_teacher_name ON halaqat (teacher_name)',
+        # export_data('donations') مرتبة بالتاريخ
+        'CREATE INDEX IF NOT EXISTS idx_donations_date ON donations (donation_date)',
+    ]),
+    (3, 'keyset_pagination_indexes', [
+        # ترقيم القوائم بالمؤشرات: (name, id) تصاعدياً و (created_date, id) تنازلياً
+        'CREATE INDEX IF NOT EXISTS idx_students_name_id ON students (name, id)',
+        'CREATE INDEX IF NOT EXISTS idx_teachers_name_id ON teachers (name, id)',
+        'CREATE INDEX IF NOT EXISTS idx_donations_created_id ON donations (created_date, id)',
+        'CREATE INDEX IF NOT EXISTS idx_campaigns_created_id ON fundraising_campaigns (created_date, id)',
+    ]),
+    (4, 'attendance_daily_summary', [
+        # ملخص يومي لكل حلقة يُحدَّث مع كل تسجيل حضور - التقارير تقرأ منه بدلاً من attendance
+        '''CREATE TABLE IF NOT EXISTS attendance_daily_summary (
+               attendance_date DATE NOT NULL,
+               halaqa_id INTEGER NOT NULL,
+               present INTEGER NOT NULL DEFAULT 0,
+               absent INTEGER NOT NULL DEFAULT 0,
+               late INTEGER NOT NULL DEFAULT 0,
+               total INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (attendance_date, halaqa_id)
+           )''',
+        # تعبئة أولية من السجلات الموجودة
+        '''INSERT INTO attendance_daily_summary (attendance_date, halaqa_id, present, absent, late, total)
+           SELECT attendance_date, halaqa_id,
+                  SUM(CASE WHEN status = 'حاضر' THEN 1 ELSE 0 END),
+                  SUM(CASE WHEN status = 'غائب' THEN 1 ELSE 0 END),
+                  SUM(CASE WHEN status = 'متأخر' THEN 1 ELSE 0 END),
+                  COUNT(*)
+           FROM attendance
+           WHERE halaqa_id IS NOT NULL
+           GROUP BY attendance_date, halaqa_id''',
+    ]),
+    # المخطط الموحد: students.email للنماذج وأي أعمدة ناقصة في قواعد البيانات الأقدم
+    (5, 'canonical_columns', _reconcile_columns),
+    (6, 'report_jobs', [
+        # مهام التقارير والتصدير في الخلفية (jobs.py) - النتيجة ملف في JOB_RESULTS_DIR
+        '''CREATE TABLE IF NOT EXISTS report_jobs (
+               id VARCHAR(32) PRIMARY KEY,
+               kind VARCHAR(50) NOT NULL,
+               params_key VARCHAR(64) NOT NULL,
+               params TEXT,
+               status VARCHAR(20) NOT NULL DEFAULT 'queued',
+               progress INTEGER NOT NULL DEFAULT 0,
+               result_path TEXT,
+               content_type VARCHAR(100),
+               filename VARCHAR(255),
+               error TEXT,
+               created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               finished_date TIMESTAMP
+           )''',
+        # مهمة واحدة فقط قيد التنفيذ لكل طلب متطابق - الطلب المكرر ينضم للمهمة القائمة
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_report_jobs_active_key
+           ON report_jobs (params_key) WHERE status IN ('queued', 'running')''',
+    ]),
+    (7, 'data_versions', [
+        # عداد تعديلات لكل جدول - يتقدم في نفس معاملة الكتابة ويُستخدم مفتاحاً لذاكرة التقارير
+        '''CREATE TABLE IF NOT EXISTS data_versions (
+               name VARCHAR(50) PRIMARY KEY,
+               version INTEGER NOT NULL DEFAULT 0
+           )''',
+    ] + [f"INSERT INTO data_versions (name, version) VALUES ('{table}', 0)"
+         for table in ('students', 'teachers', 'halaqat', 'attendance', 'donations')]),
+    (8, 'halaqa_student_counts', [
+        # عدد طلاب كل حلقة مخزن في الحلقة نفسها ويُعدَّل في معاملة إضافة الطالب أو نقله
+        # (adjust_halaqa_student_counts) - الصفحات تقرأ صفاً لكل حلقة بدلاً من ربطها بجدول الطلاب
+        'ALTER TABLE halaqat ADD COLUMN student_count INTEGER NOT NULL DEFAULT 0',
+        '''UPDATE halaqat
+           SET student_count = (SELECT COUNT(*) FROM students s WHERE s.halaqa_id = halaqat.id)''',
+    ]),
+    (9, 'halaqat_teacher_id', [
+        # ربط الحلقات القديمة بمعلميها بالرقم بدلاً من الاسم (أول معلم بنفس الاسم عند التكرار)
+        '''UPDATE halaqat
+           SET teacher_id = (SELECT MIN(t.id) FROM teachers t WHERE t.name = TRIM(halaqat.teacher_name))
+           WHERE teacher_id IS NULL''',
+        # teachers_list() و teacher_details(): حلقات المعلم بربط مساواة على teacher_id
+        'CREATE INDEX IF NOT EXISTS idx_halaqat_teacher_id_name ON halaqat (teacher_id, name)',
+    ]),
+    # أعمدة المخطط الموحد المضافة بعد الترحيل 5 (students.memorization_pages و revision_pages)
+    (10, 'student_page_counts', _reconcile_columns),
+    (11, 'created_date_backfill', [
+        # created_date المضاف بالترحيل 5 في SQLite بلا قيمة افتراضية فبقي NULL لكل صف أُدخل بعده
+        '''UPDATE students SET created_date = COALESCE(enrollment_date, CURRENT_TIMESTAMP)
+           WHERE created_date IS NULL''',
+        '''UPDATE donations SET created_date = COALESCE(donation_date, CURRENT_TIMESTAMP)
+           WHERE created_date IS NULL''',
+    ]),
+    (12, 'campaign_created_date_backfill', [
+        # مفتاح ترتيب صفحات الحملات (created_date, id): صف NULL لا تصله مقارنة المؤشر
+        '''UPDATE fundraising_campaigns SET created_date = COALESCE(start_date, CURRENT_TIMESTAMP)
+           WHERE created_date IS NULL''',
+    ]),
+]
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _applied_versions(cursor):
+    cursor.execute('SELECT version FROM schema_migrations')
+    return {row['version'] for row in cursor.fetchall()}
+
+
+def _record_migration(conn, cursor, version, name):
+    cursor.execute(adapt_query(conn, 'INSERT INTO schema_migrations (version, name) VALUES (?, ?)'),
+                   (version, name))
+
+
+# قفل استشاري في PostgreSQL يمنع تشغيل الترحيلات من عمليتين في نفس الوقت
+_MIGRATION_LOCK_ID = 720145
+
+
+def apply_migrations(conn):
+    """تطبيق الترحيلات غير المطبقة بالترتيب، كل ترحيل في معاملة مستقلة
+    
+    يُعاد فحص الإصدار داخل القفل (advisory lock في PostgreSQL و BEGIN IMMEDIATE
+    في SQLite) حتى لا يطبق مُشغّلان نفس الترحيل مرتين.
+    """
+    cursor = conn.cursor()
+    postgres = is_postgres(conn)
+    _ensure_migrations_table(cursor)
+    conn.commit()
+    
+    if postgres:
+        cursor.execute('SELECT pg_advisory_lock(%s)', (_MIGRATION_LOCK_ID,))
+    
+    applied = []
+    try:
+        for version, name, migration in MIGRATIONS:
+            if not postgres:
+                cursor.execute('BEGIN IMMEDIATE')
+            try:
+                if version in _applied_versions(cursor):
+                    conn.rollback()
+                    continue
+                if callable(migration):
+                    migration(conn, cursor)
+                else:
+                    for statement in migration:
+                        cursor.execute(statement)
+                _record_migration(conn, cursor, version, name)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append((version, name))
+    finally:
+        if postgres:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', (_MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied
+
+
+# أحدث إصدار للمخطط يتوقعه هذا الكود
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn=None):
+    """الإصدار المطبق حالياً في قاعدة البيانات (0 إذا لم تُطبق أي ترحيلات)"""
+    owns_connection = conn is None
+    if owns_connection:
+        conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT MAX(version) AS version FROM schema_migrations')
+        row = cursor.fetchone()
+        return (row['version'] or 0) if row else 0
+    except Exception:
+        conn.rollback()
+        return 0
+    finally:
+        if owns_connection:
+            conn.close()
+
+
+def check_schema_version():
+    """فحص سريع عند بدء التشغيل: هل قاعدة البيانات على أحدث إصدار؟"""
+    try:
+        current = get_schema_version()
+    except Exception as e:
+        print(f"⚠️  تعذر فحص إصدار قاعدة البيانات: {e}")
+        return False
+    if current < SCHEMA_VERSION:
+        print(f"⚠️  قاعدة البيانات على الإصدار {current} والمطلوب {SCHEMA_VERSION} - "
+              f"شغّل: python database_helper.py migrate")
+        return False
+    return True
+
+
+def migrate():
+    """تشغيل الترحيلات المعلقة (أمر يُشغّل مرة واحدة قبل تشغيل العمليات)"""
+    conn = get_db_connection()
+    try:
+        applied = apply_migrations(conn)
+        label = 'PostgreSQL' if is_postgres(conn) else 'SQLite'
+        if applied:
+            print(f"✅ تم ترحيل قاعدة البيانات ({label}) إلى الإصدار {SCHEMA_VERSION}")
+            for version, name in applied:
+                print(f"   ↳ تم تطبيق الترحيل {version}: {name}")
+        else:
+            print(f"✅ قاعدة البيانات ({label}) محدثة على الإصدار {SCHEMA_VERSION}")
+        return applied
+    finally:
+        conn.close()
+
+
+def init_database():
+    """تهيئة قاعدة البيانات حسب البيئة (تطبيق كل الترحيلات)"""
+    try:
+        return migrate()
     except Exception as e:
         print(f"❌ خطأ في إنشاء قاعدة البيانات: {e}")
+        return []
+
+
+
+ATTENDANCE_STATUSES = ('حاضر', 'غائب', 'متأخر')
+
+# أقصى عدد من المعاملات في عبارة IN واحدة (حد SQLite القديم 999)
+_IN_CHUNK_SIZE = 500
+
+_ATTENDANCE_UPSERT_SQL = '''
+    INSERT INTO attendance (student_id, halaqa_id, attendance_date, status, notes)
+    VALUES {values}
+    ON CONFLICT (student_id, attendance_date) DO UPDATE
+    SET halaqa_id = excluded.halaqa_id,
+        status = excluded.status,
+        notes = excluded.notes
+'''
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+_SUMMARY_SELECT_SQL = '''
+    SELECT attendance_date, halaqa_id,
+           SUM(CASE WHEN status = 'حاضر' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN status = 'غائب' THEN 1 ELSE 0 END),
+           SUM(CASE WHEN status = 'متأخر' THEN 1 ELSE 0 END),
+           COUNT(*)
+    FROM attendance
+'''
+
+_SUMMARY_INSERT_SQL = '''
+    INSERT INTO attendance_daily_summary (attendance_date, halaqa_id, present, absent, late, total)
+'''
+
+
+# تحديث ملخص يوم لحلقات محددة: {marks} علامات قائمة IN
+_SUMMARY_DELETE_SQL = '''
+    DELETE FROM attendance_daily_summary
+    WHERE attendance_date = ? AND halaqa_id IN ({marks})
+'''
+
+_SUMMARY_REFRESH_SQL = _SUMMARY_INSERT_SQL + _SUMMARY_SELECT_SQL + '''
+    WHERE attendance_date = ? AND halaqa_id IN ({marks})
+    GROUP BY attendance_date, halaqa_id
+'''
+
+
+def refresh_daily_summary(conn, attendance_date, halaqa_ids):
+    """إعادة حساب صفوف ملخص الحضور ليوم واحد وحلقات محددة (لا يُنفذ commit)"""
+    halaqa_ids = sorted(h for h in halaqa_ids if h is not None)
+    if not halaqa_ids:
+        return
+    cursor = conn.cursor()
+    for chunk in _chunks(halaqa_ids, _IN_CHUNK_SIZE):
+        marks = ', '.join('?' * len(chunk))
+        params = [attendance_date] + chunk
+        cursor.execute(adapt_query(conn, _SUMMARY_DELETE_SQL.format(marks=marks)), params)
+        cursor.execute(adapt_query(conn, _SUMMARY_REFRESH_SQL.format(marks=marks)), params)
+
+
+def rebuild_daily_summary(conn=None):
+    """إعادة بناء جدول ملخص الحضور بالكامل من جدول attendance"""
+    owns_connection = conn is None
+    if owns_connection:
+        conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('DELETE FROM attendance_daily_summary')
+        cursor.execute(_SUMMARY_INSERT_SQL + _SUMMARY_SELECT_SQL
+                       + ' WHERE halaqa_id IS NOT NULL GROUP BY attendance_date, halaqa_id')
+        cursor.execute('SELECT COUNT(*) AS total FROM attendance_daily_summary')
+        total = cursor.fetchone()['total']
+        bump_data_version(conn, 'attendance')
+        conn.commit()
+        print(f"✅ تم إعادة بناء ملخص الحضور اليومي ({total} صف)")
+        return total
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if owns_connection:
+            conn.close()
+
+
+register_query('halaqat.adjust_student_count',
+               'UPDATE halaqat SET student_count = student_count + ? WHERE id = ?', (0, 1))
+
+_RECOUNT_HALAQAT_SQL = '''
+    UPDATE halaqat
+    SET student_count = (SELECT COUNT(*) FROM students s WHERE s.halaqa_id = halaqat.id)
+    WHERE student_count <> (SELECT COUNT(*) FROM students s WHERE s.halaqa_id = halaqat.id)
+'''
+
+
+def adjust_halaqa_student_counts(conn, deltas):
+    """تعديل عداد طلاب الحلقات {halaqa_id: الفرق} في معاملة الكتابة الجارية (لا يُنفذ commit)
+    
+    الزيادة النسبية صحيحة مع الكتابات المتزامنة بخلاف إعادة العد، والترتيب الثابت
+    للحلقات يمنع الاقفال المتبادل بين معاملتين تعدلان نفس الحلقات في PostgreSQL.
+    """
+    for halaqa_id, delta in sorted((h, d) for h, d in deltas.items() if h is not None and d):
+        execute_named(conn, 'halaqat.adjust_student_count', (delta, halaqa_id))
+
+
+def recount_halaqa_students(conn=None):
+    """إعادة عد طلاب كل الحلقات وتصحيح العدادات المختلفة عن العدد الفعلي"""
+    owns_connection = conn is None
+    if owns_connection:
+        conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(_RECOUNT_HALAQAT_SQL)
+        fixed = cursor.rowcount
+        if fixed:
+            bump_data_version(conn, 'halaqat')
+        conn.commit()
+        print(f"✅ تم التحقق من عدادات طلاب الحلقات (تصحيح {fixed} حلقة)")
+        return fixed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if owns_connection:
+            conn.close()
+
+
+# طلاب الحلقة وسجلاتهم الحالية لليوم (تسجيل حضور حلقة كاملة)
+_HALAQA_STUDENTS_SQL = 'SELECT id FROM students WHERE halaqa_id = ?'
+_HALAQA_EXISTING_ATTENDANCE_SQL = '''
+    SELECT student_id, halaqa_id FROM attendance
+    WHERE attendance_date = ?
+      AND student_id IN (SELECT id FROM students WHERE halaqa_id = ?)
+'''
+# نفس البيانات لقائمة طلاب بالمعرفات: {marks} علامات قائمة IN
+_STUDENTS_HALAQA_SQL = 'SELECT id, halaqa_id FROM students WHERE id IN ({marks})'
+_EXISTING_ATTENDANCE_SQL = '''
+    SELECT student_id, halaqa_id FROM attendance
+    WHERE attendance_date = ? AND student_id IN ({marks})
+'''
+
+
+def bulk_upsert_attendance(conn, attendance_date, records, halaqa_id=None):
+    """تسجيل حضور مجموعة طلاب دفعة واحدة في معاملة قصيرة واحدة
+    
+    يعتمد على القيد UNIQUE(student_id, attendance_date) لتحديث السجلات الموجودة
+    بدلاً من حذفها، وعند تمرير halaqa_id تُرفض سجلات الطلاب من خارج الحلقة.
+    يعيد نتيجة لكل سجل بنفس ترتيب الإدخال: inserted أو updated أو rejected.
+    """
+    cursor = conn.cursor()
+    
+    # خريطة الطالب -> الحلقة في استعلام واحد للحلقة أو على دفعات للمعرفات
+    # existing: الطالب -> حلقة سجله الحالي لنفس اليوم (لتحديث ملخص الحلقة القديمة إن تغيرت)
+    student_halaqa = {}
+    existing = {}
+    if halaqa_id is not None:
+        cursor.execute(adapt_query(conn, _HALAQA_STUDENTS_SQL), (halaqa_id,))
+        student_halaqa = {row['id']: halaqa_id for row in cursor.fetchall()}
+        cursor.execute(adapt_query(conn, _HALAQA_EXISTING_ATTENDANCE_SQL), (attendance_date, halaqa_id))
+        existing = {row['student_id']: row['halaqa_id'] for row in cursor.fetchall()}
+    else:
+        ids = sorted({int(r.get('student_id')) for r in records
+                      if str(r.get('student_id') or '').isdigit()})
+        for chunk in _chunks(ids, _IN_CHUNK_SIZE):
+            marks = ', '.join('?' * len(chunk))
+            cursor.execute(adapt_query(conn, _STUDENTS_HALAQA_SQL.format(marks=marks)), chunk)
+            student_halaqa.update((row['id'], row['halaqa_id']) for row in cursor.fetchall())
+            cursor.execute(adapt_query(conn, _EXISTING_ATTENDANCE_SQL.format(marks=marks)),
+                           [attendance_date] + chunk)
+            existing.update((row['student_id'], row['halaqa_id']) for row in cursor.fetchall())
+    
+    results = []
+    rows = {}
+    for record in records:
+        raw_id = record.get('student_id')
+        status = record.get('status', 'غائب')
+        result = {'student_id': raw_id, 'status': status}
+        results.append(result)
         
+        student_id = int(raw_id) if str(raw_id or '').isdigit() else None
+        if student_id is None:
+            result.update(result='rejected', message='رقم الطالب غير صالح')
+        elif status not in ATTENDANCE_STATUSES:
+            result.update(result='rejected', message=f'حالة الحضور "{status}" غير معروفة')
+        elif student_id not in student_halaqa:
+            result.update(result='rejected', message='الطالب غير موجود في الحلقة المحددة'
+                          if halaqa_id is not None else 'الطالب غير موجود')
+        elif student_halaqa[student_id] is None:
+            result.update(result='rejected', message='الطالب غير مسجل في أي حلقة')
+        else:
+            result['student_id'] = student_id
+            result['result'] = 'updated' if student_id in existing else 'inserted'
+            # آخر سجل للطالب في نفس الطلب هو المعتمد
+            rows[student_id] = (student_id, student_halaqa[student_id], attendance_date,
+                                status, record.get('notes', ''))
+    
+    if rows:
+        try:
+            if is_postgres(conn):
+                from psycopg2.extras import execute_values
+                execute_values(cursor, _ATTENDANCE_UPSERT_SQL.format(values='%s'),
+                               list(rows.values()), page_size=len(rows))
+            else:
+                cursor.executemany(_ATTENDANCE_UPSERT_SQL.format(values='(?, ?, ?, ?, ?)'),
+                                   list(rows.values()))
+            
+            # تحديث ملخص اليوم للحلقات المتأثرة في نفس المعاملة
+            touched = {row[1] for row in rows.values()}
+            touched.update(existing[sid] for sid in rows if sid in existing)
+            refresh_daily_summary(conn, attendance_date, touched)
+            bump_data_version(conn, 'attendance')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    return results
+
+
+def _load_query_registry():
+    """سجل الاستعلامات المسماة بعد استيراد الوحدات التي تسجلها
+    
+    عند التشغيل كـ python database_helper.py تكون هذه الوحدة __main__، بينما
+    تسجل الوحدات الأخرى استعلاماتها في الوحدة المستوردة database_helper.
+    """
+    import repositories  # noqa: F401
+    import attendance_analytics  # noqa: F401
+    import stats_service  # noqa: F401
+    import database_helper
+    return database_helper.QUERIES
+
+
+def _is_full_scan(plan_line):
+    """هل سطر الخطة مسح كامل للجدول بدون فهرس؟"""
+    if plan_line.startswith('SCAN ') and ' INDEX ' not in plan_line:
+        return True
+    return 'Seq Scan' in plan_line
+
+
+def _unregistered_plans():
+    """(الاسم، الاستعلام، معاملات تمثيلية) لعبارات المسارات الساخنة غير المسجلة بالاسم
+
+    استعلامات التصدير (بدون فلاتر، وبفلتر آخر 30 يوماً لحلقة) وعبارات تسجيل الحضور
+    وتحديث ملخصه - وهي التي تقرأ أكبر الجداول.
+    """
+    import report_builder
+    today = date.today()
+    month_ago = (today - timedelta(days=30)).isoformat()
+    today = today.isoformat()
+    plans = []
+    for report_type in sorted(report_builder.EXPORTS):
+        _, query, params = report_builder.export_query(report_type)
+        plans.append((f'export.{report_type}', query, params))
+        _, query, params = report_builder.export_query(report_type, month_ago, today, '1')
+        plans.append((f'export.{report_type}.filtered', query, params))
+    plans += [
+        ('attendance.bulk.halaqa_students', _HALAQA_STUDENTS_SQL, (1,)),
+        ('attendance.bulk.halaqa_existing', _HALAQA_EXISTING_ATTENDANCE_SQL, (today, 1)),
+        ('attendance.bulk.students_halaqa', _STUDENTS_HALAQA_SQL.format(marks='?, ?'), (1, 2)),
+        ('attendance.bulk.existing', _EXISTING_ATTENDANCE_SQL.format(marks='?, ?'), (today, 1, 2)),
+        ('attendance.bulk.upsert', _ATTENDANCE_UPSERT_SQL.format(values='(?, ?, ?, ?, ?)'),
+         (1, 1, today, ATTENDANCE_STATUSES[0], '')),
+        ('attendance_summary.refresh.delete', _SUMMARY_DELETE_SQL.format(marks='?, ?'), (today, 1, 2)),
+        ('attendance_summary.refresh.insert', _SUMMARY_REFRESH_SQL.format(marks='?, ?'), (today, 1, 2)),
+    ]
+    return plans
+
+
+def print_query_plans():
+    """طباعة خطة التنفيذ للاستعلامات المسماة وعبارات التصدير وتسجيل الحضور مع تمييز المسح الكامل"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    postgres = is_postgres(conn)
+    full_scans = 0
+    
+    registered = [(name, query, params) for name, (query, params) in sorted(_load_query_registry().items())]
+    try:
+        for name, query, params in registered + _unregistered_plans():
+            prefix = 'EXPLAIN ' if postgres else 'EXPLAIN QUERY PLAN '
+            cursor.execute(adapt_query(conn, prefix + query), params)
+            if postgres:
+                lines = [row['QUERY PLAN'] for row in cursor.fetchall()]
+            else:
+                lines = [row['detail'] for row in cursor.fetchall()]
+            
+            print(f"\n📋 {name}")
+            for line in lines:
+                if _is_full_scan(line.strip()):
+                    full_scans += 1
+                    print(f"   ⚠️  {line}")
+                else:
+                    print(f"   {line}")
     finally:
         conn.close()
+    
+    print(f"\n{'⚠️ ' if full_scans else '✅'} عدد عمليات المسح الكامل: {full_scans}")
+    return full_scans
+
+
+COMMANDS = {
+    'init': init_database,
+    'migrate': migrate,
+    'version': lambda: print(f"الإصدار الحالي: {get_schema_version()} / المطلوب: {SCHEMA_VERSION}"),
+    'explain': print_query_plans,
+    'settings': report_database_settings,
+    'rebuild-summary': rebuild_daily_summary,
+    'recount-halaqat': recount_halaqa_students,
+}
 
 if __name__ == '__main__':
-    init_database()
\ No newline at end of file
+    import sys
+    command = sys.argv[1] if len(sys.argv) > 1 else 'init'
+    if command not in COMMANDS:
+        print(f"❌ أمر غير معروف: {command} (المتاح: {', '.join(COMMANDS)})")
+        sys.exit(1)
+    COMMANDS[command]()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+إعدادات Gunicorn للإنتاج - عدد العمليات والخيوط من متغيرات البيئة
+
+    WEB_CONCURRENCY     عدد العمليات (الافتراضي: ضعف عدد الأنوية + 1)
+    WEB_THREADS         عدد الخيوط لكل عملية (الافتراضي: 4)
+    GRACEFUL_TIMEOUT    مهلة إنهاء الطلبات الجارية عند الإيقاف بالثواني (الافتراضي: 30)
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+# عند SIGTERM تتوقف العمليات عن قبول طلبات جديدة وتُكمل الجارية خلال هذه المهلة
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('WORKER_TIMEOUT', 60))
+keepalive = 5
+
+# تحميل التطبيق مرة واحدة في العملية الأم ثم نسخه للعمليات (أسرع وأقل ذاكرة)
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    # حذف نتائج المهام المنتهية صلاحيتها عند بدء التشغيل (وبعدها عند إنشاء المهام)
+    from jobs import expire_results
+    try:
+        expired = expire_results()
+        if expired:
+            print(f"🧹 حُذفت نتائج {expired} مهمة منتهية الصلاحية")
+    except Exception as e:
+        print(f"⚠️  تعذر تنظيف نتائج المهام القديمة: {e}")
+    # إغلاق اتصالات العملية الأم قبل إنشاء العمليات حتى لا تُورث مقابسها
+    from database_helper import close_pool
+    from metrics import clear_snapshots
+    close_pool()
+    clear_snapshots()
+
+
+def worker_exit(server, worker):
+    # إيقاف مهام الخلفية ثم إغلاق اتصالات المجمع بعد انتهاء آخر طلب في العملية
+    from database_helper import close_pool
+    from jobs import shutdown_workers
+    from metrics import METRICS_DIR, flush
+    from pdf_renderer import shutdown_pool
+    shutdown_workers()
+    shutdown_pool()
+    if METRICS_DIR:
+        # آخر مقاييس العملية قبل خروجها
+        flush()
+    close_pool()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+مهام الخلفية للتقارير والتصدير - مجمع خيوط محلي وجدول report_jobs للحالة والتقدم
+
+    REPORT_WORKERS      عدد المهام المنفذة بالتوازي في كل عملية (الافتراضي: 2)
+    JOB_RESULTS_DIR     مجلد ملفات النتائج (الافتراضي: job_results بجانب التطبيق)
+    JOB_STALE_SECONDS   مهمة لم تُحدَّث خلال هذه المدة تُعتبر منقطعة (الافتراضي: 900)
+    JOB_RESULT_TTL_SECONDS  مدة الاحتفاظ بملف النتيجة بعد اكتمال المهمة (الافتراضي: 86400)،
+                        بعدها يُحذف الملف وتصبح المهمة expired (التنزيل يعيد 410)
+
+الطلب المتطابق (نفس النوع والمعاملات) أثناء تنفيذ مهمة ينضم لها بدلاً من إنشاء
+مهمة جديدة، ويضمن ذلك فهرس فريد جزئي على params_key للمهام غير المنتهية.
+ملفات النتائج محلية، فعند تشغيل أكثر من خادم يجب أن يكون JOB_RESULTS_DIR مشتركاً.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import pdf_renderer
+import report_builder
+from database_helper import adapt_query, get_db_connection, get_read_connection
+from repositories import HalaqaRepository, JobRepository, StudentRepository
+
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+JOB_RESULTS_DIR = os.environ.get(
+    'JOB_RESULTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job_results'))
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 900))
+JOB_RESULT_TTL_SECONDS = float(os.environ.get('JOB_RESULT_TTL_SECONDS', 86400))
+# أقل مدة بين حملتي تنظيف للنتائج القديمة في نفس العملية (عند إنشاء المهام)
+JOB_SWEEP_INTERVAL = 300
+
+# معاملات كل نوع مع قيمها الافتراضية - تُوحَّد قبل حساب مفتاح إزالة التكرار
+JOB_PARAMS = {
+    'ai_report': {'report_type': 'weekly', 'time_period': 'current_week', 'halaqa_id': 'all'},
+    'export': {'report_type': None, 'date_from': None, 'date_to': None, 'halaqa_id': None},
+    'report_pack': {'report_type': 'monthly', 'time_period': 'last_month'},
+    'certificates': {'halaqa_id': None, 'student_ids': None, 'certificate_type': 'تقدير',
+                     'issue_date': None, 'merged': None},
+}
+
+# عدد الشهادات المنفصلة في كل مهمة رسم (الذاكرة: PDF_WORKERS × 2 × الدفعة × حجم الشهادة)
+CERTIFICATE_BATCH_SIZE = int(os.environ.get('CERTIFICATE_BATCH_SIZE', 25))
+# عدد الصفحات في كل ملف شهادات مدمج
+CERTIFICATE_MERGE_PAGES = int(os.environ.get('CERTIFICATE_MERGE_PAGES', 200))
+
+# أنواع التقارير التي تُحسب لكل حلقة في حزمة التقارير
+PACK_REPORT_TYPES = ('weekly', 'monthly', 'performance')
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _get_executor():
+    """مجمع الخيوط المشترك (يُنشأ عند أول مهمة)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS,
+                                               thread_name_prefix='report-job')
+    return _executor
+
+
+def shutdown_workers():
+    """إيقاف مجمع الخيوط دون انتظار - المهام المنتظرة تُلغى وتُعامل كمنقطعة"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _discard_executor_after_fork():
+    """خيوط المجمع لا تنتقل للعملية الابنة، لذلك يُنشأ مجمع جديد عند أول مهمة فيها"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_discard_executor_after_fork)
+
+
+def normalize_params(kind, params):
+    """معاملات المهمة المعروفة فقط مع القيم الافتراضية - يرفع ValueError لطلب غير صالح"""
+    if kind not in JOB_PARAMS:
+        raise ValueError(f'نوع المهمة غير معروف: {kind}')
+    params = params or {}
+    normalized = {}
+    for name, default in JOB_PARAMS[kind].items():
+        value = params.get(name)
+        if isinstance(value, (list, tuple)):
+            value = ','.join(str(item) for item in value)
+        # نص موحد حتى يتطابق halaqa_id=1 مع halaqa_id='1'
+        normalized[name] = str(value) if value not in (None, '') else default
+
+    if kind == 'export':
+        # التحقق من نوع التصدير والفلاتر قبل إنشاء المهمة
+        report_builder.export_query(**normalized)
+    if kind == 'report_pack' and normalized['report_type'] not in PACK_REPORT_TYPES:
+        raise ValueError(f"نوع تقرير الحزمة غير مدعوم: {normalized['report_type']}")
+    if kind == 'certificates':
+        if normalized['halaqa_id'] and not normalized['halaqa_id'].isdigit():
+            raise ValueError('رقم الحلقة غير صالح')
+        if normalized['student_ids']:
+            ids = sorted({int(i) for i in normalized['student_ids'].split(',') if i.strip().isdigit()})
+            if not ids:
+                raise ValueError('أرقام الطلاب غير صالحة')
+            normalized['student_ids'] = ','.join(str(i) for i in ids)
+        if normalized['issue_date']:
+            normalized['issue_date'] = date.fromisoformat(normalized['issue_date']).isoformat()
+        normalized['merged'] = '1' if normalized['merged'] in ('1', 'true', 'True', 'on') else None
+    return normalized
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"⚠️  تعذر حذف ملف النتيجة {path}: {e}")
+
+
+def expire_results():
+    """حذف ملفات النتائج الأقدم من JOB_RESULT_TTL_SECONDS وتعليم مهامها expired - يعيد عدد المهام
+
+    يُحذف أيضاً أي ملف قديم في JOB_RESULTS_DIR بلا مهمة مكتملة (مثل .part لمهمة انقطعت).
+    """
+    cutoff = datetime.now() - timedelta(seconds=JOB_RESULT_TTL_SECONDS)
+    cutoff_text = cutoff.strftime('%Y-%m-%d %H:%M:%S')
+    conn = get_db_connection()
+    try:
+        jobs = JobRepository(conn)
+        expired = jobs.expired_results(cutoff_text)
+        for job in expired:
+            if job['result_path']:
+                _remove_file(job['result_path'])
+        jobs.expire(cutoff_text, _now())
+    finally:
+        conn.close()
+
+    if os.path.isdir(JOB_RESULTS_DIR):
+        for entry in os.scandir(JOB_RESULTS_DIR):
+            if entry.is_file() and entry.stat().st_mtime < cutoff.timestamp():
+                _remove_file(entry.path)
+    return len(expired)
+
+
+def _sweep_if_due():
+    """تنظيف النتائج القديمة مرة كل JOB_SWEEP_INTERVAL على الأكثر - خطؤه لا يمنع إنشاء المهمة"""
+    global _last_sweep
+    if time.monotonic() - _last_sweep < JOB_SWEEP_INTERVAL:
+        return
+    _last_sweep = time.monotonic()
+    try:
+        expire_results()
+    except Exception as e:
+        print(f"⚠️  تعذر تنظيف نتائج المهام القديمة: {e}")
+
+
+def params_key(kind, params):
+    """مفتاح ثابت لنفس النوع والمعاملات (بغض النظر عن ترتيبها)"""
+    raw = json.dumps([kind, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _age_seconds(value):
+    """عمر الطابع الزمني بالثواني (SQLite يعيد نصاً و PostgreSQL يعيد datetime)"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (datetime.now() - value).total_seconds()
+
+
+def job_as_dict(row):
+    """حالة المهمة لصيغة JSON (بدون مسار الملف على الخادم)"""
+    job = dict(row)
+    job.pop('result_path', None)
+    job.pop('params_key', None)
+    job['params'] = json.loads(job['params']) if job.get('params') else {}
+    for key in ('created_date', 'updated_date', 'finished_date'):
+        if job.get(key) is not None:
+            job[key] = str(job[key])
+    return job
+
+
+def submit(kind, params=None):
+    """إنشاء مهمة أو الانضمام لمهمة متطابقة جارية
+
+    يعيد (المهمة، هل أُنشئت مهمة جديدة). يرفع ValueError لنوع أو معاملات غير صالحة.
+    """
+    params = normalize_params(kind, params)
+    key = params_key(kind, params)
+    _sweep_if_due()
+
+    conn = get_db_connection()
+    try:
+        jobs = JobRepository(conn)
+        existing = jobs.active(key)
+        if existing is not None and _age_seconds(existing['updated_date']) > JOB_STALE_SECONDS:
+            # مهمة توقفت عمليتها قبل أن تنتهي - تُغلق حتى لا تحجز المفتاح
+            jobs.fail(existing['id'], 'انقطعت المهمة قبل اكتمالها', _now())
+            existing = None
+        if existing is not None:
+            return existing, False
+
+        job_id = uuid.uuid4().hex
+        try:
+            jobs.add(job_id, kind, key, json.dumps(params, ensure_ascii=False), _now())
+        except Exception:
+            # طلب متزامن أنشأ نفس المهمة أولاً (الفهرس الفريد على params_key)
+            existing = jobs.active(key)
+            if existing is None:
+                raise
+            return existing, False
+        job = jobs.get(job_id)
+    finally:
+        conn.close()
+
+    _get_executor().submit(_run_job, job_id, kind, params)
+    return job, True
+
+
+def get_job(job_id):
+    conn = get_db_connection()
+    try:
+        return JobRepository(conn).get(job_id)
+    finally:
+        conn.close()
+
+
+def _result_path(job_id, extension):
+    os.makedirs(JOB_RESULTS_DIR, exist_ok=True)
+    return os.path.join(JOB_RESULTS_DIR, f'{job_id}.{extension}')
+
+
+def _write_atomically(path, chunks):
+    """كتابة الملف باسم مؤقت ثم نقله، فلا يُقرأ ملف نتيجة ناقص"""
+    partial = path + '.part'
+    with open(partial, 'w', encoding='utf-8', newline='') as output:
+        for chunk in chunks:
+            output.write(chunk)
+    os.replace(partial, path)
+
+
+def _run_ai_report(job_id, params, set_progress):
+    conn = get_read_connection()
+    try:
+        set_progress(10)
+        report = report_builder.get_ai_report(
+            conn, params['report_type'], params['time_period'], params['halaqa_id'])
+    finally:
+        conn.close()
+
+    path = _result_path(job_id, 'json')
+    _write_atomically(path, [json.dumps(report, ensure_ascii=False, default=str)])
+    filename = f'ai_report_{params["report_type"]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+    return path, 'application/json', filename
+
+
+def _run_export(job_id, params, set_progress):
+    headers, query, query_params = report_builder.export_query(**params)
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(adapt_query(conn, f'SELECT COUNT(*) AS total FROM ({query}) AS export_rows'),
+                       query_params)
+        total = cursor.fetchone()['total'] or 0
+        written = 0
+
+        def on_rows(count):
+            nonlocal written
+            written += count
+            if total:
+                set_progress(min(99, written * 100 // total))
+
+        path = _result_path(job_id, 'csv')
+        _write_atomically(path, report_builder.csv_chunks(conn, headers, query, query_params,
+                                                          on_rows=on_rows))
+    finally:
+        conn.close()
+
+    filename = f'{params["report_type"]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+    return path, 'text/csv; charset=utf-8', filename
+
+
+def _run_report_pack(job_id, params, set_progress):
+    """تقرير لكل حلقة مع تقرير عام، مرسومة بالتوازي في ملف ZIP واحد"""
+    conn = get_read_connection()
+    try:
+        targets = [('all', 'جميع الحلقات')]
+        targets += [(str(row['id']), row['name']) for row in HalaqaRepository(conn).options()]
+        reports = []
+        for i, (halaqa_id, _) in enumerate(targets, 1):
+            reports.append(report_builder.get_ai_report(
+                conn, params['report_type'], params['time_period'], halaqa_id))
+            set_progress(i * 40 // len(targets))
+    finally:
+        conn.close()
+
+    if pdf_renderer.pdf_available():
+        rendered, extension = pdf_renderer.render_many(reports), 'pdf'
+    else:
+        rendered, extension = (pdf_renderer.render_html(r).encode('utf-8') for r in reports), 'html'
+
+    def entries():
+        for i, ((_, name), data) in enumerate(zip(targets, rendered), 1):
+            yield f'{i:03d}_{name}.{extension}', data
+            set_progress(40 + i * 59 // len(targets))
+
+    path = _result_path(job_id, 'zip')
+    _write_zip(path, entries())
+
+    filename = f'reports_{params["report_type"]}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
+    return path, 'application/zip', filename
+
+
+def _write_zip(path, entries):
+    """كتابة (اسم، بايتات) في ملف ZIP مباشرة على القرص ثم نقله لمساره النهائي"""
+    partial = path + '.part'
+    # ملفات PDF مضغوطة أصلاً فتُخزن بدون ضغط إضافي
+    with zipfile.ZipFile(partial, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, data in entries:
+            archive.writestr(name.replace('/', '-'), data)
+    os.replace(partial, path)
+
+
+def _run_certificates(job_id, params, set_progress):
+    """شهادة لكل طالب في الحلقة أو القائمة المحددة، مرسومة بالتوازي في ملف ZIP
+
+    الافتراضي ملف PDF لكل طالب، ومع merged ملفات مدمجة من CERTIFICATE_MERGE_PAGES
+    صفحة (أسرع بكثير لأن الخط يُضمَّن مرة لكل ملف). الطلاب يُقرؤون دفعة بعد دفعة
+    وكل ملف يُكتب في الأرشيف فور رسمه، ولا يُرسل للمجمع إلا عدد محدود في نفس
+    الوقت، فالذاكرة ثابتة مهما كان عدد الطلاب.
+    """
+    student_ids = [int(i) for i in params['student_ids'].split(',')] if params['student_ids'] else None
+    issue_date = params['issue_date'] or date.today().isoformat()
+    merged = bool(params['merged'])
+    conn = get_read_connection()
+    try:
+        students = StudentRepository(conn)
+        total = students.count_for_certificates(params['halaqa_id'], student_ids)
+        if not total:
+            raise ValueError('لا يوجد طلاب مطابقون لإصدار الشهادات')
+
+        # (اسم الملف، عدد الشهادات) للملفات المرسلة للرسم ولم تُكتب بعد
+        order = deque()
+
+        def certificate(row):
+            return {
+                'name': row['name'],
+                'halaqa_name': row['halaqa_name'],
+                'teacher_name': row['teacher_name'],
+                'memorization_level': row['memorization_level'],
+                'certificate_type': params['certificate_type'],
+                'issue_date': issue_date,
+            }
+
+        def items():
+            rows = students.iter_for_certificates(params['halaqa_id'], student_ids)
+            if not merged:
+                for row in rows:
+                    order.append((f"{row['id']}_{row['name']}", 1))
+                    yield certificate(row)
+                return
+            group, files = [], 0
+            for row in rows:
+                group.append(certificate(row))
+                if len(group) == CERTIFICATE_MERGE_PAGES:
+                    files += 1
+                    order.append((f'certificates_{files:03d}', len(group)))
+                    yield group
+                    group = []
+            if group:
+                order.append((f'certificates_{files + 1:03d}', len(group)))
+                yield group
+
+        if pdf_renderer.pdf_available():
+            extension = 'pdf'
+            if merged:
+                rendered = pdf_renderer.render_many(items(), render=pdf_renderer.render_certificates)
+            else:
+                rendered = pdf_renderer.render_many(items(), render=pdf_renderer.render_certificate,
+                                                    batch_size=CERTIFICATE_BATCH_SIZE)
+        else:
+            extension = 'html'
+            render = pdf_renderer.render_certificates_html if merged else pdf_renderer.render_certificate_html
+            rendered = (render(item).encode('utf-8') for item in items())
+
+        def entries():
+            done = 0
+            for data in rendered:
+                name, count = order.popleft()
+                yield f'{name}.{extension}', data
+                done += count
+                set_progress(min(99, done * 100 // total))
+
+        path = _result_path(job_id, 'zip')
+        _write_zip(path, entries())
+    finally:
+        conn.close()
+
+    filename = f'certificates_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
+    return path, 'application/zip', filename
+
+
+JOB_HANDLERS = {
+    'ai_report': _run_ai_report,
+    'export': _run_export,
+    'report_pack': _run_report_pack,
+    'certificates': _run_certificates,
+}
+
+
+def _run_job(job_id, kind, params):
+    """تنفيذ المهمة في خيط المجمع وتسجيل الحالة والتقدم في report_jobs
+
+    تُقرأ البيانات من اتصال منفصل عن اتصال تحديث الحالة، لأن حفظ التقدم أثناء
+    القراءة بمؤشر الخادم في PostgreSQL يغلق المؤشر.
+    """
+    conn = get_db_connection()
+    jobs = JobRepository(conn)
+    last_progress = [0]
+
+    def set_progress(progress):
+        if progress > last_progress[0]:
+            last_progress[0] = progress
+            jobs.progress(job_id, progress, _now())
+
+    try:
+        jobs.start(job_id, _now())
+        path, content_type, filename = JOB_HANDLERS[kind](job_id, params, set_progress)
+        jobs.finish(job_id, path, content_type, filename, _now())
+    except Exception as e:
+        print(f"Job error ({kind} {job_id}): {e}")
+        try:
+            jobs.fail(job_id, str(e), _now())
+        except Exception as fail_error:
+            print(f"Job status error ({job_id}): {fail_error}")
+    finally:
+        conn.close()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+مقاييس الأداء لكل مسار بصيغة Prometheus النصية على /metrics
+
+لكل طلب: زمن الاستجابة، وعدد عبارات SQL، والصفوف المقروءة، والزمن المستغرق في
+قاعدة البيانات (من InstrumentedCursor في database_helper) مع تسمية المسار، إضافة
+للأخطاء التي تلتقطها المسارات وتعرضها برسالة flash بدلاً من رفعها.
+
+    METRICS_DIR            مجلد مشترك بين عمليات gunicorn: كل عملية تكتب لقطة من
+                           مقاييسها و /metrics يجمع اللقطات (بدونه تعرض كل عملية مقاييسها فقط)
+    METRICS_FLUSH_SECONDS  أقل مدة بين لقطتين لنفس العملية (الافتراضي: 5)
+
+مع ضبط ADMIN_TOKEN يتطلب /metrics الترويسة Authorization: Bearer <الرمز>
+(authorization في إعداد Prometheus)، وبدونه يجب ألا يُكشف الخادم خارج الشبكة الخاصة.
+"""
+
+import json
+import os
+import threading
+import time
+
+from flask import Response, g, message_flashed, request
+
+import admin_auth
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+# الاسم -> (النوع، الوصف، حدود فئات المدرج)
+METRICS = {
+    'http_requests_total': ('counter', 'عدد الطلبات حسب المسار والطريقة والحالة', None),
+    'http_request_duration_seconds': ('histogram', 'زمن الاستجابة بالثواني', LATENCY_BUCKETS),
+    'http_request_db_statements': ('histogram', 'عدد عبارات SQL في الطلب الواحد', STATEMENT_BUCKETS),
+    'http_request_db_seconds': ('histogram', 'الزمن المستغرق في قاعدة البيانات لكل طلب', LATENCY_BUCKETS),
+    'http_request_db_rows_total': ('counter', 'الصفوف المقروءة من قاعدة البيانات', None),
+    'http_handled_errors_total': ('counter', 'أخطاء التقطتها المسارات وعرضتها كرسالة للمستخدم', None),
+    'db_pool_connections': ('gauge', 'اتصالات المجمع المفتوحة', None),
+    'db_pool_idle_connections': ('gauge', 'اتصالات المجمع الخاملة', None),
+    'report_cache_requests_total': ('counter', 'طلبات ذاكرة التقارير حسب النتيجة', None),
+    'prepared_statement_requests_total': ('counter', 'تنفيذ الاستعلامات المسماة حسب تجهيزها مسبقاً', None),
+}
+
+_lock = threading.Lock()
+# (الاسم، التسميات) -> قيمة العداد، أو [الفئات التراكمية...، المجموع، العدد] للمدرج
+_samples = {}
+_last_flush = 0.0
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+def _inc(name, labels, amount=1):
+    _samples[(name, labels)] = _samples.get((name, labels), 0) + amount
+
+
+def _observe(name, labels, value):
+    buckets = METRICS[name][2]
+    sample = _samples.get((name, labels))
+    if sample is None:
+        sample = _samples[(name, labels)] = [0] * len(buckets) + [0.0, 0]
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            sample[i] += 1
+    sample[-2] += value
+    sample[-1] += 1
+
+
+def _route():
+    """قالب المسار ('/teacher/<int:teacher_id>') حتى لا تتضخم التسميات بالمعرفات"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def _start_timer():
+    g._metrics_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+        return response
+    duration = time.perf_counter() - started
+    db = g.get('db_stats') or {'statements': 0, 'rows': 0, 'seconds': 0.0}
+    route = _route()
+    with _lock:
+        _inc('http_requests_total', _labels(route=route, method=request.method,
+                                            status=str(response.status_code)))
+        by_route = _labels(route=route)
+        _observe('http_request_duration_seconds', by_route, duration)
+        _observe('http_request_db_statements', by_route, db['statements'])
+        _observe('http_request_db_seconds', by_route, db['seconds'])
+        _inc('http_request_db_rows_total', by_route, db['rows'])
+    if METRICS_DIR and time.monotonic() - _last_flush >= METRICS_FLUSH_SECONDS:
+        try:
+            flush()
+        except OSError as e:
+            print(f"⚠️  تعذر حفظ لقطة المقاييس: {e}")
+    return response
+
+
+def _record_flashed_error(sender, message, category, **extra):
+    if category == 'error':
+        with _lock:
+            _inc('http_handled_errors_total', _labels(route=_route()))
+
+
+def _collected():
+    """قيم هذه العملية من المجمع وذاكرات التقارير والعبارات (تُقرأ عند كل عرض أو لقطة)"""
+    from database_helper import get_pool, get_replica_pool, statement_cache_stats
+    from report_builder import report_cache_stats
+
+    samples = {}
+    for pool_name, pool in (('primary', get_pool()), ('replica', get_replica_pool())):
+        if pool is not None:
+            samples[('db_pool_connections', _labels(pool=pool_name))] = pool.size
+            samples[('db_pool_idle_connections', _labels(pool=pool_name))] = pool.idle_count
+    reports = report_cache_stats()
+    statements = statement_cache_stats()
+    for result in ('hits', 'misses'):
+        samples[('report_cache_requests_total', _labels(result=result))] = reports[result]
+        samples[('prepared_statement_requests_total', _labels(result=result))] = statements[result]
+    return samples
+
+
+def _snapshot():
+    with _lock:
+        samples = {key: list(value) if isinstance(value, list) else value
+                   for key, value in _samples.items()}
+    samples.update(_collected())
+    return samples
+
+
+def flush():
+    """كتابة لقطة مقاييس هذه العملية في METRICS_DIR (كتابة ذرية)"""
+    global _last_flush
+    _last_flush = time.monotonic()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+    payload = [[name, list(labels), value] for (name, labels), value in _snapshot().items()]
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def clear_snapshots():
+    """حذف لقطات التشغيل السابق (تُستدعى من gunicorn قبل إنشاء العمليات)"""
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return
+    for filename in os.listdir(METRICS_DIR):
+        if filename.endswith('.json'):
+            os.remove(os.path.join(METRICS_DIR, filename))
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _merge(total, name, labels, value):
+    current = total.get((name, labels))
+    if current is None:
+        total[(name, labels)] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        total[(name, labels)] = [a + b for a, b in zip(current, value)]
+    else:
+        total[(name, labels)] = current + value
+
+
+def _all_samples():
+    """مقاييس هذه العملية، مجموعة مع لقطات العمليات الأخرى عند ضبط METRICS_DIR
+
+    العدادات والمدرجات تُجمع من كل اللقطات (ومنها العمليات المنتهية فلا تتراجع القيم)،
+    أما المقاييس اللحظية (gauge) فمن العمليات الحية فقط.
+    """
+    if not METRICS_DIR:
+        return _snapshot()
+    flush()
+    total = {}
+    for filename in os.listdir(METRICS_DIR):
+        pid = filename[:-len('.json')]
+        if not filename.endswith('.json') or not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, filename), encoding='utf-8') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            continue
+        alive = _is_alive(int(pid))
+        for name, labels, value in payload:
+            if name in METRICS and (alive or METRICS[name][0] != 'gauge'):
+                _merge(total, name, tuple(tuple(pair) for pair in labels), value)
+    return total
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render():
+    """كل المقاييس بصيغة Prometheus النصية"""
+    samples = _all_samples()
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        series = sorted((labels, value) for (sample_name, labels), value in samples.items()
+                        if sample_name == name)
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            for bound, count in zip(buckets, value):
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value[-1]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {round(value[-2], 6)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _metrics_endpoint():
+    return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _discard_samples_after_fork():
+    """العملية الابنة تبدأ بمقاييس فارغة (لا ترث عدادات العملية الأم)"""
+    global _lock, _last_flush
+    _lock = threading.Lock()
+    _samples.clear()
+    _last_flush = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_discard_samples_after_fork)
+
+
+def init_app(app):
+    """قياس كل طلبات التطبيق وإضافة المسار /metrics"""
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    message_flashed.connect(_record_flashed_error, app)
+    endpoint = _metrics_endpoint
+    if admin_auth.is_configured():
+        endpoint = admin_auth.token_required(endpoint)
+    app.add_url_rule('/metrics', 'metrics', endpoint)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ترقيم الصفحات بالمؤشرات (keyset) - بدون OFFSET وبدون جلب كل الصفوف
+"""
+
+import base64
+import json
+
+from flask import request
+
+from database_helper import adapt_query, execute_named, is_postgres, register_query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values):
+    """تحويل قيم مفتاح آخر صف إلى رمز مؤشر نصي آمن للروابط"""
+    raw = json.dumps(list(values), ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """استرجاع قيم المفتاح من رمز المؤشر - يرفع ValueError إذا كان الرمز تالفاً"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError('رمز المؤشر غير صالح')
+    if not isinstance(values, list):
+        raise ValueError('رمز المؤشر غير صالح')
+    return values
+
+
+def clamp_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """حجم الصفحة المطلوب محصوراً بين 1 و MAX_PAGE_SIZE"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def estimate_count(conn, table):
+    """عدد تقريبي لصفوف الجدول (إحصائيات PostgreSQL أو COUNT في SQLite)"""
+    cursor = conn.cursor()
+    if is_postgres(conn):
+        cursor.execute('SELECT reltuples::bigint AS estimate FROM pg_class WHERE relname = %s', (table,))
+        row = cursor.fetchone()
+        # reltuples = -1 أو 0 قبل أول ANALYZE
+        if row and row['estimate'] and row['estimate'] > 0:
+            return int(row['estimate'])
+    cursor.execute(f'SELECT COUNT(*) AS total FROM {table}')
+    return cursor.fetchone()['total'] or 0
+
+
+class KeysetQuery:
+    """استعلام قائمة قابل للترقيم بالمؤشرات
+
+    - select: جزء SELECT ... FROM ... JOIN بدون WHERE أو ORDER BY
+    - keys: أزواج (تعبير SQL، اسم العمود في النتيجة) تحدد الترتيب، وآخرها فريد (مثل id)
+      ولا يكون أي منها NULL (شرط المؤشر لا يطابق NULL فلا تصل الصفحات لتلك الصفوف)
+    - group_by: عبارة GROUP BY اختيارية تأتي بعد شرط المؤشر
+    - descending: الترتيب تنازلي لكل المفاتيح
+    - count_table: الجدول المستخدم لتقدير العدد الكلي - يُحسب في الصفحة الأولى فقط ويُحمل
+      في المؤشر بعد قيم المفاتيح (COUNT في SQLite يمسح الجدول كاملاً)
+    - name: اسم لتسجيل نسختي الاستعلام (الصفحة الأولى وما بعد المؤشر) كاستعلامات مسماة
+    """
+
+    def __init__(self, select, keys, group_by='', descending=False, count_table=None, name=None):
+        self.select = select
+        self.keys = keys
+        self.group_by = group_by
+        self.descending = descending
+        self.count_table = count_table
+        self.name = name
+
+        # نص الاستعلام ثابت لكل نسخة (حجم الصفحة معامل) ليُجهَّز مرة واحدة
+        self.first_query = self._build(after=False)
+        self.after_query = self._build(after=True)
+        if name:
+            register_query(f'{name}.first', self.first_query, (DEFAULT_PAGE_SIZE + 1,))
+            register_query(f'{name}.after', self.after_query,
+                           (None,) * len(keys) + (DEFAULT_PAGE_SIZE + 1,))
+
+    def _build(self, after):
+        query = self.select
+        if after:
+            columns = ', '.join(expr for expr, _ in self.keys)
+            marks = ', '.join('?' for _ in self.keys)
+            operator = '<' if self.descending else '>'
+            query += f' WHERE ({columns}) {operator} ({marks})'
+
+        direction = 'DESC' if self.descending else 'ASC'
+        query += f' {self.group_by} ORDER BY ' + ', '.join(f'{expr} {direction}' for expr, _ in self.keys)
+        # صف إضافي لمعرفة وجود صفحة تالية
+        return query + ' LIMIT ?'
+
+    def page(self, conn, after=None, page_size=DEFAULT_PAGE_SIZE):
+        """جلب صفحة واحدة تبدأ بعد المؤشر after"""
+        params = []
+        total = None
+        if after:
+            values = decode_cursor(after)
+            if self.count_table:
+                total = values.pop() if values else None
+                if not isinstance(total, int):
+                    raise ValueError('رمز المؤشر غير صالح')
+            if len(values) != len(self.keys) or None in values:
+                raise ValueError('رمز المؤشر غير صالح')
+            params.extend(values)
+        elif self.count_table:
+            total = estimate_count(conn, self.count_table)
+        params.append(page_size + 1)
+
+        if self.name:
+            cursor = execute_named(conn, f'{self.name}.{"after" if after else "first"}', params)
+        else:
+            cursor = conn.cursor()
+            cursor.execute(adapt_query(conn, self.after_query if after else self.first_query), params)
+        rows = cursor.fetchall()
+
+        has_more = len(rows) > page_size
+        items = rows[:page_size]
+        next_cursor = None
+        if has_more:
+            last = items[-1]
+            values = [last[column] for _, column in self.keys]
+            next_cursor = encode_cursor(values + [total] if self.count_table else values)
+
+        return {
+            'items': items,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'page_size': page_size,
+            'total_estimate': total,
+        }
+
+
+def paginate_request(conn, keyset_query):
+    """صفحة حسب معاملات الطلب ?after=<مؤشر>&per_page=<عدد>"""
+    page_size = clamp_page_size(request.args.get('per_page'))
+    after = request.args.get('after') or None
+    try:
+        return keyset_query.page(conn, after=after, page_size=page_size)
+    except ValueError:
+        # مؤشر تالف: العودة للصفحة الأولى
+        return keyset_query.page(conn, page_size=page_size)
+
+
+def page_as_json(page):
+    """تحويل الصفحة لصيغة قابلة للإرسال كـ JSON"""
+    return dict(page, items=[dict(row) for row in page['items']])
@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+تصدير التقارير بصيغة PDF مع تشكيل الحروف العربية واتجاه الكتابة من اليمين لليسار
+
+    PDF_FONT_PATH         خط TTF يدعم العربية (الافتراضي: أول خط متوفر من FONT_CANDIDATES)
+    PDF_FONT_BOLD_PATH    الخط العريض (الافتراضي: نظير الخط العادي إن وُجد، وإلا نفسه)
+    PDF_WORKERS           عدد عمليات الرسم المتوازية (الافتراضي: 2)
+    PDF_RENDER_TIMEOUT    أقصى مدة لرسم تقرير واحد بالثواني (الافتراضي: 60)
+
+المكتبات reportlab و arabic-reshaper و python-bidi اختيارية: بدونها أو بدون خط
+عربي يُصدَّر التقرير كصفحة HTML جاهزة للطباعة بدلاً من PDF.
+
+الرسم يتم في عمليات منفصلة (الرسم يحجز GIL) وكل عملية تُسجل الخطوط وتُجهز
+إعدادات الصفحة ومُشكِّل الحروف مرة واحدة ثم تعيد استخدامها لكل التقارير.
+"""
+
+import functools
+import io
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 2))
+PDF_RENDER_TIMEOUT = float(os.environ.get('PDF_RENDER_TIMEOUT', 60))
+
+# خطوط شائعة تحتوي الحروف العربية (Debian/Ubuntu ثم macOS ثم Windows)
+FONT_CANDIDATES = [
+    '/usr/share/fonts/truetype/noto/NotoNaskhArabic-Regular.ttf',
+    '/usr/share/fonts/truetype/fonts-arabeyes/ae_AlMohanad.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/Library/Fonts/Arial Unicode.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+]
+
+FONT_NAME = 'ReportArabic'
+BOLD_FONT_NAME = 'ReportArabic-Bold'
+
+# حجم كل جزء عند بث الملف للمتصفح
+STREAM_CHUNK_SIZE = 64 * 1024
+
+REPORT_TYPE_NAMES = {
+    'weekly': 'تقرير أسبوعي',
+    'monthly': 'تقرير شهري',
+    'performance': 'تقرير أداء',
+    'allocation': 'خطة توزيع',
+}
+
+CERTIFICATE_ORG = 'نظام إدارة الحلقات القرآنية'
+
+FOOTER_NOTE = 'هذا تقرير تم توليده تلقائياً بواسطة نظام إدارة الحلقات القرآنية - جزاكم الله خيراً'
+
+
+def _font_paths():
+    """(الخط العادي، الخط العريض) أو (None, None) إذا لم يوجد خط عربي"""
+    regular = os.environ.get('PDF_FONT_PATH')
+    if not regular:
+        regular = next((path for path in FONT_CANDIDATES if os.path.exists(path)), None)
+    if not regular or not os.path.exists(regular):
+        return None, None
+
+    bold = os.environ.get('PDF_FONT_BOLD_PATH')
+    if not bold:
+        root, ext = os.path.splitext(regular)
+        for candidate in (root.replace('-Regular', '-Bold'), root + '-Bold', root + 'Bd'):
+            if candidate != root and os.path.exists(candidate + ext):
+                bold = candidate + ext
+                break
+    return regular, bold or regular
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_available():
+    """هل تتوفر مكتبات PDF وخط عربي؟ (يُفحص مرة واحدة لكل عملية)"""
+    try:
+        import reportlab  # noqa: F401
+        import arabic_reshaper  # noqa: F401
+        import bidi.algorithm  # noqa: F401
+    except ImportError:
+        print("⚠️  reportlab/arabic-reshaper/python-bidi not installed, exporting reports as HTML")
+        return False
+    if _font_paths()[0] is None:
+        print("⚠️  لم يُعثر على خط عربي (PDF_FONT_PATH)، سيُصدَّر التقرير كـ HTML")
+        return False
+    return True
+
+
+# ===== إعدادات الصفحة والخطوط (مرة واحدة لكل عملية) =====
+
+class _Layout:
+    """الخطوط المسجلة وأبعاد الصفحة ومُشكِّل الحروف - مشتركة بين كل التقارير"""
+
+    def __init__(self):
+        import arabic_reshaper
+        from bidi.algorithm import get_display
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        regular, bold = _font_paths()
+        pdfmetrics.registerFont(TTFont(FONT_NAME, regular))
+        pdfmetrics.registerFont(TTFont(BOLD_FONT_NAME, bold))
+
+        self.page_width, self.page_height = A4
+        self.margin = 50
+        self.right = self.page_width - self.margin
+        self.top = self.page_height - self.margin
+        self.bottom = self.margin + 20
+
+        # بدون الحروف المركبة (مثل لفظ الجلالة) لأن كثيراً من الخطوط لا تحتوي رموزها
+        self.reshaper = arabic_reshaper.ArabicReshaper(configuration={'support_ligatures': False})
+        self.get_display = get_display
+        self.string_width = pdfmetrics.stringWidth
+
+
+_layout = None
+_layout_lock = threading.Lock()
+
+
+def _get_layout():
+    global _layout
+    if _layout is None:
+        with _layout_lock:
+            if _layout is None:
+                _layout = _Layout()
+    return _layout
+
+
+@functools.lru_cache(maxsize=4096)
+def _shape(text):
+    """النص بترتيب العرض: وصل الحروف العربية ثم عكس الاتجاه (العناوين المتكررة تُحفظ)"""
+    layout = _get_layout()
+    return layout.get_display(layout.reshaper.reshape(text))
+
+
+@functools.lru_cache(maxsize=4096)
+def _word_width(word, font, size):
+    return _get_layout().string_width(_shape(word), font, size)
+
+
+def _wrap(text, font, size, width):
+    """تقسيم النص لأسطر بالترتيب المنطقي قبل عكس الاتجاه
+
+    التقسيم بعد get_display يعكس ترتيب الأسطر، لذلك يُقاس عرض كل كلمة مشكّلة
+    (الوصل داخل الكلمة فقط) ويُشكَّل كل سطر وحده عند الرسم.
+    """
+    space = _word_width(' ', font, size)
+    lines = []
+    for paragraph in str(text).splitlines() or ['']:
+        line, line_width = [], 0
+        for word in paragraph.split():
+            word_width = _word_width(word, font, size)
+            if line and line_width + space + word_width > width:
+                lines.append(' '.join(line))
+                line, line_width = [], 0
+            line_width += word_width + (space if line else 0)
+            line.append(word)
+        lines.append(' '.join(line))
+    return lines
+
+
+class _PdfWriter:
+    """كتابة أسطر من اليمين لليسار مع الانتقال لصفحة جديدة عند امتلاء الصفحة"""
+
+    def __init__(self, title):
+        from reportlab.pdfgen.canvas import Canvas
+
+        self.layout = _get_layout()
+        self.buffer = io.BytesIO()
+        self.canvas = Canvas(self.buffer, pagesize=(self.layout.page_width, self.layout.page_height),
+                             pageCompression=1)
+        self.canvas.setTitle(title)
+        self.page = 1
+        self.y = self.layout.top
+
+    def _footer(self):
+        self.canvas.setFont(FONT_NAME, 9)
+        self.canvas.drawCentredString(self.layout.page_width / 2, self.layout.margin / 2,
+                                      _shape(f'صفحة {self.page}'))
+
+    def _ensure(self, height):
+        if self.y - height < self.layout.bottom:
+            self._footer()
+            self.canvas.showPage()
+            self.page += 1
+            self.y = self.layout.top
+
+    def text(self, text, size=11, bold=False, indent=0, center=False):
+        font = BOLD_FONT_NAME if bold else FONT_NAME
+        line_height = size * 1.6
+        width = self.layout.right - self.layout.margin - indent
+        for line in _wrap(text, font, size, width):
+            self._ensure(line_height)
+            self.canvas.setFont(font, size)
+            if center:
+                self.canvas.drawCentredString(self.layout.page_width / 2, self.y, _shape(line))
+            else:
+                self.canvas.drawRightString(self.layout.right - indent, self.y, _shape(line))
+            self.y -= line_height
+
+    def heading(self, text):
+        self.y -= 10
+        # العنوان لا يبقى وحده في أسفل الصفحة
+        self._ensure(60)
+        self.text(text, size=13, bold=True)
+        self.canvas.setLineWidth(0.5)
+        self.canvas.line(self.layout.margin, self.y + 8, self.layout.right, self.y + 8)
+        self.y -= 6
+
+    def space(self, height=8):
+        self.y -= height
+
+    def finish(self):
+        self._footer()
+        self.canvas.save()
+        return self.buffer.getvalue()
+
+
+def _money(value):
+    try:
+        return f'{float(value or 0):,.2f} ريال'
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def render_pdf(report):
+    """رسم التقرير (ناتج build_ai_report) كملف PDF وإعادة البايتات"""
+    title = report.get('title', 'تقرير')
+    pdf = _PdfWriter(title)
+
+    pdf.text(title, size=18, bold=True, center=True)
+    pdf.text(f"تاريخ التوليد: {report.get('generated_at', '')}", size=10, center=True)
+    pdf.space(12)
+
+    info = [
+        ('نوع التقرير', REPORT_TYPE_NAMES.get(report.get('type'), report.get('type'))),
+        ('الحلقة', report.get('halaqa_name')),
+        ('الفترة', report.get('period')),
+    ]
+    for label, value in info:
+        if value:
+            pdf.text(f'{label}: {value}')
+
+    summary = report.get('summary')
+    if summary:
+        pdf.heading('الملخص')
+        pdf.text(f"عدد الطلاب: {summary.get('total_students', 0)}")
+        pdf.text(f"عدد الحلقات: {summary.get('total_halaqat', 0)}")
+        pdf.text(f"إجمالي التبرعات: {_money(summary.get('total_donations'))}")
+        pdf.text(f"معدل الحضور: {summary.get('attendance_rate', 0)}%")
+
+    if report.get('ai_analysis'):
+        pdf.heading('التحليل الذكي')
+        pdf.text(report['ai_analysis'])
+
+    for key, heading in (('strengths', 'نقاط القوة'), ('recommendations', 'التوصيات')):
+        if report.get(key):
+            pdf.heading(heading)
+            for i, item in enumerate(report[key], 1):
+                pdf.text(f'{i}. {item}', indent=10)
+
+    if report.get('halaqat_analysis'):
+        pdf.heading('تحليل الحلقات')
+        for analysis in report['halaqat_analysis']:
+            pdf.text(analysis.get('halaqa_name', 'حلقة'), bold=True)
+            pdf.text(f"عدد الطلاب: {analysis.get('student_count', 0)}", indent=15)
+            pdf.text(f"معدل الحضور: {analysis.get('attendance_rate', 0)}%", indent=15)
+            pdf.text(f"التقييم: {analysis.get('performance_rating', 'جيد')}", indent=15)
+            if analysis.get('recommendations'):
+                pdf.text(f"التوصيات: {'، '.join(analysis['recommendations'])}", indent=15)
+            pdf.space(4)
+
+    if report.get('allocations'):
+        pdf.heading('خطة توزيع التبرعات')
+        pdf.text(f"المبلغ الإجمالي: {_money(report.get('total_amount'))}")
+        if report.get('allocation_strategy'):
+            pdf.text(report['allocation_strategy'])
+        for allocation in report['allocations']:
+            pdf.text(f"• {allocation.get('category')}: {_money(allocation.get('amount'))} "
+                     f"({allocation.get('percentage', 0)}%)", indent=10)
+
+    pdf.space(16)
+    pdf.text(FOOTER_NOTE, size=9, center=True)
+    return pdf.finish()
+
+
+def _draw_certificate(canvas, width, height, certificate):
+    canvas.setStrokeColorRGB(0.17, 0.33, 0.19)
+    canvas.setLineWidth(4)
+    canvas.rect(25, 25, width - 50, height - 50)
+    canvas.setLineWidth(1)
+    canvas.rect(35, 35, width - 70, height - 70)
+
+    def centered(text, y, size, bold=False):
+        canvas.setFont(BOLD_FONT_NAME if bold else FONT_NAME, size)
+        canvas.drawCentredString(width / 2, y, _shape(str(text)))
+
+    centered(CERTIFICATE_ORG, height - 90, 16)
+    centered(f"شهادة {certificate.get('certificate_type') or 'تقدير'}", height - 150, 34, bold=True)
+    centered('تشهد إدارة الحلقات بأن الطالب/ـة', height - 210, 16)
+    centered(certificate.get('name', ''), height - 260, 28, bold=True)
+    if certificate.get('halaqa_name'):
+        centered(f"من {certificate['halaqa_name']}", height - 300, 16)
+    if certificate.get('memorization_level'):
+        centered(f"قد أتم/ت الدراسة بمستوى حفظ: {certificate['memorization_level']}", height - 335, 16)
+    centered('سائلين الله له/ا التوفيق والسداد', height - 370, 14)
+
+    canvas.setFont(FONT_NAME, 13)
+    canvas.drawRightString(width - 90, 110, _shape(f"المعلم: {certificate.get('teacher_name') or ''}"))
+    canvas.drawString(90, 110, _shape('إدارة الحلقات'))
+    centered(f"تاريخ الإصدار: {certificate.get('issue_date', '')}", 70, 11)
+
+
+def render_certificates(certificates, title='شهادات'):
+    """مجموعة شهادات في ملف PDF واحد (صفحة أفقية لكل طالب)
+
+    كل شهادة: name, halaqa_name, teacher_name, memorization_level,
+    certificate_type, issue_date. الخط يُضمَّن مرة واحدة للملف كله، فالملف
+    المدمج أسرع وأصغر بكثير من ملف لكل طالب.
+    """
+    from reportlab.pdfgen.canvas import Canvas
+
+    layout = _get_layout()
+    # الصفحة الأفقية بنفس أبعاد A4
+    width, height = layout.page_height, layout.page_width
+    buffer = io.BytesIO()
+    canvas = Canvas(buffer, pagesize=(width, height), pageCompression=1)
+    canvas.setTitle(title)
+    for certificate in certificates:
+        _draw_certificate(canvas, width, height, certificate)
+        canvas.showPage()
+    canvas.save()
+    return buffer.getvalue()
+
+
+def render_certificate(certificate):
+    """شهادة طالب واحدة كملف PDF"""
+    return render_certificates([certificate], title=f"شهادة {certificate.get('name', '')}")
+
+
+# ===== نسخة HTML (عند غياب مكتبات PDF) =====
+
+_HTML_TEMPLATE_SOURCE = '''<!DOCTYPE html>
+<html dir="rtl" lang="ar">
+<head>
+    <meta charset="UTF-8">
+    <title>{{ report.title or 'تقرير' }}</title>
+    <style>
+        body { font-family: 'Noto Naskh Arabic', Arial, sans-serif; direction: rtl; text-align: right; }
+        .header { text-align: center; color: #2c5530; margin-bottom: 30px; }
+        .section { margin: 20px 0; padding: 15px; border: 1px solid #ddd; page-break-inside: avoid; }
+        .summary-grid { display: grid; grid-template-columns: repeat(2, 1fr); gap: 15px; }
+        .stat-box { text-align: center; padding: 10px; background: #f8f9fa; border-radius: 5px; }
+        .footer { text-align: center; font-size: 0.8em; color: #666; margin-top: 30px; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>{{ report.title or 'تقرير' }}</h1>
+        <p>تاريخ التوليد: {{ report.generated_at }}</p>
+        {% if report.halaqa_name %}<p>الحلقة: {{ report.halaqa_name }}</p>{% endif %}
+        {% if report.period %}<p>الفترة: {{ report.period }}</p>{% endif %}
+    </div>
+    {% if report.summary %}
+    <div class="section summary-grid">
+        <div class="stat-box">عدد الطلاب<br>{{ report.summary.total_students }}</div>
+        <div class="stat-box">عدد الحلقات<br>{{ report.summary.total_halaqat }}</div>
+        <div class="stat-box">إجمالي التبرعات<br>{{ money(report.summary.total_donations) }}</div>
+        <div class="stat-box">معدل الحضور<br>{{ report.summary.attendance_rate }}%</div>
+    </div>
+    {% endif %}
+    {% if report.ai_analysis %}
+    <div class="section"><h3>التحليل الذكي</h3><p>{{ report.ai_analysis }}</p></div>
+    {% endif %}
+    {% for key, heading in [('strengths', 'نقاط القوة'), ('recommendations', 'التوصيات')] %}
+    {% if report[key] %}
+    <div class="section"><h3>{{ heading }}</h3>
+        <ol>{% for item in report[key] %}<li>{{ item }}</li>{% endfor %}</ol>
+    </div>
+    {% endif %}
+    {% endfor %}
+    {% if report.halaqat_analysis %}
+    <div class="section"><h3>تحليل الحلقات</h3>
+        {% for analysis in report.halaqat_analysis %}
+        <p><strong>{{ analysis.halaqa_name }}</strong>: عدد الطلاب {{ analysis.student_count }}،
+           معدل الحضور {{ analysis.attendance_rate }}%، التقييم {{ analysis.performance_rating }}</p>
+        {% endfor %}
+    </div>
+    {% endif %}
+    {% if report.allocations %}
+    <div class="section"><h3>خطة توزيع التبرعات</h3>
+        <p>المبلغ الإجمالي: {{ money(report.total_amount) }}</p>
+        <ul>{% for allocation in report.allocations %}
+            <li>{{ allocation.category }}: {{ money(allocation.amount) }} ({{ allocation.percentage }}%)</li>
+        {% endfor %}</ul>
+    </div>
+    {% endif %}
+    <div class="footer">{{ footer_note }}</div>
+</body>
+</html>
+'''
+
+_CERTIFICATE_HTML_SOURCE = '''<!DOCTYPE html>
+<html dir="rtl" lang="ar">
+<head>
+    <meta charset="UTF-8">
+    <title>{{ title }}</title>
+    <style>
+        @page { size: A4 landscape; }
+        body { font-family: 'Noto Naskh Arabic', Arial, sans-serif; text-align: center; }
+        .frame { border: 6px double #2c5530; padding: 40px; margin: 20px; page-break-after: always; }
+        .name { font-size: 2.2em; font-weight: bold; }
+    </style>
+</head>
+<body>
+    {% for c in certificates %}
+    <div class="frame">
+        <p>{{ org }}</p>
+        <h1>شهادة {{ c.certificate_type or 'تقدير' }}</h1>
+        <p>تشهد إدارة الحلقات بأن الطالب/ـة</p>
+        <p class="name">{{ c.name }}</p>
+        {% if c.halaqa_name %}<p>من {{ c.halaqa_name }}</p>{% endif %}
+        {% if c.memorization_level %}<p>قد أتم/ت الدراسة بمستوى حفظ: {{ c.memorization_level }}</p>{% endif %}
+        <p>المعلم: {{ c.teacher_name or '' }} - تاريخ الإصدار: {{ c.issue_date }}</p>
+    </div>
+    {% endfor %}
+</body>
+</html>
+'''
+
+# القوالب تُترجم مرة واحدة لكل عملية
+_html_templates = {}
+
+
+def _html_template(source):
+    template = _html_templates.get(source)
+    if template is None:
+        from jinja2 import Environment
+        template = _html_templates[source] = Environment(autoescape=True).from_string(source)
+    return template
+
+
+def render_html(report):
+    """التقرير كصفحة HTML للطباعة"""
+    return _html_template(_HTML_TEMPLATE_SOURCE).render(report=report, money=_money,
+                                                       footer_note=FOOTER_NOTE)
+
+
+def render_certificates_html(certificates, title='شهادات'):
+    """مجموعة شهادات كصفحة HTML للطباعة (صفحة لكل شهادة)"""
+    return _html_template(_CERTIFICATE_HTML_SOURCE).render(certificates=certificates, title=title,
+                                                          org=CERTIFICATE_ORG)
+
+
+def render_certificate_html(certificate):
+    return render_certificates_html([certificate], title=f"شهادة {certificate.get('name', '')}")
+
+
+# ===== مجمع عمليات الرسم =====
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _warm_up():
+    """تجهيز الخطوط والإعدادات عند بدء كل عملية رسم بدلاً من أول تقرير"""
+    _get_layout()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: العملية الأم قد تحمل خيوطاً واتصالات لا يصح نسخها بـ fork
+                _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_warm_up)
+    return _pool
+
+
+def shutdown_pool():
+    """إيقاف عمليات الرسم (عند إيقاف الخادم)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _discard_pool(pool):
+    """استبدال مجمع معطل أو عالق عند الطلب التالي (إن لم يستبدله خيط آخر قبلنا)
+
+    العمليات المشغولة تكمل عملها الحالي ثم تخرج، وطلبات الرسم الجديدة تذهب لمجمع جديد.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _discard_pool_after_fork():
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_discard_pool_after_fork)
+
+
+def render_pdf_in_pool(report, timeout=PDF_RENDER_TIMEOUT):
+    """رسم تقرير واحد في مجمع العمليات (لا يحجز خيط الطلب GIL أثناء الرسم)
+
+    إذا توقفت عملية رسم فجأة (نفاد الذاكرة أو انهيار في تشكيل النص) يصبح المجمع
+    معطلاً، فيُستبدل بمجمع جديد وتُعاد المحاولة مرة واحدة.
+    """
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            future = pool.submit(render_pdf, report)
+            return _result(pool, future, timeout)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            if attempt:
+                raise
+
+
+def _result(pool, future, timeout):
+    """نتيجة الرسم، ومع تجاوز المهلة يُلغى الطلب - وإن كان قيد الرسم يُستبدل المجمع
+    حتى لا تبقى العملية العالقة محجوزة للطلبات التالية"""
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        if not future.cancel():
+            _discard_pool(pool)
+        raise
+
+
+def _render_batch(render, batch):
+    return [render(item) for item in batch]
+
+
+def render_many(items, render=render_pdf, batch_size=1, window=None):
+    """رسم عناصر بالتوازي وإعادة بايتات كل عنصر بنفس ترتيب الإدخال
+
+    items قد يكون مولداً بأي طول: تُرسل العناصر للمجمع في دفعات من batch_size
+    (أقل تبادلاً بين العمليات للعناصر الصغيرة) ولا يُرسل أكثر من window دفعة في
+    نفس الوقت (الافتراضي: ضعف عدد العمليات)، فالذاكرة ثابتة مهما كبرت الدفعة.
+    """
+    window = window or PDF_WORKERS * 2
+    timeout = PDF_RENDER_TIMEOUT * batch_size
+    pool = _get_pool()
+    pending = deque()
+    batch = []
+
+    def submit():
+        pending.append(pool.submit(_render_batch, render, batch))
+
+    try:
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                submit()
+                batch = []
+                if len(pending) >= window:
+                    yield from _result(pool, pending.popleft(), timeout)
+        if batch:
+            submit()
+        while pending:
+            yield from _result(pool, pending.popleft(), timeout)
+    except BrokenProcessPool:
+        # المهمة الحالية تفشل (نتائجها المرسلة لا تُعاد)، والمهام التالية تبدأ بمجمع جديد
+        _discard_pool(pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_bytes(data, chunk_size=STREAM_CHUNK_SIZE):
+    """تقسيم الملف لأجزاء لبثها في الاستجابة"""
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+محلل الاستعلامات (اختياري) - زمن كل عبارة SQL وصفوفها والمسار الذي نفذها
+
+    QUERY_PROFILING      1 لتفعيل التحليل عند التشغيل (ويمكن تفعيله وإيقافه من /admin/query-profile)
+    QUERY_PROFILE_SIZE   عدد آخر العبارات المحفوظة في الذاكرة الدائرية (الافتراضي: 1000)
+    QUERY_PROFILE_TOP    عدد الاستعلامات في كل قائمة (الأبطأ، الأكثر تكراراً...) (الافتراضي: 20)
+    SLOW_QUERY_MS        حد العبارة البطيئة بالملي ثانية (الافتراضي: 100)
+    SLOW_QUERY_LOG       ملف JSONL تُضاف إليه كل عبارة بطيئة عند انتهائها (اختياري)
+
+زمن العبارة يشمل تنفيذها وقراءة نتائجها حتى العبارة التالية على نفس المؤشر أو إغلاقه.
+النصوص تُوحَّد (القيم الحرفية وقوائم IN تُستبدل بعلامات) والمعاملات تُسجل بأنواعها فقط،
+فلا تظهر بيانات الطلاب في الصفحة أو الملف. التفعيل والإحصائيات لكل عملية على حدة.
+الصفحات تُسجل فقط مع ضبط ADMIN_TOKEN وتتطلب الترويسة أو جلسة من /admin/login (انظر admin_auth).
+"""
+
+import heapq
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import Response, has_request_context, redirect, request, url_for
+
+import admin_auth
+import database_helper
+
+QUERY_PROFILE_SIZE = int(os.environ.get('QUERY_PROFILE_SIZE', 1000))
+QUERY_PROFILE_TOP = int(os.environ.get('QUERY_PROFILE_TOP', 20))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')
+
+# أقصى عدد استعلامات موحدة مختلفة في الإحصائيات (يُحذف الأقل زمناً عند التجاوز)
+MAX_DISTINCT_QUERIES = 2000
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)')
+_PREPARED = re.compile(r'^(PREPARE|EXECUTE)\s+(q_\w+)')
+
+_lock = threading.Lock()
+_recent = deque(maxlen=QUERY_PROFILE_SIZE)
+_by_query = {}
+_slowest = []  # كومة صغرى بأبطأ QUERY_PROFILE_TOP عبارة: (الزمن، الترتيب، السجل)
+_sequence = 0
+_names = {}
+_enabled_since = None
+
+
+def normalize(query):
+    """نص الاستعلام بدون القيم الحرفية ومسافات التنسيق، وقوائم IN كعلامة واحدة"""
+    text = _LITERALS.sub('?', ' '.join(query.split()))
+    return _IN_LISTS.sub('(...)', text)
+
+
+def _query_names():
+    """نص الاستعلام أو اسم العبارة المجهزة -> اسم الاستعلام المسجل (يُعاد بناؤه عند تسجيل استعلامات جديدة)"""
+    global _names
+    if len(_names) != 2 * len(database_helper.QUERIES):
+        names = {}
+        for name, (query, _) in list(database_helper.QUERIES.items()):
+            names[query] = name
+            names[database_helper._prepared_name(name)] = name
+        _names = names
+    return _names
+
+
+def _describe(query):
+    """(اسم الاستعلام المسجل أو None، النص الموحد)"""
+    names = _query_names()
+    match = _PREPARED.match(query.lstrip())
+    if match and match.group(2) in names:
+        name = names[match.group(2)]
+        return name, f'{match.group(1)} ' + normalize(database_helper.QUERIES[name][0])
+    return names.get(query), normalize(query)
+
+
+def _shape(params, many):
+    """أنواع المعاملات بدون قيمها، وعدد الصفوف لـ executemany"""
+    if many:
+        if not isinstance(params, (list, tuple)):
+            return 'many'
+        return f'{len(params)} × ' + (_shape(params[0], False) if params else '()')
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+
+def _route():
+    if not has_request_context():
+        return f'background:{threading.current_thread().name}'
+    rule = request.url_rule.rule if request.url_rule is not None else request.path
+    return f'{request.method} {rule}'
+
+
+class _Statement:
+    """عبارة جارية: يتراكم زمنها وصفوفها حتى finish()"""
+
+    __slots__ = ('query', 'params', 'many', 'route', 'started_at', 'seconds', 'rows', 'done')
+
+    def __init__(self, query, params, many):
+        self.query = query
+        self.params = params
+        self.many = many
+        self.route = _route()
+        self.started_at = time.time()
+        self.seconds = 0.0
+        self.rows = 0
+        self.done = False
+
+    def add(self, seconds, rows=0):
+        self.seconds += seconds
+        self.rows += rows
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            _record(self)
+
+
+def _observe(query, params, many):
+    return _Statement(query, params, many)
+
+
+def _record(statement):
+    global _sequence
+    name, text = _describe(statement.query)
+    entry = {
+        'at': datetime.fromtimestamp(statement.started_at).isoformat(timespec='milliseconds'),
+        'route': statement.route,
+        'name': name,
+        'query': text,
+        'params': _shape(statement.params, statement.many),
+        'ms': round(statement.seconds * 1000, 3),
+        'rows': statement.rows,
+    }
+    with _lock:
+        _recent.append(entry)
+        _sequence += 1
+        if len(_slowest) < QUERY_PROFILE_TOP:
+            heapq.heappush(_slowest, (entry['ms'], _sequence, entry))
+        elif entry['ms'] > _slowest[0][0]:
+            heapq.heapreplace(_slowest, (entry['ms'], _sequence, entry))
+
+        stats = _by_query.get(text)
+        if stats is None:
+            if len(_by_query) >= MAX_DISTINCT_QUERIES:
+                del _by_query[min(_by_query, key=lambda key: _by_query[key]['total_ms'])]
+            stats = _by_query[text] = {'query': text, 'name': name, 'count': 0, 'total_ms': 0.0,
+                                       'max_ms': 0.0, 'rows': 0, 'routes': Counter()}
+        stats['count'] += 1
+        stats['total_ms'] += entry['ms']
+        stats['max_ms'] = max(stats['max_ms'], entry['ms'])
+        stats['rows'] += entry['rows']
+        stats['routes'][entry['route']] += 1
+
+    if SLOW_QUERY_LOG and entry['ms'] >= SLOW_QUERY_MS:
+        try:
+            with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(dict(entry, type='slow'), ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f"⚠️  تعذر الكتابة في سجل الاستعلامات البطيئة: {e}")
+
+
+def is_enabled():
+    return database_helper._statement_observer is _observe
+
+
+def enable():
+    global _enabled_since
+    _enabled_since = datetime.now().isoformat(timespec='seconds')
+    database_helper.set_statement_observer(_observe)
+
+
+def disable():
+    global _enabled_since
+    _enabled_since = None
+    database_helper.set_statement_observer(None)
+
+
+def reset():
+    global _sequence
+    with _lock:
+        _recent.clear()
+        _by_query.clear()
+        _slowest.clear()
+        _sequence = 0
+
+
+def _aggregate(stats):
+    return dict(stats, total_ms=round(stats['total_ms'], 3), max_ms=round(stats['max_ms'], 3),
+                avg_ms=round(stats['total_ms'] / stats['count'], 3),
+                routes=dict(stats['routes'].most_common(5)))
+
+
+def report(top=None):
+    """الأبطأ والأكثر تكراراً والأكثر زمناً إجمالياً وآخر العبارات"""
+    top = top or QUERY_PROFILE_TOP
+    with _lock:
+        slowest = [entry for _, _, entry in sorted(_slowest, reverse=True)]
+        queries = [_aggregate(stats) for stats in _by_query.values()]
+        recent = list(_recent)[-top:][::-1]
+    return {
+        'enabled': is_enabled(),
+        'enabled_since': _enabled_since,
+        'slow_query_ms': SLOW_QUERY_MS,
+        'statements': sum(query['count'] for query in queries),
+        'slowest': slowest[:top],
+        'most_frequent': sorted(queries, key=lambda q: q['count'], reverse=True)[:top],
+        'most_time': sorted(queries, key=lambda q: q['total_ms'], reverse=True)[:top],
+        'recent': recent,
+    }
+
+
+def iter_jsonl():
+    """الإحصائيات كسطور JSONL: سطر لكل استعلام موحد (query) ولكل عبارة من الأبطأ (slow)"""
+    data = report(top=MAX_DISTINCT_QUERIES)
+    for query in data['most_time']:
+        yield json.dumps(dict(query, type='query'), ensure_ascii=False) + '\n'
+    for entry in data['slowest']:
+        yield json.dumps(dict(entry, type='slow'), ensure_ascii=False) + '\n'
+
+
+_PAGE_SOURCE = '''<!DOCTYPE html>
+<html dir="rtl" lang="ar">
+<head>
+    <meta charset="UTF-8">
+    <title>محلل الاستعلامات</title>
+    <style>
+        body { font-family: 'Noto Naskh Arabic', Arial, sans-serif; margin: 20px; }
+        table { border-collapse: collapse; width: 100%; margin-bottom: 30px; font-size: 0.9em; }
+        th, td { border: 1px solid #ddd; padding: 6px; text-align: right; vertical-align: top; }
+        th { background: #2c5530; color: #fff; }
+        code { direction: ltr; display: block; text-align: left; white-space: pre-wrap; }
+        .slow { background: #fdecea; }
+        form { display: inline; }
+    </style>
+</head>
+<body>
+    <h1>محلل الاستعلامات</h1>
+    <p>
+        الحالة: <strong>{{ 'مفعل منذ ' ~ data.enabled_since if data.enabled else 'متوقف' }}</strong>
+        - العبارات المسجلة: {{ data.statements }} - حد البطء: {{ data.slow_query_ms }} ms
+    </p>
+    <form method="post"><button name="action" value="{{ 'disable' if data.enabled else 'enable' }}">
+        {{ 'إيقاف' if data.enabled else 'تفعيل' }}</button></form>
+    <form method="post"><button name="action" value="reset">مسح الإحصائيات</button></form>
+    <a href="{{ jsonl_url }}">تنزيل JSONL</a>
+    <form method="post" action="{{ logout_url }}"><button>خروج</button></form>
+
+    {% for title, key in [('الأكثر زمناً إجمالياً', 'most_time'), ('الأكثر تكراراً', 'most_frequent')] %}
+    <h2>{{ title }}</h2>
+    <table>
+        <tr><th>الاستعلام</th><th>العدد</th><th>الإجمالي ms</th><th>المتوسط ms</th>
+            <th>الأقصى ms</th><th>الصفوف</th><th>المسارات</th></tr>
+        {% for q in data[key] %}
+        <tr class="{{ 'slow' if q.max_ms >= data.slow_query_ms else '' }}">
+            <td>{% if q.name %}<strong>{{ q.name }}</strong>{% endif %}<code>{{ q.query }}</code></td>
+            <td>{{ q.count }}</td><td>{{ q.total_ms }}</td><td>{{ q.avg_ms }}</td>
+            <td>{{ q.max_ms }}</td><td>{{ q.rows }}</td>
+            <td>{% for route, count in q.routes.items() %}{{ route }} ({{ count }})<br>{% endfor %}</td>
+        </tr>
+        {% endfor %}
+    </table>
+    {% endfor %}
+
+    {% for title, key in [('أبطأ العبارات', 'slowest'), ('آخر العبارات', 'recent')] %}
+    <h2>{{ title }}</h2>
+    <table>
+        <tr><th>الوقت</th><th>المسار</th><th>الاستعلام</th><th>المعاملات</th><th>ms</th><th>الصفوف</th></tr>
+        {% for s in data[key] %}
+        <tr class="{{ 'slow' if s.ms >= data.slow_query_ms else '' }}">
+            <td>{{ s.at }}</td><td>{{ s.route }}</td>
+            <td>{% if s.name %}<strong>{{ s.name }}</strong>{% endif %}<code>{{ s.query }}</code></td>
+            <td><code>{{ s.params }}</code></td><td>{{ s.ms }}</td><td>{{ s.rows }}</td>
+        </tr>
+        {% endfor %}
+    </table>
+    {% endfor %}
+</body>
+</html>
+'''
+
+_page_template = None
+
+
+def _page():
+    global _page_template
+    if request.method == 'POST':
+        action = request.form.get('action')
+        if action in _ACTIONS:
+            _ACTIONS[action]()
+        return redirect(url_for('query_profile'))
+    if _page_template is None:
+        from jinja2 import Environment
+        _page_template = Environment(autoescape=True).from_string(_PAGE_SOURCE)
+    return _page_template.render(data=report(),
+                                 jsonl_url=url_for('query_profile_jsonl'),
+                                 logout_url=url_for('admin_logout'))
+
+
+def _jsonl():
+    filename = f"query_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    return Response(iter_jsonl(), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+_ACTIONS = {'enable': enable, 'disable': disable, 'reset': reset}
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.Lock()
+    reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def init_app(app):
+    """صفحة المحلل /admin/query-profile وتنزيل JSONL (مع ADMIN_TOKEN فقط)، والتفعيل من QUERY_PROFILING"""
+    if admin_auth.is_configured():
+        app.add_url_rule('/admin/query-profile', 'query_profile', admin_auth.token_required(_page),
+                         methods=['GET', 'POST'])
+        app.add_url_rule('/admin/query-profile.jsonl', 'query_profile_jsonl',
+                         admin_auth.token_required(_jsonl))
+    if os.environ.get('QUERY_PROFILING', '').lower() in ('1', 'true', 'yes', 'on'):
+        enable()
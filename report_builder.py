@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+بناء التقارير والتصديرات - مشترك بين المسارات المتزامنة ومهام الخلفية (jobs.py)
+"""
+
+import copy
+import csv
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import attendance_analytics
+from database_helper import data_version, iter_rows, row_values
+from repositories import HalaqaRepository, StudentRepository
+from stats_service import get_headline_stats
+
+# عدد التقارير المحفوظة في الذاكرة لكل عملية (الأقدم استخداماً يُحذف أولاً)
+REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', 128))
+
+_report_cache = OrderedDict()
+_report_cache_lock = threading.Lock()
+# أحدث طابع إصدار بيانات رأته هذه العملية - التقارير بطابع أقدم لا تُستخدم ثانية
+_report_cache_version = None
+_report_cache_counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+
+def get_ai_report(conn, report_type, time_period, halaqa_id):
+    """التقرير الذكي من الذاكرة إن لم تتغير البيانات منذ حسابه، وإلا يُبنى ويُحفظ
+
+    المفتاح: المعاملات + تاريخ اليوم (الفترات نسبية لليوم) + طابع data_versions
+    الذي يتقدم مع كل تعديل على الطلاب أو المعلمين أو الحلقات أو الحضور أو التبرعات.
+    """
+    global _report_cache_version
+    version = data_version(conn)
+    key = (report_type, time_period, str(halaqa_id), date.today().isoformat(), version)
+
+    with _report_cache_lock:
+        if _report_cache_version is None or version > _report_cache_version:
+            # تغيرت البيانات: كل التقارير المحفوظة أصبحت قديمة
+            if _report_cache:
+                _report_cache_counters['invalidations'] += 1
+            _report_cache.clear()
+            _report_cache_version = version
+        report = _report_cache.get(key)
+        if report is not None:
+            _report_cache.move_to_end(key)
+            _report_cache_counters['hits'] += 1
+            return copy.deepcopy(report)
+        _report_cache_counters['misses'] += 1
+
+    report = build_ai_report(conn, report_type, time_period, halaqa_id)
+
+    with _report_cache_lock:
+        # لا يُحفظ تقرير حُسب على بيانات تغيرت أثناء حسابه
+        if version == _report_cache_version:
+            _report_cache[key] = report
+            while len(_report_cache) > REPORT_CACHE_SIZE:
+                _report_cache.popitem(last=False)
+                _report_cache_counters['evictions'] += 1
+    return copy.deepcopy(report)
+
+
+def report_cache_stats():
+    """عدادات ذاكرة التقارير مع نسبة الإصابة"""
+    with _report_cache_lock:
+        stats = dict(_report_cache_counters, size=len(_report_cache), max_size=REPORT_CACHE_SIZE)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] * 100.0 / lookups, 1) if lookups else 0
+    return stats
+
+
+def build_ai_report(conn, report_type, time_period, halaqa_id):
+    """بناء التقرير الذكي (weekly, monthly, performance, allocation) كقاموس قابل لـ JSON"""
+    # تهيئة التقرير الافتراضي
+    report = {
+        'type': report_type,
+        'time_period': time_period,
+        'halaqa_id': halaqa_id,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'status': 'completed'
+    }
+
+    if report_type == 'weekly' or report_type == 'monthly':
+        # تقرير زمني (أسبوعي أو شهري)
+        period_name = "الأسبوعي" if report_type == 'weekly' else "الشهري"
+
+        headline = get_headline_stats(conn, fresh=True)
+
+        # فلترة بناء على الحلقة المختارة
+        if halaqa_id != 'all':
+            total_students = StudentRepository(conn).count_in_halaqa(halaqa_id)
+            halaqa_name = HalaqaRepository(conn).name(halaqa_id) or f"حلقة رقم {halaqa_id}"
+        else:
+            total_students = headline['total_students']
+            halaqa_name = "جميع الحلقات"
+
+        total_halaqat = headline['total_halaqat']
+        total_donations = headline['total_donations']
+
+        # الحضور الفعلي في فترة التقرير
+        period_start, period_end = attendance_analytics.period_bounds(time_period)
+        attendance = attendance_analytics.period_summary(
+            conn, period_start, period_end,
+            halaqa_id=None if halaqa_id == 'all' else int(halaqa_id))
+
+        # تحديد نص الفترة
+        period_text = {
+            'current_week': 'الأسبوع الحالي',
+            'last_week': 'الأسبوع الماضي', 
+            'current_month': 'الشهر الحالي',
+            'last_month': 'الشهر الماضي'
+        }.get(time_period, time_period)
+
+        report.update({
+            'title': f'التقرير {period_name} - {halaqa_name}',
+            'period': period_text,
+            'halaqa_name': halaqa_name,
+            'summary': {
+                'total_students': total_students,
+                'total_halaqat': total_halaqat if halaqa_id == 'all' else 1,
+                'total_donations': float(total_donations),
+                'attendance_rate': attendance['attendance_rate'],
+                'attendance_days': attendance['total_days'],
+            },
+            'ai_analysis': f'تحليل شامل للأداء في {period_text} لـ{halaqa_name}. تظهر البيانات مستوى جيد من الانتظام والتقدم.',
+            'strengths': [
+                'ارتفاع في معدلات الحضور',
+                'تحسن في مستوى الحفظ',
+                'زيادة في التبرعات'
+            ],
+            'recommendations': [
+                'الاستمرار في البرامج الحالية',
+                'تطوير برامج تحفيزية جديدة',
+                'تعزيز التواصل مع أولياء الأمور'
+            ]
+        })
+
+    elif report_type == 'performance':
+        # تحليل أداء الحلقات
+        if halaqa_id != 'all':
+            # أداء حلقة محددة
+            halaqat_performance = HalaqaRepository(conn).student_counts(halaqa_id)
+            title_suffix = f" - {halaqat_performance[0]['name'] if halaqat_performance else 'حلقة محددة'}"
+        else:
+            # جميع الحلقات
+            halaqat_performance = HalaqaRepository(conn).student_counts()
+            title_suffix = " - جميع الحلقات"
+
+        # معدل الحضور الفعلي لكل حلقة في فترة التقرير
+        period_start, period_end = attendance_analytics.period_bounds(time_period)
+        halaqa_rates = attendance_analytics.halaqa_attendance(conn, period_start, period_end)
+
+        def performance_rating(rate):
+            if rate >= 90:
+                return 'ممتاز'
+            if rate >= 75:
+                return 'جيد جداً'
+            return 'جيد' if rate >= 60 else 'يحتاج تحسين'
+
+        report.update({
+            'title': f'تقرير أداء الحلقات{title_suffix}',
+            'halaqat_analysis': [
+                {
+                    'halaqa_name': halaqa['name'] if halaqa['name'] else f'حلقة رقم {i+1}',
+                    'student_count': halaqa['student_count'] or 0,
+                    'attendance_rate': halaqa_rates.get(halaqa['id'], {}).get('attendance_rate', 0),
+                    'performance_rating': performance_rating(
+                        halaqa_rates.get(halaqa['id'], {}).get('attendance_rate', 0)),
+                    'recommendations': ['زيادة الأنشطة التفاعلية', 'تحسين بيئة التعلم']
+                }
+                for i, halaqa in enumerate(halaqat_performance[:5])
+            ],
+            'ai_analysis': 'تحليل شامل لأداء جميع الحلقات مع التركيز على نقاط القوة',
+            'overall_rating': 'ممتاز'
+        })
+
+    elif report_type == 'allocation':
+        # توزيع التبرعات
+        headline = get_headline_stats(conn, fresh=True)
+        total_amount = headline['total_donations'] or 5000
+        halaqat_count = headline['total_halaqat'] or 1
+
+        per_halaqa = float(total_amount) / halaqat_count if halaqat_count > 0 else 0
+
+        report.update({
+            'title': 'خطة توزيع التبرعات الذكية',
+            'total_amount': float(total_amount),
+            'allocation_strategy': 'توزيع عادل بناء على الاحتياجات والأداء',
+            'allocations': [
+                {
+                    'category': 'مكافآت الطلاب',
+                    'amount': per_halaqa * 0.4,
+                    'percentage': 40
+                },
+                {
+                    'category': 'مستلزمات تعليمية', 
+                    'amount': per_halaqa * 0.3,
+                    'percentage': 30
+                },
+                {
+                    'category': 'أنشطة ترفيهية',
+                    'amount': per_halaqa * 0.2,
+                    'percentage': 20
+                },
+                {
+                    'category': 'طوارئ',
+                    'amount': per_halaqa * 0.1,
+                    'percentage': 10
+                }
+            ],
+            'ai_analysis': 'توزيع محسّن يركز على تحفيز الطلاب وتحسين جودة التعليم'
+        })
+    else:
+        # نوع تقرير غير معروف
+        report = {
+            'type': report_type,
+            'status': 'error',
+            'message': f'نوع التقرير "{report_type}" غير مدعوم',
+            'available_types': ['weekly', 'performance', 'allocation']
+        }
+
+    return report
+
+
+# استعلامات التصدير: (العناوين، الاستعلام، عمود التاريخ للفلترة، عمود الحلقة للفلترة، الترتيب)
+EXPORTS = {
+    'students': (
+        ['الاسم', 'العمر', 'الجنس', 'الهاتف', 'اسم الولي', 'هاتف الولي',
+         'الحلقة', 'تاريخ الانضمام', 'مستوى الحفظ'],
+        '''SELECT s.name, s.age, s.gender, s.phone,
+                  s.guardian_name, s.guardian_phone, h.name as halaqa_name,
+                  s.enrollment_date, s.memorization_level
+           FROM students s
+           LEFT JOIN halaqat h ON s.halaqa_id = h.id''',
+        's.enrollment_date', 's.halaqa_id', 's.name'
+    ),
+    'halaqat': (
+        ['اسم الحلقة', 'النوع', 'المعلم', 'المكان', 'السعة القصوى',
+         'أيام الدراسة', 'وقت البداية', 'وقت النهاية', 'عدد الطلاب'],
+        '''SELECT h.name, h.type, h.teacher_name, h.location, h.max_capacity,
+                  h.schedule_days, h.start_time, h.end_time,
+                  h.student_count
+           FROM halaqat h''',
+        None, 'h.id', 'h.name'
+    ),
+    'attendance': (
+        ['التاريخ', 'اسم الطالب', 'الحلقة', 'حالة الحضور', 'ملاحظات'],
+        '''SELECT a.attendance_date, s.name, h.name as halaqa_name, a.status, a.notes
+           FROM attendance a
+           JOIN students s ON a.student_id = s.id
+           LEFT JOIN halaqat h ON a.halaqa_id = h.id''',
+        'a.attendance_date', 'a.halaqa_id', 'a.attendance_date DESC, s.name'
+    ),
+    'donations': (
+        ['اسم المتبرع', 'المبلغ', 'تاريخ التبرع', 'الغرض', 'ملاحظات'],
+        '''SELECT donor_name, amount, donation_date, allocation, notes
+           FROM donations''',
+        'donation_date', 'halaqa_id', 'donation_date DESC'
+    ),
+}
+
+# عدد الصفوف المقروءة من قاعدة البيانات في كل دفعة أثناء التصدير
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_query(report_type, date_from=None, date_to=None, halaqa_id=None):
+    """(العناوين، الاستعلام، المعاملات) لتصدير مع فلاتر اختيارية - يرفع ValueError لفلتر غير صالح"""
+    if report_type not in EXPORTS:
+        raise ValueError(f'نوع التصدير غير معروف: {report_type}')
+    headers, query, date_column, halaqa_column, order_by = EXPORTS[report_type]
+
+    conditions = []
+    params = []
+    if date_column and date_from:
+        conditions.append(f'{date_column} >= ?')
+        params.append(date.fromisoformat(date_from).isoformat())
+    if date_column and date_to:
+        conditions.append(f'{date_column} <= ?')
+        params.append(date.fromisoformat(date_to).isoformat())
+    if halaqa_id:
+        conditions.append(f'{halaqa_column} = ?')
+        params.append(int(halaqa_id))
+
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += f' ORDER BY {order_by}'
+    return headers, query, params
+
+
+# السطر الأخير في ملف تصدير توقف بخطأ أثناء البث (الحالة 200 أُرسلت قبل الخطأ)
+EXPORT_ERROR_MARKER = '#خطأ: التصدير غير مكتمل بسبب خطأ في الخادم - أعد المحاولة'
+
+
+def csv_error_row():
+    """سطر CSV يعلن أن الملف ناقص"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([EXPORT_ERROR_MARKER])
+    return buffer.getvalue()
+
+
+def csv_chunks(conn, headers, query, params, chunk_size=EXPORT_CHUNK_SIZE, on_rows=None):
+    """نص CSV على دفعات: العناوين (مع BOM) ثم دفعة لكل chunk_size صف
+
+    on_rows(عدد الصفوف) يُستدعى بعد كل دفعة لتقارير التقدم.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM ليفتح Excel الملف بترميز UTF-8 ويعرض العربية بشكل صحيح
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    yield buffer.getvalue()
+
+    for rows in iter_rows(conn, query, params, chunk_size=chunk_size):
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows(row_values(row) for row in rows)
+        yield buffer.getvalue()
+        if on_rows:
+            on_rows(len(rows))
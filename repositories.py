@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+طبقة الوصول للبيانات - كائن استعلامات لكل كيان على المخطط الموحد
+
+كل استعلامات المسارات هنا بصيغة محايدة تعمل على SQLite و PostgreSQL:
+علامات '?' تُحوَّل حسب نوع الاتصال، والتواريخ الافتراضية تأتي من قيم DEFAULT
+في الجداول أو من بايثون بدلاً من DATETIME('now') الخاصة بـ SQLite.
+كل استعلام مسجل باسم ثابت (register_query) فيُجهَّز مرة واحدة لكل اتصال.
+"""
+
+from datetime import date
+
+from database_helper import (adapt_query, adjust_halaqa_student_counts, bulk_upsert_attendance,
+                             bump_data_version, execute_named, iter_rows, register_query)
+from pagination import KeysetQuery
+
+# أسماء الأعمدة القديمة التي ما زالت القوالب تعرضها (مخطط halaqat.db)
+STUDENT_LEGACY_ALIASES = '''
+    s.guardian_phone AS parent_phone,
+    s.memorization_level AS performance_level,
+    s.enrollment_date AS join_date
+'''
+# نسبة إشغال الحلقة من سعتها القصوى (NULL عند عدم تحديد السعة)
+CAPACITY_UTILIZATION = '''
+    CASE WHEN h.max_capacity > 0
+         THEN ROUND(100.0 * h.student_count / h.max_capacity, 1)
+    END AS capacity_utilization
+'''
+DONATION_LEGACY_ALIASES = '''
+    d.allocation AS purpose,
+    d.donation_date AS date
+'''
+
+
+def _halaqa_id(value):
+    """رقم الحلقة من قيمة النموذج ('' أو None: بدون حلقة)"""
+    value = str(value if value is not None else '').strip()
+    return int(value) if value.isdigit() else None
+
+
+class Repository:
+    """أساس كائنات الاستعلام: تنفيذ استعلامات مسماة على اتصال واحد"""
+
+    # جدول data_versions الذي يتقدم إصداره مع كل كتابة (None: غير متتبع)
+    DATA_VERSION = None
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _execute(self, name, params=()):
+        return execute_named(self.conn, name, params)
+
+    def _all(self, name, params=()):
+        return self._execute(name, params).fetchall()
+
+    def _one(self, name, params=()):
+        return self._execute(name, params).fetchone()
+
+    def _scalar(self, name, params=(), default=0):
+        """أول عمود من أول صف (الاستعلام يسمي العمود value)"""
+        row = self._one(name, params)
+        if not row or row['value'] is None:
+            return default
+        return row['value']
+
+    def _write(self, name, params=(), after=None):
+        """تنفيذ تعديل وحفظه في معاملة واحدة (after: تعديلات تابعة تُنفذ قبل الحفظ)"""
+        try:
+            self._execute(name, params)
+            if after:
+                after()
+            if self.DATA_VERSION:
+                bump_data_version(self.conn, self.DATA_VERSION)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+
+class StudentRepository(Repository):
+    DATA_VERSION = 'students'
+
+    PAGE = KeysetQuery(
+        f'''SELECT s.*, h.name AS halaqa_name, {STUDENT_LEGACY_ALIASES}
+            FROM students s
+            LEFT JOIN halaqat h ON s.halaqa_id = h.id''',
+        keys=[('s.name', 'name'), ('s.id', 'id')],
+        count_table='students',
+        name='students.page'
+    )
+
+    RECENT = register_query('students.recent', f'''
+        SELECT s.*, {STUDENT_LEGACY_ALIASES}
+        FROM students s ORDER BY s.id DESC LIMIT ?
+    ''', (5,))
+    GET = register_query('students.get', f'''
+        SELECT s.*, {STUDENT_LEGACY_ALIASES}
+        FROM students s WHERE s.id = ?
+    ''', (1,))
+    ROSTER = register_query('students.roster', '''
+        SELECT s.id, s.name, s.halaqa_id, h.name AS halaqa_name
+        FROM students s
+        LEFT JOIN halaqat h ON s.halaqa_id = h.id
+        ORDER BY h.name, s.name
+    ''')
+    IN_HALAQA = register_query('students.in_halaqa', f'''
+        SELECT s.*, {STUDENT_LEGACY_ALIASES}
+        FROM students s WHERE s.halaqa_id = ? ORDER BY s.name
+    ''', (1,))
+    HALAQA_OF = register_query('students.halaqa_of', 'SELECT halaqa_id FROM students WHERE id = ?', (1,))
+    COUNT_IN_HALAQA = register_query(
+        'students.count_in_halaqa', 'SELECT COUNT(*) AS value FROM students WHERE halaqa_id = ?', (1,))
+    # enrollment_date من القيمة الافتراضية للجدول، و created_date صريح لأن العمود المضاف
+    # بالترحيل في قواعد SQLite القديمة بلا قيمة افتراضية
+    INSERT = register_query('students.insert', '''
+        INSERT INTO students (name, age, gender, phone, email, guardian_name,
+                              guardian_phone, halaqa_id, memorization_level, created_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''')
+    UPDATE = register_query('students.update', '''
+        UPDATE students
+        SET name = ?, age = ?, gender = ?, phone = ?, email = ?,
+            guardian_name = ?, guardian_phone = ?, halaqa_id = ?,
+            memorization_level = ?
+        WHERE id = ?
+    ''')
+
+    def recent(self, limit=5):
+        return self._all(self.RECENT, (limit,))
+
+    def get(self, student_id):
+        return self._one(self.GET, (student_id,))
+
+    def roster(self):
+        """كل الطلاب مع أسماء حلقاتهم مرتبين حسب الحلقة (صفحة الحضور)"""
+        return self._all(self.ROSTER)
+
+    def in_halaqa(self, halaqa_id):
+        return self._all(self.IN_HALAQA, (halaqa_id,))
+
+    def count_in_halaqa(self, halaqa_id):
+        return self._scalar(self.COUNT_IN_HALAQA, (halaqa_id,))
+
+    def _certificate_filter(self, halaqa_id=None, student_ids=None):
+        conditions, params = [], []
+        if halaqa_id:
+            conditions.append('s.halaqa_id = ?')
+            params.append(int(halaqa_id))
+        if student_ids:
+            conditions.append(f"s.id IN ({', '.join('?' * len(student_ids))})")
+            params.extend(int(student_id) for student_id in student_ids)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def count_for_certificates(self, halaqa_id=None, student_ids=None):
+        where, params = self._certificate_filter(halaqa_id, student_ids)
+        cursor = self.conn.cursor()
+        cursor.execute(adapt_query(self.conn, 'SELECT COUNT(*) AS value FROM students s' + where), params)
+        return cursor.fetchone()['value'] or 0
+
+    def iter_for_certificates(self, halaqa_id=None, student_ids=None, chunk_size=500):
+        """الطلاب المطلوب إصدار شهاداتهم دفعة بعد دفعة (بدون تحميل الكل في الذاكرة)"""
+        where, params = self._certificate_filter(halaqa_id, student_ids)
+        query = '''
+            SELECT s.id, s.name, s.memorization_level, h.name AS halaqa_name, h.teacher_name
+            FROM students s
+            LEFT JOIN halaqat h ON s.halaqa_id = h.id''' + where + ' ORDER BY h.name, s.name, s.id'
+        for rows in iter_rows(self.conn, query, params, chunk_size=chunk_size):
+            yield from rows
+
+    def _adjust_counts(self, deltas):
+        """تعديل halaqat.student_count في نفس معاملة كتابة الطالب"""
+        return lambda: adjust_halaqa_student_counts(self.conn, deltas)
+
+    def add(self, name, age, gender, phone, email, guardian_name, guardian_phone,
+            halaqa_id, memorization_level):
+        self._write(self.INSERT, (name, age, gender, phone, email, guardian_name,
+                                  guardian_phone, halaqa_id, memorization_level),
+                    after=self._adjust_counts({_halaqa_id(halaqa_id): 1}))
+
+    def update(self, student_id, name, age, gender, phone, email, guardian_name,
+               guardian_phone, halaqa_id, memorization_level):
+        row = self._one(self.HALAQA_OF, (student_id,))
+        deltas = {}
+        if row and row['halaqa_id'] != _halaqa_id(halaqa_id):
+            deltas = {row['halaqa_id']: -1, _halaqa_id(halaqa_id): 1}
+        self._write(self.UPDATE, (name, age, gender, phone, email, guardian_name,
+                                  guardian_phone, halaqa_id, memorization_level, student_id),
+                    after=self._adjust_counts(deltas))
+
+
+class HalaqaRepository(Repository):
+    DATA_VERSION = 'halaqat'
+
+    OPTIONS = register_query('halaqat.options', 'SELECT id, name FROM halaqat ORDER BY name')
+    GET = register_query('halaqat.get', 'SELECT * FROM halaqat WHERE id = ?', (1,))
+    NAME = register_query('halaqat.name', 'SELECT name FROM halaqat WHERE id = ?', (1,))
+    # student_count عداد مخزن في الحلقة (adjust_halaqa_student_counts) - بدون ربط بجدول الطلاب
+    WITH_STUDENT_COUNTS = register_query('halaqat.with_student_counts', f'''
+        SELECT h.*, {CAPACITY_UTILIZATION}
+        FROM halaqat h
+        ORDER BY h.name
+    ''')
+    STUDENT_COUNTS = register_query('halaqat.student_counts', f'''
+        SELECT h.id, h.name, h.student_count, h.max_capacity, {CAPACITY_UTILIZATION}
+        FROM halaqat h
+        ORDER BY h.student_count DESC
+    ''')
+    STUDENT_COUNT_ONE = register_query('halaqat.student_count', f'''
+        SELECT h.id, h.name, h.student_count, h.max_capacity, {CAPACITY_UTILIZATION}
+        FROM halaqat h
+        WHERE h.id = ?
+    ''', (1,))
+    FOR_TEACHER = register_query('halaqat.for_teacher', f'''
+        SELECT h.*, {CAPACITY_UTILIZATION}
+        FROM halaqat h
+        WHERE h.teacher_id = ?
+        ORDER BY h.name
+    ''', (1,))
+    TEACHER_STUDENT_TOTAL = register_query('halaqat.teacher_student_total', '''
+        SELECT SUM(student_count) AS value
+        FROM halaqat
+        WHERE teacher_id = ?
+    ''', (1,))
+    # teacher_id من اسم المعلم المكتوب في النموذج (أول معلم بنفس الاسم)
+    INSERT = register_query('halaqat.insert', '''
+        INSERT INTO halaqat (name, type, teacher_name, teacher_id, location, max_capacity,
+                             schedule_days, start_time, end_time)
+        VALUES (?, ?, ?, (SELECT MIN(id) FROM teachers WHERE name = ?), ?, ?, ?, ?, ?)
+    ''')
+    UPDATE = register_query('halaqat.update', '''
+        UPDATE halaqat
+        SET name = ?, type = ?, teacher_name = ?,
+            teacher_id = (SELECT MIN(id) FROM teachers WHERE name = ?), location = ?,
+            max_capacity = ?, schedule_days = ?, start_time = ?, end_time = ?
+        WHERE id = ?
+    ''')
+
+    def options(self):
+        """قائمة (id, name) لحقول الاختيار والفلاتر"""
+        return self._all(self.OPTIONS)
+
+    def get(self, halaqa_id):
+        return self._one(self.GET, (halaqa_id,))
+
+    def name(self, halaqa_id):
+        row = self._one(self.NAME, (halaqa_id,))
+        return row['name'] if row else None
+
+    def with_student_counts(self):
+        return self._all(self.WITH_STUDENT_COUNTS)
+
+    def student_counts(self, halaqa_id=None):
+        """(id, name, student_count) لحلقة واحدة أو لكل الحلقات مرتبة بعدد الطلاب"""
+        if halaqa_id is not None:
+            return self._all(self.STUDENT_COUNT_ONE, (halaqa_id,))
+        return self._all(self.STUDENT_COUNTS)
+
+    def for_teacher(self, teacher_id):
+        return self._all(self.FOR_TEACHER, (teacher_id,))
+
+    def teacher_student_total(self, teacher_id):
+        return self._scalar(self.TEACHER_STUDENT_TOTAL, (teacher_id,))
+
+    def add(self, name, type_val, teacher_name, location, max_capacity,
+            schedule_days, start_time, end_time):
+        teacher_name = (teacher_name or '').strip()
+        self._write(self.INSERT, (name, type_val, teacher_name, teacher_name, location, max_capacity,
+                                  schedule_days, start_time, end_time))
+
+    def update(self, halaqa_id, name, type_val, teacher_name, location, max_capacity,
+               schedule_days, start_time, end_time):
+        teacher_name = (teacher_name or '').strip()
+        self._write(self.UPDATE, (name, type_val, teacher_name, teacher_name, location, max_capacity,
+                                  schedule_days, start_time, end_time, halaqa_id))
+
+
+class TeacherRepository(Repository):
+    DATA_VERSION = 'teachers'
+
+    # صف واحد لكل معلم: حلقاته وعدد طلابها من فهرس halaqat(teacher_id) وعداد student_count
+    PAGE = KeysetQuery(
+        '''SELECT t.*,
+                  (SELECT COUNT(*) FROM halaqat h WHERE h.teacher_id = t.id) AS halaqat_count,
+                  (SELECT COALESCE(SUM(h.student_count), 0)
+                   FROM halaqat h WHERE h.teacher_id = t.id) AS total_students
+           FROM teachers t''',
+        keys=[('t.name', 'name'), ('t.id', 'id')],
+        count_table='teachers',
+        name='teachers.page'
+    )
+
+    OPTIONS = register_query('teachers.options', 'SELECT id, name FROM teachers ORDER BY name')
+    GET = register_query('teachers.get', 'SELECT * FROM teachers WHERE id = ?', (1,))
+    INSERT = register_query('teachers.insert', '''
+        INSERT INTO teachers (name, gender, phone, email, qualification,
+                              specialization, experience_years, salary, notes,
+                              status, hire_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''')
+    UPDATE = register_query('teachers.update', '''
+        UPDATE teachers
+        SET name = ?, gender = ?, phone = ?, email = ?, qualification = ?,
+            specialization = ?, experience_years = ?, salary = ?,
+            notes = ?, status = ?
+        WHERE id = ?
+    ''')
+    # ربط الحلقات المسجلة باسم المعلم قبل إضافته
+    LINK_HALAQAT = register_query('teachers.link_halaqat', '''
+        UPDATE halaqat
+        SET teacher_id = (SELECT MAX(id) FROM teachers WHERE name = ?)
+        WHERE teacher_id IS NULL AND teacher_name = ?
+    ''')
+    # اسم المعلم المعروض في الحلقات يتبع تعديل اسمه
+    RENAME_IN_HALAQAT = register_query('teachers.rename_in_halaqat', '''
+        UPDATE halaqat SET teacher_name = ? WHERE teacher_id = ?
+    ''')
+
+    def options(self):
+        return self._all(self.OPTIONS)
+
+    def get(self, teacher_id):
+        return self._one(self.GET, (teacher_id,))
+
+    def _update_halaqat(self, name, params):
+        """تعديل الحلقات التابع لتعديل المعلم - يتقدم إصدار halaqat أيضاً إذا تغيرت حلقة"""
+        if self._execute(name, params).rowcount:
+            bump_data_version(self.conn, 'halaqat')
+
+    def add(self, name, gender, phone, email, qualification, specialization,
+            experience_years, salary, notes):
+        self._write(self.INSERT, (name, gender, phone, email, qualification, specialization,
+                                  experience_years, salary, notes, 'نشط', date.today().isoformat()),
+                    after=lambda: self._update_halaqat(self.LINK_HALAQAT, (name, (name or '').strip())))
+
+    def update(self, teacher_id, name, gender, phone, email, qualification, specialization,
+               experience_years, salary, notes, status):
+        self._write(self.UPDATE, (name, gender, phone, email, qualification, specialization,
+                                  experience_years, salary, notes, status, teacher_id),
+                    after=lambda: self._update_halaqat(self.RENAME_IN_HALAQAT, (name, teacher_id)))
+
+
+class DonationRepository(Repository):
+    DATA_VERSION = 'donations'
+
+    PAGE = KeysetQuery(
+        f'SELECT d.*, {DONATION_LEGACY_ALIASES} FROM donations d',
+        keys=[('d.created_date', 'created_date'), ('d.id', 'id')],
+        descending=True,
+        count_table='donations',
+        name='donations.page'
+    )
+
+    # created_date صريح (مفتاح ترتيب الصفحات) - لا قيمة افتراضية له في قواعد SQLite القديمة
+    INSERT = register_query('donations.insert', '''
+        INSERT INTO donations (donor_name, amount, donation_date, allocation, notes, created_date)
+        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''')
+
+    def add(self, donor_name, amount, allocation, notes=None):
+        self._write(self.INSERT, (donor_name, amount, date.today().isoformat(), allocation, notes))
+
+
+class CampaignRepository(Repository):
+    PAGE = KeysetQuery(
+        'SELECT * FROM fundraising_campaigns',
+        keys=[('created_date', 'created_date'), ('id', 'id')],
+        descending=True,
+        count_table='fundraising_campaigns',
+        name='campaigns.page'
+    )
+
+    TOTALS = register_query('campaigns.totals', '''
+        SELECT SUM(CASE WHEN status = ? THEN 1 ELSE 0 END) AS active,
+               SUM(CASE WHEN status <> ? THEN target_amount ELSE 0 END) AS target,
+               SUM(current_amount) AS collected
+        FROM fundraising_campaigns
+    ''', ('نشط', 'مكتمل'))
+    # created_date صريح كما في التبرعات: مفتاح ترتيب الصفحات يجب ألا يكون NULL
+    INSERT = register_query('campaigns.insert', '''
+        INSERT INTO fundraising_campaigns
+        (campaign_name, platform, target_amount, target_audience,
+         campaign_description, campaign_hashtags, start_date, end_date,
+         ai_suggestions, best_posting_times, created_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''')
+
+    def totals(self):
+        """عدد الحملات النشطة والمبلغ المستهدف للحملات غير المكتملة والمبلغ المجموع"""
+        row = self._one(self.TOTALS, ('نشط', 'مكتمل'))
+        return {key: (row and row[key]) or 0 for key in ('active', 'target', 'collected')}
+
+    def add(self, campaign_name, platform, target_amount, target_audience,
+            campaign_description, campaign_hashtags, start_date, end_date,
+            ai_suggestions, best_posting_times):
+        self._write(self.INSERT, (campaign_name, platform, target_amount, target_audience,
+                                  campaign_description, campaign_hashtags, start_date, end_date,
+                                  ai_suggestions, best_posting_times))
+
+
+class AttendanceRepository(Repository):
+    FOR_DATE = register_query('attendance.for_date', '''
+        SELECT student_id, status, notes
+        FROM attendance
+        WHERE attendance_date = ?
+    ''', ('2024-01-01',))
+
+    def for_date(self, attendance_date):
+        """{student_id: {'status', 'notes'}} ليوم واحد"""
+        rows = self._all(self.FOR_DATE, (attendance_date,))
+        return {row['student_id']: {'status': row['status'], 'notes': row['notes']} for row in rows}
+
+    def mark(self, attendance_date, records, halaqa_id=None):
+        return bulk_upsert_attendance(self.conn, attendance_date, records, halaqa_id=halaqa_id)
+
+
+class JobRepository(Repository):
+    ACTIVE_BY_KEY = register_query('report_jobs.active_by_key', '''
+        SELECT * FROM report_jobs
+        WHERE params_key = ? AND status IN ('queued', 'running')
+    ''', ('',))
+    GET = register_query('report_jobs.get', 'SELECT * FROM report_jobs WHERE id = ?', ('',))
+    INSERT = register_query('report_jobs.insert', '''
+        INSERT INTO report_jobs (id, kind, params_key, params, status, created_date, updated_date)
+        VALUES (?, ?, ?, ?, 'queued', ?, ?)
+    ''')
+    START = register_query('report_jobs.start', '''
+        UPDATE report_jobs SET status = 'running', updated_date = ? WHERE id = ?
+    ''')
+    PROGRESS = register_query('report_jobs.progress', '''
+        UPDATE report_jobs SET progress = ?, updated_date = ? WHERE id = ?
+    ''')
+    FINISH = register_query('report_jobs.finish', '''
+        UPDATE report_jobs
+        SET status = 'done', progress = 100, result_path = ?, content_type = ?, filename = ?,
+            updated_date = ?, finished_date = ?
+        WHERE id = ?
+    ''')
+    FAIL = register_query('report_jobs.fail', '''
+        UPDATE report_jobs
+        SET status = 'failed', error = ?, updated_date = ?, finished_date = ?
+        WHERE id = ?
+    ''')
+
+    # نتائج المهام المكتملة قبل حد الاحتفاظ - تُحذف ملفاتها ثم تُعلَّم المهام expired
+    EXPIRED_RESULTS = register_query('report_jobs.expired_results', '''
+        SELECT id, result_path FROM report_jobs WHERE status = 'done' AND finished_date < ?
+    ''', ('2000-01-01 00:00:00',))
+    EXPIRE = register_query('report_jobs.expire', '''
+        UPDATE report_jobs SET status = 'expired', result_path = NULL, updated_date = ?
+        WHERE status = 'done' AND finished_date < ?
+    ''')
+
+    def active(self, params_key):
+        """المهمة المنتظرة أو الجارية لنفس الطلب إن وُجدت"""
+        return self._one(self.ACTIVE_BY_KEY, (params_key,))
+
+    def get(self, job_id):
+        return self._one(self.GET, (job_id,))
+
+    def add(self, job_id, kind, params_key, params, now):
+        self._write(self.INSERT, (job_id, kind, params_key, params, now, now))
+
+    def start(self, job_id, now):
+        self._write(self.START, (now, job_id))
+
+    def progress(self, job_id, progress, now):
+        self._write(self.PROGRESS, (progress, now, job_id))
+
+    def finish(self, job_id, result_path, content_type, filename, now):
+        self._write(self.FINISH, (result_path, content_type, filename, now, now, job_id))
+
+    def fail(self, job_id, error, now):
+        self._write(self.FAIL, (error, now, now, job_id))
+
+    def expired_results(self, cutoff):
+        return self._all(self.EXPIRED_RESULTS, (cutoff,))
+
+    def expire(self, cutoff, now):
+        self._write(self.EXPIRE, (now, cutoff))
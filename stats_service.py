@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+خدمة الإحصائيات المشتركة - العدادات الرئيسية والتوزيعات لكل جدول باستعلام واحد مع ذاكرة مؤقتة
+
+كل نتيجة مخزنة تُربط بإصدارات data_versions للجداول التي تقرأها، فالكتابة في أي
+عملية gunicorn تُلغيها في كل العمليات (مثل ذاكرة التقارير في report_builder).
+"""
+
+import os
+import threading
+import time
+
+from database_helper import execute_named, get_db_connection, register_query
+
+# مدة صلاحية الإحصائيات المخزنة بالثواني
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 60))
+
+# جميع العدادات الرئيسية في رحلة واحدة لقاعدة البيانات
+HEADLINE_STATS_SQL = '''
+    SELECT
+        (SELECT COUNT(*) FROM students) AS total_students,
+        (SELECT COUNT(*) FROM halaqat) AS total_halaqat,
+        (SELECT COUNT(*) FROM teachers) AS total_teachers,
+        (SELECT COALESCE(SUM(amount), 0) FROM donations) AS total_donations
+'''
+
+HEADLINE_STATS_KEYS = ('total_students', 'total_halaqat', 'total_teachers', 'total_donations')
+HEADLINE_STATS_TABLES = ('students', 'halaqat', 'teachers', 'donations')
+
+register_query('stats.headline', HEADLINE_STATS_SQL)
+
+
+def count_if(column, value):
+    """عدد الصفوف التي يساوي فيها العمود القيمة (تجميع شرطي داخل نفس المسح)"""
+    return f'SUM(CASE WHEN {column} = ? THEN 1 ELSE 0 END)', (value,)
+
+
+# توزيعات كل جدول: المفتاح -> (تعبير تجميعي، معاملاته) - كلها تُحسب بمسح واحد للجدول
+BREAKDOWNS = {
+    'students': {
+        'total': ('COUNT(*)', ()),
+        'male': count_if('gender', 'ذكر'),
+        'female': count_if('gender', 'أنثى'),
+    },
+    'teachers': {
+        'total': ('COUNT(*)', ()),
+        'active': count_if('status', 'نشط'),
+        'male': count_if('gender', 'ذكر'),
+        'female': count_if('gender', 'أنثى'),
+    },
+    'donations': {
+        'total': ('COALESCE(SUM(amount), 0)', ()),
+        'count': ('COUNT(*)', ()),
+    },
+}
+
+
+def _breakdown_query(table):
+    """(اسم الاستعلام المسجل، المعاملات) لتوزيع جدول"""
+    measures = BREAKDOWNS[table]
+    select = ', '.join(f'{expression} AS {key}' for key, (expression, _) in measures.items())
+    params = tuple(param for _, params in measures.values() for param in params)
+    return register_query(f'stats.breakdown.{table}', f'SELECT {select} FROM {table}', params), params
+
+
+_BREAKDOWN_QUERIES = {table: _breakdown_query(table) for table in BREAKDOWNS}
+
+_cache_lock = threading.Lock()
+# المفتاح ('headline' أو اسم الجدول) -> (الإحصائيات، وقت الحساب، إصدارات الجداول عند الحساب)
+_cache = {}
+# يزداد مع كل إلغاء حتى لا تُخزَّن نتيجة حُسبت قبل التعديل
+_generation = 0
+
+
+def _query_headline_stats(conn):
+    """حساب العدادات الرئيسية من قاعدة البيانات"""
+    row = execute_named(conn, 'stats.headline').fetchone()
+    if not row:
+        return {key: 0 for key in HEADLINE_STATS_KEYS}
+    return {key: row[key] or 0 for key in HEADLINE_STATS_KEYS}
+
+
+def _query_breakdown(conn, table):
+    name, params = _BREAKDOWN_QUERIES[table]
+    row = execute_named(conn, name, params).fetchone()
+    return {key: (row and row[key]) or 0 for key in BREAKDOWNS[table]}
+
+
+def _table_versions(conn, tables):
+    """إصدارات data_versions للجداول المطلوبة (تتقدم مع كل كتابة في أي عملية)"""
+    versions = {row['name']: row['version'] for row in execute_named(conn, 'data_versions.all').fetchall()}
+    return tuple(versions.get(table) for table in tables)
+
+
+def _cached(key, tables, compute, conn, fresh):
+    """نتيجة compute(conn) من الذاكرة المؤقتة ما لم تتغير الجداول tables أو تنتهِ الصلاحية
+
+    الإصدارات تُقرأ قبل الحساب، فالنتيجة لا تكون أقدم من الإصدار المخزن معها.
+    """
+    owns_connection = conn is None
+    if owns_connection:
+        conn = get_db_connection()
+    try:
+        versions = _table_versions(conn, tables)
+        with _cache_lock:
+            entry = _cache.get(key)
+            if (not fresh and entry is not None and entry[2] == versions
+                    and time.monotonic() - entry[1] < STATS_CACHE_TTL):
+                return dict(entry[0])
+            generation = _generation
+        stats = compute(conn)
+    finally:
+        if owns_connection:
+            conn.close()
+
+    with _cache_lock:
+        if generation == _generation:
+            _cache[key] = (stats, time.monotonic(), versions)
+    return dict(stats)
+
+
+def get_headline_stats(conn=None, fresh=False):
+    """العدادات الرئيسية (الطلاب، الحلقات، المعلمين، التبرعات) من الذاكرة المؤقتة
+
+    تُحسب من قاعدة البيانات فقط عند انتهاء الصلاحية أو تعديل أحد الجداول الأربعة،
+    أو دائماً مع fresh=True (لنتائج تُخزن طويلاً مثل ذاكرة التقارير).
+    """
+    return _cached('headline', HEADLINE_STATS_TABLES, _query_headline_stats, conn, fresh)
+
+
+def get_breakdown(table, conn=None, fresh=False):
+    """توزيع جدول من BREAKDOWNS (مثل الإجمالي والنشطين والذكور والإناث) بنفس ذاكرة العدادات الرئيسية"""
+    if table not in BREAKDOWNS:
+        raise ValueError(f'لا يوجد توزيع للجدول: {table}')
+    return _cached(table, (table,), lambda c: _query_breakdown(c, table), conn, fresh)
+
+
+def invalidate_stats():
+    """إلغاء الإحصائيات المخزنة في هذه العملية فوراً بعد أي تعديل (العمليات الأخرى
+    تلاحظ التعديل من data_versions)"""
+    global _generation
+    with _cache_lock:
+        _cache.clear()
+        _generation += 1
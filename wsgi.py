@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+نقطة دخول WSGI للإنتاج
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app_simple import prepare_app
+
+app = prepare_app()